@@ -0,0 +1,99 @@
+"""
+Measure write latency while the database is being backed up.
+
+A writer thread commits one action at a time, on its own connection,
+while the main thread runs backup() with different batch sizes. The
+script reports the writers' p50/p99/max commit latency for each run,
+and the database size and fragmentation before and after compact().
+
+Run from the repository root:
+
+    $ python benchmarks/backup_latency.py --actions 200000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from timeblock import maintenance, sql  # noqa: E402
+from timeblock.action import Action  # noqa: E402
+
+
+def percentile(values: list[float], share: float) -> float:
+    """Return value below which share of values fall, in milliseconds."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))] * 1000
+
+
+def run(filename: str, target: str, pages: int, pause: float) -> dict:
+    """Back up filename while writing to it and return latencies."""
+    stop = threading.Event()
+    latencies: list[float] = []
+
+    def write():
+        with sql.TimeblockDB(filename) as database:
+            i = 0
+            while not stop.is_set():
+                start = time.perf_counter()
+                database.add_action(Action(f"write {pages} {i}"))
+                latencies.append(time.perf_counter() - start)
+                i += 1
+                time.sleep(0.002)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    time.sleep(0.2)
+    if pages:
+        report = maintenance.backup(filename, target, pages=pages, pause=pause)
+    else:
+        time.sleep(1)
+        report = {"seconds": 1.0, "batches": 0}
+    stop.set()
+    writer.join()
+    return {
+        "pages_per_batch": pages,
+        "backup_seconds": round(report["seconds"], 3),
+        "batches": report["batches"],
+        "restarts": report.get("restarts", 0),
+        "writes": len(latencies),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+    }
+
+
+def main() -> None:
+    """Run the benchmark and print the results as JSON."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--actions", type=int, default=200_000)
+    args = parser.parse_args()
+    results: dict = {"runs": []}
+    with tempfile.TemporaryDirectory() as tmp, redirect_stdout(StringIO()):
+        filename = os.path.join(tmp, "db.sql")
+        with sql.TimeblockDB(filename) as database:
+            database.add_actions(
+                Action(f"action {i} " + "x" * 200) for i in range(args.actions)
+            )
+        target = os.path.join(tmp, "copy.sql")
+        for pages in (0, -1, 1024, 64):
+            results["runs"].append(run(filename, target, pages, 0.005))
+        with sql.TimeblockDB(filename) as database:
+            database.write_query(
+                "DELETE FROM action WHERE id % 3 = 0 OR id > ?",
+                (args.actions // 2,),
+            )
+        results["compact"] = maintenance.compact(filename)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
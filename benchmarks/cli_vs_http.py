@@ -0,0 +1,141 @@
+"""
+Benchmark the command line interface against the HTTP path.
+
+Compares, on fresh databases:
+    - startup: wall time of 'python -m timeblock list' against starting
+      the web server and answering its first GET request.
+    - throughput: adding N actions with one 'add -' invocation against
+      N form POSTs to a running server.
+
+Run from the repository root:
+
+    $ python benchmarks/cli_vs_http.py --actions 2000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from contextlib import redirect_stdout
+from io import StringIO
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from timeblock import create_app  # noqa: E402  pylint: disable=C0413
+
+
+def cli_startup(database: str) -> float:
+    """Return seconds taken by 'timeblock list' on database."""
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "timeblock", "list", "--db", database],
+        check=True,
+        capture_output=True,
+    )
+    return time.perf_counter() - start
+
+
+def http_startup(database: str) -> float:
+    """Return seconds from starting server to first response."""
+    code = (
+        "import sys\n"
+        "from timeblock import create_app\n"
+        "create_app({'DATABASE': sys.argv[1]}).run(port=5055)\n"
+    )
+    start = time.perf_counter()
+    with subprocess.Popen(
+        [sys.executable, "-c", code, database],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    ) as proc:
+        try:
+            while True:
+                try:
+                    with urllib.request.urlopen(
+                        "http://127.0.0.1:5055/", timeout=1
+                    ):
+                        return time.perf_counter() - start
+                except OSError:
+                    time.sleep(0.005)
+        finally:
+            proc.terminate()
+
+
+def cli_add(database: str, count: int) -> float:
+    """Return seconds taken to add count actions with one 'add -'."""
+    lines = "".join(f"cli action {i}\t25\n" for i in range(count))
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "timeblock", "add", "-", "--db", database],
+        input=lines,
+        text=True,
+        check=True,
+        capture_output=True,
+    )
+    return time.perf_counter() - start
+
+
+class QuietHandler(WSGIRequestHandler):
+    """Request handler that doesn't log every request."""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def http_add(database: str, count: int) -> float:
+    """Return seconds taken to POST count actions to a running server."""
+    app = create_app({"DATABASE": database})
+    server = make_server(
+        "127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+
+    class NoRedirect(urllib.request.HTTPRedirectHandler):
+        """Count the POST itself, not the page it redirects to."""
+
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    opener = urllib.request.build_opener(NoRedirect)
+    start = time.perf_counter()
+    with redirect_stdout(StringIO()):
+        for i in range(count):
+            data = urllib.parse.urlencode({"action": f"http action {i}"})
+            try:
+                opener.open(url, data.encode(), timeout=5).close()
+            except urllib.error.HTTPError as error:
+                if error.code != 302:
+                    raise
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    return elapsed
+
+
+def main() -> None:
+    """Run the benchmarks and print the results as JSON."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--actions", type=int, default=1000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {
+            "cli_startup_s": cli_startup(os.path.join(tmp, "a.sql")),
+            "http_startup_s": http_startup(os.path.join(tmp, "b.sql")),
+            "cli_add_s": cli_add(os.path.join(tmp, "c.sql"), args.actions),
+            "http_add_s": http_add(os.path.join(tmp, "d.sql"), args.actions),
+        }
+    results["cli_add_per_s"] = args.actions / results["cli_add_s"]
+    results["http_add_per_s"] = args.actions / results["http_add_s"]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
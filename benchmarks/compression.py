@@ -0,0 +1,86 @@
+"""
+Measure bandwidth and latency of the main page with compression.
+
+Fills a database with --actions actions, serves it in-process and
+requests 'GET /' --repeat times for each encoding, reporting bytes on
+the wire, time to first byte and total time, plus the time the body
+would take to transfer over a few link speeds.
+
+Run from the repository root:
+
+    $ python benchmarks/compression.py --actions 10000
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from timeblock import compress, loadtest, sql  # noqa: E402
+from timeblock.action import Action  # noqa: E402
+
+LINKS_MBIT = [1, 10, 100]
+
+
+def fetch(url: str, encoding: str) -> tuple[int, float, float]:
+    """Return bytes received, time to first byte and total time."""
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port)
+    started = time.perf_counter()
+    headers = {"Accept-Encoding": encoding} if encoding else {}
+    connection.request("GET", "/", headers=headers)
+    response = connection.getresponse()
+    first = response.read(1)
+    first_byte = time.perf_counter() - started
+    received = len(first) + len(response.read())
+    total = time.perf_counter() - started
+    connection.close()
+    return received, first_byte, total
+
+
+def main() -> None:
+    """Run the benchmark and print the results as JSON."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--actions", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    results: dict = {"actions": args.actions, "brotli": bool(compress.brotli)}
+    encodings = ["", "gzip"] + (["br"] if compress.brotli else [])
+    with tempfile.TemporaryDirectory() as tmp, redirect_stdout(StringIO()):
+        filename = os.path.join(tmp, "db.sql")
+        with sql.TimeblockDB(filename) as database:
+            database.add_actions(
+                Action(f"action {i}: plan the next block")
+                for i in range(args.actions)
+            )
+        with loadtest.serve(filename) as url:
+            for encoding in encodings:
+                runs = [fetch(url, encoding) for _ in range(args.repeat)]
+                size = runs[0][0]
+                results[encoding or "identity"] = {
+                    "bytes": size,
+                    "first_byte_ms": round(
+                        statistics.median(r[1] for r in runs) * 1000, 2
+                    ),
+                    "total_ms": round(
+                        statistics.median(r[2] for r in runs) * 1000, 2
+                    ),
+                    "transfer_ms": {
+                        f"{mbit}mbit": round(size * 8 / (mbit * 1000), 1)
+                        for mbit in LINKS_MBIT
+                    },
+                }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Measure incremental ordering of dependencies against recomputing it.
+
+Builds a random acyclic graph of --actions nodes and --edges edges,
+added in random order so most insertions have to reorder nodes, then
+reports:
+    - add_edge() per insert, keeping the order incrementally
+    - load() of the whole graph, what every insert costs when the order
+      is recomputed from scratch
+    - add_edge() refusing edges that would close a cycle
+    - order() and critical_path() over every node
+    - add_dependency() and plan() on a database of --actions actions
+
+Run from the repository root:
+
+    $ python benchmarks/dependency_graph.py --actions 100000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from io import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from timeblock import sql  # noqa: E402
+from timeblock.action import Action  # noqa: E402
+from timeblock.graph import CycleError, DependencyGraph  # noqa: E402
+
+
+def timed(func) -> tuple[float, object]:
+    """Return seconds taken by func() and its result."""
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def random_edges(nodes: int, edges: int, seed: int) -> list[tuple[int, int]]:
+    """Return random edges that agree with a hidden random order."""
+    rng = random.Random(seed)
+    rank = list(range(nodes))
+    rng.shuffle(rank)
+    chosen: set[tuple[int, int]] = set()
+    while len(chosen) < edges:
+        first, second = rng.sample(range(nodes), 2)
+        if rank[first] > rank[second]:
+            first, second = second, first
+        # mostly short edges, like steps of a project
+        if abs(rank[first] - rank[second]) < 50 or rng.random() < 0.01:
+            chosen.add((first + 1, second + 1))
+    ordered = list(chosen)
+    rng.shuffle(ordered)
+    return ordered
+
+
+def micro(seconds: list[float]) -> dict:
+    """Return mean, p99 and max of seconds in microseconds."""
+    ordered = sorted(seconds)
+    return {
+        "mean_us": round(statistics.mean(ordered) * 1e6, 1),
+        "p99_us": round(ordered[int(len(ordered) * 0.99)] * 1e6, 1),
+        "max_us": round(ordered[-1] * 1e6, 1),
+    }
+
+
+def main() -> None:
+    """Run the benchmark and print the results as JSON."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--actions", type=int, default=100_000)
+    parser.add_argument("--edges", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    edges = random_edges(args.actions, args.edges, args.seed)
+    results: dict = {"actions": args.actions, "edges": len(edges)}
+
+    graph = DependencyGraph()
+    for node in range(1, args.actions + 1):
+        graph.add_node(node)
+    inserts = []
+    for before, after in edges:
+        seconds, _ = timed(lambda b=before, a=after: graph.add_edge(b, a))
+        inserts.append(seconds)
+    results["incremental_insert"] = micro(inserts)
+    results["incremental_total_s"] = round(sum(inserts), 3)
+
+    seconds, _ = timed(lambda: DependencyGraph(edges))
+    results["recompute_per_insert_us"] = round(seconds * 1e6, 1)
+    results["speedup"] = round(seconds / statistics.mean(inserts), 1)
+
+    cycles = []
+    for before, after in random.Random(args.seed).sample(edges, 1000):
+        start = time.perf_counter()
+        try:
+            graph.add_edge(after, before)
+        except CycleError:
+            cycles.append(time.perf_counter() - start)
+    results["cycle_refused"] = micro(cycles)
+
+    nodes = range(1, args.actions + 1)
+    durations = {node: 60 * (node % 7 + 1) for node in nodes}
+    seconds, _ = timed(lambda: graph.order(nodes))
+    results["order_s"] = round(seconds, 3)
+    seconds, (total, path) = timed(lambda: graph.critical_path(durations))
+    results["critical_path_s"] = round(seconds, 3)
+    results["critical_path_length"] = len(path)
+    results["critical_path_minutes"] = total / 60
+
+    with tempfile.TemporaryDirectory() as tmp, redirect_stdout(StringIO()):
+        with sql.TimeblockDB(os.path.join(tmp, "db.sql")) as database:
+            database.add_actions(
+                Action(f"action {i}", est_duration=timedelta(minutes=i % 7))
+                for i in range(args.actions)
+            )
+            with database.transaction():
+                database.write_query(
+                    "INSERT INTO action_dependency VALUES (?, ?)",
+                    [(after, before) for before, after in edges[:-1000]],
+                )
+            seconds, _ = timed(database.dependency_graph)
+            results["db_load_graph_s"] = round(seconds, 3)
+            added = []
+            for before, after in edges[-1000:]:
+                seconds, _ = timed(
+                    lambda b=before, a=after: database.add_dependency(a, b)
+                )
+                added.append(seconds)
+            results["db_add_dependency"] = micro(added)
+            seconds, _ = timed(database.critical_path)
+            results["db_critical_path_s"] = round(seconds, 3)
+            seconds, scheduled = timed(
+                lambda: database.plan(datetime(2023, 1, 16, 9))
+            )
+            results["db_plan_s"] = round(seconds, 3)
+            results["db_planned"] = len(scheduled)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Measure the overhead of the rate limiter on the write path.
+
+Reports, in microseconds:
+    - RateLimiter.take() for one client, and cycling through --clients
+      clients so every call moves a different bucket
+    - take() with --threads threads calling it at once
+    - admit() and release() of a free write slot
+    - a POST through the Flask app to a view that does nothing, with
+      and without the limiter, so the difference is the cost of the
+      request hooks
+    - a POST / adding an action, for scale
+
+Run from the repository root:
+
+    $ python benchmarks/ratelimit.py --calls 200000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from timeblock import create_app  # noqa: E402
+from timeblock.ratelimit import RateLimiter  # noqa: E402
+
+
+def per_call(func, calls: int) -> float:
+    """Return microseconds per call of func(i) for i in range(calls)."""
+    start = time.perf_counter()
+    for i in range(calls):
+        func(i)
+    return round((time.perf_counter() - start) / calls * 1e6, 3)
+
+
+def threaded(func, calls: int, threads: int) -> float:
+    """Return microseconds per call with calls split between threads."""
+    each = calls // threads
+    workers = [
+        threading.Thread(target=per_call, args=(func, each))
+        for _ in range(threads)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return round((time.perf_counter() - start) / (each * threads) * 1e6, 3)
+
+
+def request_us(client, path: str, requests: int, data=None) -> float:
+    """Return median microseconds of POST requests to path."""
+    seconds = []
+    for i in range(requests):
+        start = time.perf_counter()
+        client.post(path, data=data(i) if data else None)
+        seconds.append(time.perf_counter() - start)
+    return round(statistics.median(seconds) * 1e6, 1)
+
+
+def main() -> None:
+    """Run the benchmark and print the results as JSON."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200_000)
+    parser.add_argument("--clients", type=int, default=10_000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=2_000)
+    args = parser.parse_args()
+    huge = float(args.calls * 10)
+    results: dict = {"calls": args.calls}
+
+    limiter = RateLimiter(rate=huge, burst=args.calls)
+    results["take_one_client_us"] = per_call(
+        lambda i: limiter.take("client"), args.calls
+    )
+    names = [f"10.0.{i // 256}.{i % 256}" for i in range(args.clients)]
+    results["take_many_clients_us"] = per_call(
+        lambda i: limiter.take(names[i % args.clients]), args.calls
+    )
+    results["take_threaded_us"] = threaded(
+        lambda i: limiter.take(names[i % args.clients]),
+        args.calls,
+        args.threads,
+    )
+    slots = RateLimiter(concurrency=args.threads)
+    results["admit_release_us"] = per_call(
+        lambda i: (slots.admit(), slots.release()), args.calls
+    )
+
+    with tempfile.TemporaryDirectory() as tmp, redirect_stdout(StringIO()):
+        for name, config in [
+            ("unlimited", {}),
+            (
+                "limited",
+                {
+                    "RATE_LIMIT": huge,
+                    "RATE_LIMIT_BURST": args.calls,
+                    "WRITE_CONCURRENCY": args.threads,
+                },
+            ),
+        ]:
+            app = create_app(
+                {"DATABASE": os.path.join(tmp, f"{name}.sql"), **config}
+            )
+            app.add_url_rule("/noop", "noop", lambda: "", methods=["POST"])
+            client = app.test_client()
+            results[f"post_noop_{name}_us"] = request_us(
+                client, "/noop", args.requests
+            )
+            results[f"post_action_{name}_us"] = request_us(
+                client,
+                "/",
+                args.requests // 4,
+                lambda i: {"action": f"action {i}"},
+            )
+    results["hook_overhead_us"] = round(
+        results["post_noop_limited_us"] - results["post_noop_unlimited_us"], 1
+    )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Measure how long it takes to bring the action projection up to date.
+
+The script logs --events changes to --actions actions, checkpointing
+once --tail events from the end, then times:
+    - catch_up() on an up to date projection, as done on every startup
+    - rebuild_projection() from the checkpoint, replaying the tail
+    - rebuild_projection() with no checkpoint, replaying every event
+
+Run from the repository root:
+
+    $ python benchmarks/replay.py --events 1000000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import timedelta
+from io import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from timeblock import sql  # noqa: E402
+from timeblock.action import Action  # noqa: E402
+
+
+def timed(func) -> tuple[float, int]:
+    """Return seconds taken by func() and its result."""
+    start = time.perf_counter()
+    result = func()
+    return round(time.perf_counter() - start, 3), result
+
+
+def main() -> None:
+    """Run the benchmark and print the results as JSON."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--actions", type=int, default=10_000)
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--tail", type=int, default=10_000)
+    args = parser.parse_args()
+    results: dict = vars(args).copy()
+    with tempfile.TemporaryDirectory() as tmp, redirect_stdout(StringIO()):
+        filename = os.path.join(tmp, "db.sql")
+        with sql.TimeblockDB(filename) as database:
+            start = time.perf_counter()
+            with database.transaction():
+                database.add_actions(
+                    Action(f"action {i}") for i in range(args.actions)
+                )
+                for i in range(args.events - args.actions):
+                    if i == args.events - args.actions - args.tail:
+                        database.checkpoint()
+                    database.update_action(
+                        i % args.actions + 1,
+                        est_duration=timedelta(minutes=i % 90),
+                    )
+            results["log_seconds"] = round(time.perf_counter() - start, 3)
+            results["startup_catch_up"] = timed(database.catch_up)
+            results["rebuild_from_checkpoint"] = timed(
+                database.rebuild_projection
+            )
+            database.write_query("DELETE FROM action_checkpoint")
+            results["rebuild_full_replay"] = timed(database.rebuild_projection)
+        results["file_bytes"] = os.path.getsize(filename)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
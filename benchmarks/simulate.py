@@ -0,0 +1,71 @@
+"""
+Measure how schedule simulation scales with worker processes.
+
+Scores --candidates schedules of --actions actions, with a dependency
+between every third pair and eight working hours a day, in this process
+and then on pools of 1, 2, 4, ... workers up to the number of CPUs.
+Pools are started before timing, as the web server keeps its pool
+between requests. Reports seconds, candidates a second, the speedup
+over one worker and the bytes pickled for each chunk of work.
+
+Run from the repository root:
+
+    $ python benchmarks/simulate.py --actions 200 --candidates 20000
+"""
+import argparse
+import json
+import os
+import pickle
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from timeblock.simulate import Problem, Simulator  # noqa: E402
+
+
+def main() -> None:
+    """Run the benchmark and print the results as JSON."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--actions", type=int, default=200)
+    parser.add_argument("--candidates", type=int, default=20_000)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    rng = random.Random(0)
+    ids = list(range(1, args.actions + 1))
+    problem = Problem(
+        ids,
+        [rng.randint(1, 12) * 900 for _ in ids],
+        [(i, i + 1) for i in ids[:-1:3]],
+        deadlines=[rng.choice([None, rng.randint(1, 40) * 3600]) for _ in ids],
+        hours_per_day=8,
+    )
+    results: dict = {
+        "actions": args.actions,
+        "candidates": args.candidates,
+        "cpus": os.cpu_count(),
+        "chunk_payload_bytes": len(pickle.dumps(problem)),
+        "runs": {},
+    }
+    counts = [0] + [
+        2**i for i in range(8) if 2**i <= max(1, args.max_workers or 1)
+    ]
+    for workers in counts:
+        with Simulator(workers) as simulator:
+            simulator.run(problem, candidates=workers * 4 or 1)  # warm up
+            result = simulator.run(problem, candidates=args.candidates)
+        results["runs"][workers or "in_process"] = {
+            "seconds": result["seconds"],
+            "candidates_per_s": round(args.candidates / result["seconds"]),
+            "best_score": result["schedules"][0]["score"],
+        }
+    single = results["runs"].get(1)
+    if single:
+        for run in results["runs"].values():
+            run["speedup"] = round(single["seconds"] / run["seconds"], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
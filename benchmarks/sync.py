@@ -0,0 +1,116 @@
+"""
+Measure how the cost of a sync depends on what changed, not on size.
+
+For each database size in --sizes, fills a server with that many
+actions, brings a client up to date, then edits --changes actions on
+the server and reports:
+    - changes_since() of the edits, and the size of the JSON response
+    - a sync() of the client pulling the edits through the Flask app
+    - the same, pushing --changes edits made on the client
+    - a sync() when nothing changed
+    - a full first sync, for comparison
+
+Run from the repository root:
+
+    $ python benchmarks/sync.py --sizes 1000 100000 --changes 100
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from timeblock import create_app  # noqa: E402
+from timeblock.action import Action  # noqa: E402
+from timeblock.sql import TimeblockDB  # noqa: E402
+from timeblock.sync import sync  # noqa: E402
+
+
+def timed(func) -> tuple[float, object]:
+    """Return milliseconds taken by func() and its result."""
+    start = time.perf_counter()
+    result = func()
+    return round((time.perf_counter() - start) * 1000, 2), result
+
+
+def edit(filename: str, count: int, prefix: str) -> None:
+    """Rename the first count actions of the database."""
+    with TimeblockDB(filename) as database, database.transaction():
+        for action_id in range(1, count + 1):
+            database.update_action(action_id, desc=f"{prefix} {action_id}")
+
+
+def measure(tmp: str, size: int, changes: int) -> dict:
+    """Return timings for one database size."""
+    server = os.path.join(tmp, f"server-{size}.sql")
+    client = os.path.join(tmp, f"client-{size}.sql")
+    app = create_app({"DATABASE": server, "SYNC_TOKEN": "bench"})
+    peer = app.test_client()
+    sent = []
+
+    def post(_url: str, payload: dict) -> dict:
+        response = peer.post(
+            "/sync", json=payload, headers={"Authorization": "Bearer bench"}
+        )
+        sent.append(len(json.dumps(payload)) + len(response.data))
+        return response.get_json()
+
+    with TimeblockDB(server) as database:
+        database.add_actions(Action(f"action {i}") for i in range(size))
+    results: dict = {"size": size}
+    with TimeblockDB(client) as database:
+        results["first_sync_ms"], _ = timed(
+            lambda: sync(database, "server", post=post)
+        )
+    results["first_sync_bytes"] = sum(sent)
+
+    edit(server, changes, "server")
+    with TimeblockDB(server) as database:
+        (latest,) = database.read_query("SELECT MAX(seq) FROM action_event")
+        results["changes_since_ms"], _ = timed(
+            lambda: database.changes_since(latest[0] - changes, changes)
+        )
+    sent.clear()
+    with TimeblockDB(client) as database:
+        results["pull_ms"], report = timed(
+            lambda: sync(database, "server", post=post)
+        )
+    results["pull_bytes"] = sum(sent)
+    assert report["applied"] == changes, report
+
+    edit(client, changes, "client")
+    sent.clear()
+    with TimeblockDB(client) as database:
+        results["push_ms"], report = timed(
+            lambda: sync(database, "server", post=post)
+        )
+        results["push_bytes"] = sum(sent)
+        assert report["pushed"] == changes, report
+        results["idle_ms"], report = timed(
+            lambda: sync(database, "server", post=post)
+        )
+    assert report["pushed"] == report["pulled"] == 0, report
+    return results
+
+
+def main() -> None:
+    """Run the benchmark and print the results as JSON."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 100_000]
+    )
+    parser.add_argument("--changes", type=int, default=100)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp, redirect_stdout(StringIO()):
+        results = [measure(tmp, size, args.changes) for size in args.sizes]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,6 @@ This module contains the following fixtures:
     - driver: A Selenium web driver.
 """
 import subprocess
-import time
 import os
 from typing import Generator
 from signal import SIGINT
@@ -17,8 +16,9 @@ from signal import SIGINT
 from pytest import fixture
 from selenium import webdriver
 
-from constants import TEST_DB_PATH, CHROME_PATH
+from constants import TEST_DB_PATH, CHROME_PATH, URL
 from timeblock import sql
+from timeblock.loadtest import wait_until_ready
 from timeblock.action import Action
 
 
@@ -29,10 +29,11 @@ def app() -> Generator[None, None, None]:
 
     This fixture runs the application and Flask server for the duration
     of the test. The application is run in a subprocess which
-    is terminated after test is complete.
+    is terminated after test is complete. Requests are only made once
+    the server answers a readiness probe.
     """
     with subprocess.Popen(["python", "-m", "timeblock", TEST_DB_PATH]) as proc:
-        time.sleep(9)  # prevents requests before server runs
+        wait_until_ready(URL)
         yield
         proc.send_signal(SIGINT)
     # if test_db_path exists, delete it
@@ -11,13 +11,21 @@ This module is using fixtures from the conftest.py module:
 
 The tests cover the following:
     - POST requests add an action to the database.
+    - create_app() builds an app that serves the configured database.
+    - The timer is started, switched and stopped over HTTP.
+    - Non-web modules import without Flask, within a time budget.
 """
 
+import subprocess
+import sys
+
 import requests
 import pytest
 
-from constants import URL
-from timeblock import sql
+from constants import TEST_DB_PATH, URL
+from timeblock import create_app, sql
+
+IMPORT_BUDGET_US = 100_000  # cumulative import time of a non-web module
 
 
 @pytest.mark.usefixtures("app")
@@ -33,6 +41,91 @@ def test_post_request(tb_db: sql.TimeblockDB) -> None:
     """
     requests.post(URL, data={"action": "go to sleep"}, timeout=1)
     with tb_db:
-        assert tb_db.read_query("SELECT * FROM action") == [
-            (1, "go to sleep", None, None, None)
+        assert tb_db.read_query(
+            """
+            SELECT id, desc, est_duration, actual_duration, start_datetime
+            FROM action
+            """
+        ) == [(1, "go to sleep", None, None, None)]
+
+
+def test_create_app(tb_db: sql.TimeblockDB) -> None:
+    """
+    Test that create_app() returns an app using the configured database.
+
+    Args:
+        tb_db (sql.TimeblockDB): An empty TimeblockDB instance.
+    """
+    app = create_app({"DATABASE": TEST_DB_PATH})
+    client = app.test_client()
+    client.post("/", data={"action": "go to sleep"})
+    assert "go to sleep" in client.get("/").text
+    with tb_db:
+        assert tb_db.read_query("SELECT desc FROM action") == [
+            ("go to sleep",)
         ]
+
+
+def test_timer_routes(tb_db: sql.TimeblockDB) -> None:
+    """
+    Test that /timer starts, switches and stops the stored timer.
+
+    Args:
+        tb_db (sql.TimeblockDB): An empty TimeblockDB instance.
+    """
+    client = create_app({"DATABASE": TEST_DB_PATH}).test_client()
+    client.post("/", data={"action": "first"})
+    client.post("/", data={"action": "second"})
+    assert client.get("/timer").json["running"] is False
+    assert client.post("/timer", data={"task": "start", "id": 1}).json == {
+        "elapsed": None
+    }
+    response = client.post("/timer", data={"task": "start", "id": 2})
+    assert response.status_code == 409
+    response = client.post("/timer", data={"task": "start", "id": 9})
+    assert response.status_code == 404
+    assert client.get("/timer").json["selected"] == 1
+    response = client.post("/timer", data={"task": "switch", "id": 2})
+    assert response.json["elapsed"] >= 0
+    assert client.get("/timer").json["selected"] == 2
+    assert client.post("/timer", data={"task": "stop"}).status_code == 200
+    assert client.post("/timer", data={"task": "stop"}).status_code == 409
+    assert client.post("/timer", data={"task": "nap"}).status_code == 400
+    with tb_db:
+        assert tb_db.running_timer() is None
+
+
+@pytest.mark.parametrize(
+    "module", ["timeblock.action", "timeblock.sql", "timeblock.stopwatch"]
+)
+def test_import_time(module: str) -> None:
+    """
+    Test that non-web modules import quickly and without Flask.
+
+    Runs a fresh interpreter with '-X importtime' and checks the
+    cumulative import time of the module against IMPORT_BUDGET_US.
+
+    Args:
+        module (str): Name of the module to import.
+    """
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            f"import sys, {module}; print('flask' in sys.modules)",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "False"
+    cumulative = sum(
+        int(line.split("|")[1])
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:")
+        and line.split("|")[2].strip().startswith("timeblock")
+        and not line.split("|")[2].startswith("  ")
+    )
+    assert 0 < cumulative < IMPORT_BUDGET_US
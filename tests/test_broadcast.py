@@ -0,0 +1,107 @@
+"""
+Tests for the `Broadcaster` class and its use by `TimeblockDB`.
+
+This fixture is imported from tests/conftest.py:
+    - tb_db: An empty TimeblockDB instance.
+
+The tests cover the following:
+    - Events are returned per channel after a given id.
+    - Ids that have dropped out of the history, or are unknown, give None.
+    - Each channel keeps its own history, and only the channels published
+        to most recently keep one.
+    - stream() formats events and sends keepalives and resets.
+    - A waiting stream is woken by an event from another thread.
+    - add_action() publishes an insert event.
+"""
+
+import threading
+
+from timeblock import sql
+from timeblock.action import Action
+from timeblock.broadcast import Broadcaster
+
+
+def test_events_since():
+    """Test that events are filtered by channel and id."""
+    broadcaster = Broadcaster()
+    start = broadcaster.last_id()
+    first = broadcaster.publish("a", "insert", {"id": 1})
+    broadcaster.publish("b", "insert", {"id": 1})
+    third = broadcaster.publish("a", "delete", {"id": 1})
+    assert [e.id for e in broadcaster.events_since("a", start)] == [
+        first,
+        third,
+    ]
+    assert [e.id for e in broadcaster.events_since("a", first)] == [third]
+    assert broadcaster.events_since("a", third) == []
+
+
+def test_history():
+    """Test that forgotten and unknown ids give None."""
+    broadcaster = Broadcaster(history=2)
+    start = broadcaster.last_id()
+    for i in range(3):
+        broadcaster.publish("a", "insert", {"id": i})
+    assert broadcaster.events_since("a", start) is None
+    assert len(broadcaster.events_since("a", start + 1)) == 2
+    assert broadcaster.events_since("a", broadcaster.last_id() + 1) is None
+
+
+def test_channel_history():
+    """Test that a busy channel doesn't push out a quiet one's events."""
+    broadcaster = Broadcaster(history=2, channels=2)
+    start = broadcaster.last_id()
+    quiet = broadcaster.publish("b", "insert", {"id": 1})
+    for i in range(3):
+        broadcaster.publish("a", "insert", {"id": i})
+    assert [e.id for e in broadcaster.events_since("b", start)] == [quiet]
+    assert broadcaster.events_since("c", start) == []
+    broadcaster.publish("c", "insert", {"id": 1})
+    assert broadcaster.events_since("b", start) is None
+    assert broadcaster.events_since("d", start) is None
+    assert broadcaster.events_since("d", broadcaster.last_id()) == []
+    broadcaster.publish("b", "insert", {"id": 2})
+    assert broadcaster.events_since("b", quiet) is not None
+    assert broadcaster.events_since("b", start) is None
+
+
+def test_stream():
+    """Test the text/event-stream output of stream()."""
+    broadcaster = Broadcaster(history=1)
+    start = broadcaster.last_id()
+    stream = broadcaster.stream("a", keepalive=0.01)
+    assert next(stream) == "retry: 3000\n\n"
+    assert next(stream) == ": keepalive\n\n"
+    event_id = broadcaster.publish("a", "insert", {"id": 1})
+    assert next(stream) == (
+        f'id: {event_id}\nevent: insert\ndata: {{"id": 1}}\n\n'
+    )
+    broadcaster.publish("a", "insert", {"id": 2})
+    resumed = broadcaster.stream("a", start, keepalive=0.01)
+    next(resumed)
+    assert "event: reset" in next(resumed)
+    assert list(resumed) == []
+
+
+def test_wake():
+    """Test that a waiting stream receives an event from another thread."""
+    broadcaster = Broadcaster()
+    stream = broadcaster.stream("a", keepalive=10)
+    next(stream)
+    timer = threading.Timer(
+        0.05, broadcaster.publish, ("a", "insert", {"id": 1})
+    )
+    timer.start()
+    assert "event: insert" in next(stream)
+    timer.join()
+
+
+def test_add_action(tb_db: sql.TimeblockDB):
+    """Test that add_action() publishes the new action."""
+    tb_db.broadcaster = Broadcaster()
+    start = tb_db.broadcaster.last_id()
+    with tb_db:
+        tb_db.add_action(Action("test"))
+    (event,) = tb_db.broadcaster.events_since(tb_db.filename, start)
+    assert event.kind == "insert"
+    assert event.data == {"id": 1, "desc": "test", "est_duration": None}
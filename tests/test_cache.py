@@ -0,0 +1,121 @@
+"""
+Tests for the `ActionCache` class and its use by `TimeblockDB`.
+
+This fixture is imported from tests/conftest.py:
+    - tb_db: An empty TimeblockDB instance.
+
+The tests cover the following:
+    - Entries are evicted least recently used first.
+    - A changed database version drops every entry.
+    - Values read before an invalidation aren't stored after it.
+    - get_actions() decodes each action once and then serves it from cache.
+    - Writes through TimeblockDB invalidate only the written action.
+    - A transaction of many writes invalidates only the written actions.
+    - Writes from another connection are detected by the version counter.
+"""
+
+from constants import TEST_DB_PATH
+from timeblock import sql
+from timeblock.action import Action
+from timeblock.cache import ActionCache
+
+
+def test_eviction():
+    """Test that the least recently used entry is evicted first."""
+    cache = ActionCache(maxsize=2)
+    for action_id in (1, 2):
+        cache.put(Action(str(action_id), action_id=action_id))
+    assert cache.get(1) is not None
+    cache.put(Action("3", action_id=3))
+    assert cache.get(2) is None
+    assert cache.stats() == {
+        "size": 2,
+        "maxsize": 2,
+        "hits": 1,
+        "misses": 1,
+        "evictions": 1,
+    }
+
+
+def test_sync():
+    """Test that a new database version drops every entry."""
+    cache = ActionCache()
+    cache.sync(1)
+    cache.put(Action("test", action_id=1))
+    cache.sync(1)
+    assert len(cache) == 1
+    cache.sync(2)
+    assert len(cache) == 0
+
+
+def test_stale_put():
+    """Test that ids and actions read at an old version aren't stored."""
+    cache = ActionCache()
+    cache.sync(1)
+    cache.invalidate([1], 2)
+    cache.put(Action("stale", action_id=1), 1)
+    cache.set_ids([1], 1)
+    assert cache.get(1) is None
+    assert cache.ids is None
+    cache.put(Action("fresh", action_id=1), 2)
+    cache.set_ids([1], 2)
+    assert cache.get(1) is not None
+    assert cache.ids == [1]
+
+
+def test_read_through(tb_db: sql.TimeblockDB):
+    """Test that get_actions() fills the cache and then reads from it."""
+    tb_db.cache = ActionCache()
+    with tb_db:
+        tb_db.add_action(Action("first"))
+        tb_db.add_action(Action("second"))
+        assert [a.desc for a in tb_db.get_actions()] == ["first", "second"]
+        assert tb_db.cache.stats()["misses"] == 2
+        actions = tb_db.get_actions()
+        assert tb_db.cache.stats()["hits"] == 2
+        assert actions == tb_db.get_actions()
+
+
+def test_write_invalidates(tb_db: sql.TimeblockDB):
+    """Test that add_action() keeps the other cached actions."""
+    tb_db.cache = ActionCache()
+    with tb_db:
+        tb_db.add_action(Action("first"))
+        first = tb_db.get_actions()[0]
+        tb_db.add_action(Action("second"))
+        actions = tb_db.get_actions()
+        assert actions[0] is first
+        assert actions[1].desc == "second"
+
+
+def test_batch_invalidates(tb_db: sql.TimeblockDB):
+    """Test that a batch of writes only drops the actions it wrote."""
+    tb_db.cache = ActionCache()
+    with tb_db:
+        tb_db.add_actions([Action("first"), Action("second")])
+        first, second = tb_db.get_actions()
+        with tb_db.transaction():
+            tb_db.update_action(2, desc="renamed")
+            tb_db.update_action(2, desc="renamed again")
+            tb_db.add_actions([Action("third"), Action("fourth")])
+        actions = tb_db.get_actions()
+        assert actions[0] is first
+        assert actions[1] is not second
+        assert [a.desc for a in actions[1:]] == [
+            "renamed again",
+            "third",
+            "fourth",
+        ]
+
+
+def test_other_connection(tb_db: sql.TimeblockDB):
+    """Test that writes from another connection drop the cache."""
+    tb_db.cache = ActionCache()
+    with tb_db:
+        tb_db.add_action(Action("first"))
+        first = tb_db.get_actions()[0]
+        with sql.Database(TEST_DB_PATH) as other:
+            other.write_query("UPDATE action SET desc = 'changed'")
+        actions = tb_db.get_actions()
+        assert actions[0] is not first
+        assert actions[0].desc == "changed"
@@ -0,0 +1,200 @@
+"""
+Tests for the command line interface.
+
+These constants are imported from the constants.py module:
+    - TEST_DB_PATH: The path to the test database.
+
+This fixture is imported from tests/conftest.py:
+    - tb_db: An empty TimeblockDB instance.
+
+The tests cover the following:
+    - Actions are added from arguments and from stdin.
+    - Actions are listed and exported as JSON and CSV, zero durations
+        as 0.
+    - Actions are scheduled, one at a time or from stdin.
+    - Actions are edited, deleted, restored and their history shown.
+    - The timer is started, switched and stopped.
+    - Dependencies are added and removed, and actions planned after
+        the actions they depend on.
+    - Batches of JSON operations run in one transaction, and errors
+        name the line they are on.
+    - Arguments without a subcommand still run the web server.
+"""
+
+import json
+from datetime import datetime
+from io import StringIO
+
+import pytest
+
+from constants import TEST_DB_PATH
+from timeblock import cli, sql
+
+
+def run(*argv: str, stdin: str = "") -> tuple[int, str]:
+    """Run CLI on the test database and return status and stdout."""
+    out = StringIO()
+    status = cli.run(
+        [*argv, "--db", TEST_DB_PATH], stdin=StringIO(stdin), out=out
+    )
+    return status, out.getvalue()
+
+
+def test_add(tb_db: sql.TimeblockDB):
+    """Test that actions are added from arguments and stdin."""
+    assert run("add", "first", "second", "--duration", "25") == (
+        0,
+        "Added 2 of 2 actions\n",
+    )
+    assert run("add", "-", stdin="third\t5\n\nfourth\n") == (
+        0,
+        "Added 2 of 2 actions\n",
+    )
+    assert run("add", "first")[0] == 1
+    with tb_db:
+        assert tb_db.read_query("SELECT desc, est_duration FROM action") == [
+            ("first", 1500),
+            ("second", 1500),
+            ("third", 300),
+            ("fourth", None),
+        ]
+
+
+def test_list_export(tb_db: sql.TimeblockDB):
+    """Test that actions are listed and exported."""
+    run("add", "first", "--duration", "25")
+    run("schedule", "1", "2023-01-16T09:00")
+    assert run("list") == (0, "1\tfirst\t25m\t2023-01-16T09:00\n")
+    status, output = run("export")
+    assert json.loads(output) == [
+        {
+            "id": 1,
+            "desc": "first",
+            "est_duration": 1500.0,
+            "actual_duration": None,
+            "start": "2023-01-16T09:00:00",
+        }
+    ]
+    status, output = run("export", "--format", "csv")
+    assert status == 0
+    assert output.splitlines() == [
+        "id,desc,est_duration,actual_duration,start",
+        "1,first,1500.0,,2023-01-16T09:00:00",
+    ]
+    with tb_db:
+        assert tb_db.get_action(1).start == datetime(2023, 1, 16, 9)
+        tb_db.start_timer(1, datetime(2023, 1, 16, 9))
+        tb_db.stop_timer(datetime(2023, 1, 16, 9))
+    status, output = run("export")
+    assert json.loads(output)[0]["actual_duration"] == 0.0
+
+
+def test_schedule(tb_db: sql.TimeblockDB):
+    """Test that actions are scheduled from stdin, and clashes fail."""
+    run("add", "first", "second")
+    stdin = "1\t2023-01-16T09:00\n2\t2023-01-16T10:00\n"
+    assert run("schedule", "-", stdin=stdin)[0] == 0
+    assert run("schedule", "2", "2023-01-16T09:00")[0] == 1
+    assert run("schedule", "3", "2023-01-16T11:00")[0] == 1
+    with tb_db:
+        assert tb_db.get_action(2).start == datetime(2023, 1, 16, 10)
+
+
+def test_edit_delete(tb_db: sql.TimeblockDB):
+    """Test that actions are edited, deleted and restored."""
+    run("add", "first")
+    assert run("edit", "1", "--desc", "renamed", "--duration", "5") == (
+        0,
+        "Changed action 1\n",
+    )
+    assert run("delete", "1") == (0, "Deleted action 1\n")
+    assert run("list") == (0, "")
+    assert run("delete", "1")[0] == 1
+    assert run("restore", "1") == (0, "Restored action 1\n")
+    assert run("list") == (0, "1\trenamed\t5m\t-\n")
+    status, output = run("history", "1")
+    assert status == 0
+    assert [event["kind"] for event in json.loads(output)] == [
+        "create",
+        "update",
+        "delete",
+        "restore",
+    ]
+    assert run("history", "2")[0] == 1
+
+
+def test_timer(tb_db: sql.TimeblockDB):
+    """Test that the timer is started, switched and stopped."""
+    run("add", "first", "second")
+    assert run("stop")[0] == 1
+    assert run("start", "3")[0] == 1
+    assert run("start", "1") == (0, "Started timer for action 1\n")
+    status, output = run("start", "2")
+    assert status == 0
+    assert output.startswith("Stopped previous timer after")
+    assert run("stop")[0] == 0
+    with tb_db:
+        assert tb_db.read_query("SELECT actual_duration FROM action") == [
+            (0,),
+            (0,),
+        ]
+        assert tb_db.running_timer() is None
+
+
+def test_dependencies(tb_db: sql.TimeblockDB):
+    """Test that dependencies order planned actions."""
+    run("add", "first", "second", "third", "--duration", "15")
+    assert run("depend", "1", "--on", "3", "2") == (
+        0,
+        "Added 2 of 2 dependencies\n",
+    )
+    assert run("depend", "3", "--on", "1")[0] == 1
+    assert run("undepend", "1", "--on", "2", "3", "4")[0] == 1
+    assert run("depend", "1", "--on", "3") == (
+        0,
+        "Added 1 of 1 dependencies\n",
+    )
+    assert run("critical") == (0, "3\tthird\n1\tfirst\nTotal 0:30:00\n")
+    assert run("plan", "2023-01-16T09:00") == (
+        0,
+        "2\tsecond\t2023-01-16T09:00\n"
+        "3\tthird\t2023-01-16T09:15\n"
+        "1\tfirst\t2023-01-16T09:30\n"
+        "Scheduled 3 actions\n",
+    )
+
+
+def test_batch(tb_db: sql.TimeblockDB):
+    """Test that batches run together and roll back on bad input."""
+    stdin = "\n".join(
+        [
+            '{"op": "add", "desc": "first", "duration": 5}',
+            '{"op": "schedule", "id": 1, "start": "2023-01-16T09:00"}',
+            '{"op": "start", "id": 1}',
+            '{"op": "stop"}',
+        ]
+    )
+    assert run("batch", stdin=stdin) == (
+        0,
+        "Done (add: 1, schedule: 1, start: 1, stop: 1), 0 failed\n",
+    )
+    with pytest.raises(ValueError, match="Line 2: Unknown operation"):
+        run("batch", stdin='{"op": "add", "desc": "x"}\n{"op": "fly"}\n')
+    with pytest.raises(ValueError, match="Line 3: missing 'desc'"):
+        run("batch", stdin='{"op": "stop"}\n\n{"op": "add"}\n')
+    with tb_db:
+        assert tb_db.read_query("SELECT desc FROM action") == [("first",)]
+
+
+def test_legacy_serve(monkeypatch):
+    """Test that arguments without a subcommand run the web server."""
+    calls = []
+    monkeypatch.setattr("timeblock.main", lambda *args: calls.append(args))
+    assert cli.run([]) == 0
+    assert cli.run(["other.sql", "shards"]) == 0
+    assert cli.run(["serve", "--db", "other.sql", "--port", "8000"]) == 0
+    assert calls == [
+        ("db.sql", None, 5000),
+        ("other.sql", "shards", 5000),
+        ("other.sql", None, 8000),
+    ]
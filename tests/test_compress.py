@@ -0,0 +1,88 @@
+"""
+Tests for response compression and static file caching.
+
+This module uses pytest's built-in tmp_path fixture for the database.
+
+The tests cover the following:
+    - Accept-Encoding headers are negotiated, honouring q-values.
+    - The streamed main page is compressed chunk by chunk.
+    - Small bodies and event streams aren't compressed.
+    - Fingerprinted static files are immutable.
+"""
+
+import re
+import zlib
+
+import pytest
+
+from timeblock import compress, create_app, sql
+from timeblock.action import Action
+
+
+@pytest.fixture(name="client")
+def fixture_client(tmp_path):
+    """Return test client of an app with 2000 actions."""
+    filename = str(tmp_path / "db.sql")
+    with sql.TimeblockDB(filename) as database:
+        database.add_actions(Action(f"action {i}") for i in range(2000))
+    return create_app({"DATABASE": filename}).test_client()
+
+
+def test_negotiate(monkeypatch):
+    """Test that the best accepted encoding is picked."""
+    monkeypatch.setattr(compress, "brotli", None)
+    assert compress.negotiate("gzip, deflate") == "gzip"
+    assert compress.negotiate("br;q=1.0, gzip;q=0.5") == "gzip"
+    assert compress.negotiate("*") == "gzip"
+    assert compress.negotiate("gzip;q=0") is None
+    assert compress.negotiate("identity") is None
+    assert compress.negotiate("") is None
+    monkeypatch.setattr(compress, "brotli", object())
+    assert compress.negotiate("gzip, br") == "br"
+    assert compress.negotiate("gzip, br;q=0.1") == "gzip"
+
+
+def test_streamed_page(client, monkeypatch):
+    """Test that the main page is compressed incrementally."""
+    monkeypatch.setattr(compress, "brotli", None)
+    plain = client.get("/")
+    assert "Content-Encoding" not in plain.headers
+    assert "Accept-Encoding" in plain.headers["Vary"]
+
+    response = client.get(
+        "/", headers={"Accept-Encoding": "gzip"}, buffered=False
+    )
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    chunks = list(response.response)
+    response.close()
+    decompressor = zlib.decompressobj(31)
+    parts = [decompressor.decompress(chunk) for chunk in chunks]
+    assert len(parts) > 2
+    assert all(parts[:-1]), "every chunk decodes on its own"
+    assert b"".join(parts) == plain.data
+    assert len(plain.data) > 5 * sum(map(len, chunks))
+
+
+def test_not_compressed(client):
+    """Test that small bodies and event streams are sent as they are."""
+    headers = {"Accept-Encoding": "gzip"}
+    response = client.get("/timer", headers=headers)
+    assert "Content-Encoding" not in response.headers
+    response = client.get("/events", headers=headers, buffered=False)
+    assert response.mimetype == "text/event-stream"
+    assert "Content-Encoding" not in response.headers
+    response.close()
+
+
+def test_static_immutable(client):
+    """Test that fingerprinted static files are cached for good."""
+    page = client.get("/").text
+    url = re.search(r'<script src="([^"]+)"', page).group(1)
+    assert "v=" in url
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Cache-Control"] == compress.IMMUTABLE
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert b"EventSource" in zlib.decompress(response.data, 31)
+    response = client.get("/static/actions.js?v=old")
+    assert "immutable" not in response.headers.get("Cache-Control", "")
@@ -0,0 +1,99 @@
+"""
+Tests for `DependencyGraph` class.
+
+The tests cover the following:
+    - Edges keep the order topological, and cycles are refused without
+        changing the graph.
+    - Random edges give the same answers as checking reachability from
+        scratch.
+    - Removing edges and nodes frees the order up again.
+    - Nodes are ordered by dependencies, then by value.
+    - The critical path is the longest chain of dependencies.
+"""
+
+import random
+
+import pytest
+
+from timeblock.graph import CycleError, DependencyGraph
+
+
+def reaches(edges: set, start, target) -> bool:
+    """Return whether target can be reached from start along edges."""
+    seen, stack = {start}, [start]
+    while stack:
+        node = stack.pop()
+        if node == target:
+            return True
+        for before, after in edges:
+            if before == node and after not in seen:
+                seen.add(after)
+                stack.append(after)
+    return False
+
+
+def assert_ordered(graph: DependencyGraph, edges: set) -> None:
+    """Assert that every edge goes forward in the order."""
+    for before, after in edges:
+        assert graph.position(before) < graph.position(after)
+
+
+def test_add_edge():
+    """Test that edges reorder nodes and cycles are refused."""
+    graph = DependencyGraph()
+    for node in range(1, 5):
+        graph.add_node(node)
+    graph.add_edge(4, 1)
+    graph.add_edge(3, 4)
+    assert_ordered(graph, {(4, 1), (3, 4)})
+    before = graph.topological_order()
+    with pytest.raises(CycleError):
+        graph.add_edge(1, 3)
+    with pytest.raises(CycleError):
+        graph.add_edge(2, 2)
+    assert graph.topological_order() == before
+    assert len(graph) == 4 and 3 in graph
+
+
+def test_random_edges():
+    """Test that random edges agree with a check from scratch."""
+    rng = random.Random(0)
+    graph = DependencyGraph()
+    edges: set = set()
+    for _ in range(400):
+        before, after = rng.sample(range(30), 2)
+        if reaches(edges, after, before):
+            with pytest.raises(CycleError):
+                graph.add_edge(before, after)
+        else:
+            graph.add_edge(before, after)
+            edges.add((before, after))
+        assert_ordered(graph, edges)
+    loaded = DependencyGraph(edges)
+    assert_ordered(loaded, edges)
+    with pytest.raises(CycleError):
+        loaded.load(edges | {(2, 1), (1, 2)})
+
+
+def test_remove():
+    """Test that removed edges and nodes no longer constrain the order."""
+    graph = DependencyGraph([(1, 2), (2, 3)])
+    with pytest.raises(CycleError):
+        graph.add_edge(3, 1)
+    graph.remove_edge(2, 3)
+    graph.add_edge(3, 1)
+    assert_ordered(graph, {(1, 2), (3, 1)})
+    graph.remove_node(1)
+    graph.add_edge(2, 3)
+    assert 1 not in graph
+    assert graph.order([3, 2]) == [2, 3]
+
+
+def test_order_and_critical_path():
+    """Test ordering of chosen nodes and the critical path."""
+    graph = DependencyGraph([(5, 1), (1, 2), (3, 2)])
+    assert graph.order([1, 2, 3, 4, 5]) == [3, 4, 5, 1, 2]
+    assert graph.order([2, 1]) == [1, 2]
+    assert graph.critical_path({1: 10, 2: 5, 3: 30, 5: 1}) == (35, [3, 2])
+    assert graph.critical_path({1: 10, 2: 5, 5: 30}) == (45, [5, 1, 2])
+    assert DependencyGraph().critical_path({}) == (0.0, [])
@@ -0,0 +1,108 @@
+"""
+Tests for the load test tool.
+
+This module uses pytest's built-in tmp_path fixture for database files.
+
+The tests cover the following:
+    - The readiness probe waits for a server and times out without one.
+    - A spawned server listens on a free port, refuses a taken one and
+        fails if the server exits before it answers.
+    - Request mixes are parsed and bad ones rejected.
+    - The open file limit is raised without failing on an unlimited one.
+    - A load test against the in-process server reports every request.
+    - The command prints the report as JSON.
+"""
+
+import json
+import resource
+import socket
+import urllib.request
+
+import pytest
+
+from timeblock import loadtest
+
+
+def test_wait_until_ready(tmp_path):
+    """Test that the probe returns once the server answers."""
+    with loadtest.serve(str(tmp_path / "db.sql")) as url:
+        assert loadtest.wait_until_ready(url) < 1
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    with pytest.raises(TimeoutError):
+        loadtest.wait_until_ready(f"http://127.0.0.1:{port}/", timeout=0.2)
+
+
+def test_spawn(tmp_path):
+    """Test that a spawned server gets a free port, or fails to start."""
+    database = str(tmp_path / "db.sql")
+    with loadtest.spawn(database) as url:
+        assert not url.endswith(":5000/")
+        with urllib.request.urlopen(url) as response:
+            assert response.status == 200
+    with socket.socket() as taken:
+        taken.bind(("127.0.0.1", 0))
+        taken.listen()
+        with pytest.raises(OSError):
+            with loadtest.spawn(database, port=taken.getsockname()[1]):
+                pass
+    with pytest.raises(RuntimeError):
+        with loadtest.spawn(str(tmp_path / "missing" / "db.sql")):
+            pass
+
+
+def test_parse_mix():
+    """Test that mixes are parsed into weights."""
+    assert loadtest.parse_mix("get=3, POST=1") == {"get": 3, "post": 1}
+    assert loadtest.parse_mix("post") == {"post": 1}
+    for text in ["delete=1", "get=0", "get=-1"]:
+        with pytest.raises(ValueError):
+            loadtest.parse_mix(text)
+
+
+def test_raise_file_limit(monkeypatch):
+    """Test that an unlimited hard limit raises the soft one to a number."""
+    calls = []
+    monkeypatch.setattr(
+        resource, "getrlimit", lambda _: (256, resource.RLIM_INFINITY)
+    )
+    monkeypatch.setattr(
+        resource, "setrlimit", lambda _, limits: calls.append(limits)
+    )
+    loadtest._raise_file_limit()  # pylint: disable=protected-access
+    assert calls == [(loadtest.FILE_LIMIT, resource.RLIM_INFINITY)]
+
+    def refuse(_resource, _limits):
+        raise OSError("not allowed")
+
+    monkeypatch.setattr(resource, "setrlimit", refuse)
+    loadtest._raise_file_limit()  # pylint: disable=protected-access
+
+
+def test_run_load(tmp_path):
+    """Test that every request is counted, and POSTs add actions."""
+    with loadtest.serve(str(tmp_path / "db.sql")) as url:
+        report = loadtest.run_load(
+            url,
+            clients=20,
+            duration=None,
+            requests=3,
+            mix={"get": 1, "post": 1},
+        )
+    assert report["all"]["requests"] == 60
+    assert report["get"]["requests"] + report["post"]["requests"] == 60
+    assert report["all"]["error_rate"] == 0.0
+    assert report["all"]["p50_ms"] <= report["all"]["p99_ms"]
+
+
+def test_main(tmp_path, capsys):
+    """Test that the command prints a JSON report."""
+    database = str(tmp_path / "db.sql")
+    assert (
+        loadtest.main(["--clients", "5", "--requests", "2", "--db", database])
+        == 0
+    )
+    report = json.loads(capsys.readouterr().out)
+    assert report["clients"] == 5
+    assert report["all"]["requests"] == 10
@@ -0,0 +1,217 @@
+"""
+Tests for the database maintenance tools.
+
+This module uses pytest's built-in tmp_path fixture for database files.
+
+The tests cover the following:
+    - New databases use incremental auto_vacuum and report fragmentation.
+    - compact() releases free pages, converting older databases first,
+        and raises if the conversion fails.
+    - backup() copies a database in batches while it is being written,
+        and leaves no partial copy when it fails.
+    - snapshot() keeps only the most recent copies of the same source.
+    - The scheduler runs maintenance in the background, and maintains
+        tenant databases too.
+    - The admin route needs the ADMIN_TOKEN, reports stats and runs
+        tasks.
+    - The CLI commands print JSON reports.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from io import StringIO
+
+import pytest
+
+from timeblock import cli, create_app, maintenance, sql
+from timeblock.action import Action
+from timeblock.shard import ShardRouter
+
+
+def make_db(path, count: int = 2000) -> str:
+    """Create database at path with count actions, half of them deleted."""
+    filename = str(path)
+    with sql.TimeblockDB(filename) as database:
+        database.add_actions(
+            [Action(f"action {i} " + "x" * 200) for i in range(count)]
+        )
+        database.write_query("DELETE FROM action WHERE id > ?", (count // 2,))
+    return filename
+
+
+def test_compact(tmp_path):
+    """Test that compact() frees pages and reports before and after."""
+    filename = make_db(tmp_path / "db.sql")
+    report = maintenance.compact(filename)
+    before, after = report["before"], report["after"]
+    assert report["method"] == "incremental_vacuum"
+    assert before["auto_vacuum"] == "incremental"
+    assert before["freelist_count"] > 0
+    assert before["fragmentation"] > 0.2
+    assert after["freelist_count"] == 0
+    assert after["file_bytes"] < before["file_bytes"]
+
+
+def test_compact_converts(tmp_path):
+    """Test that databases without incremental auto_vacuum are converted."""
+    filename = str(tmp_path / "old.sql")
+    with sql.Database(filename) as database:
+        database.write_query("CREATE TABLE action(desc)")
+    assert maintenance.file_stats(filename)["auto_vacuum"] == "none"
+    report = maintenance.compact(filename)
+    assert report["after"]["auto_vacuum"] == "incremental"
+    assert report["method"] == "vacuum"
+
+
+def test_compact_busy(tmp_path, monkeypatch):
+    """Test that a failed conversion raises instead of being reported."""
+    filename = str(tmp_path / "old.sql")
+    with sql.Database(filename) as database:
+        database.write_query("CREATE TABLE action(desc)")
+
+    def busy(_self, _script):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(sql.Database, "script", busy)
+    with pytest.raises(sqlite3.OperationalError):
+        maintenance.compact(filename)
+    assert maintenance.file_stats(filename)["auto_vacuum"] == "none"
+
+
+def test_backup_while_writing(tmp_path):
+    """Test that a batched backup completes while another thread writes."""
+    filename = make_db(tmp_path / "db.sql")
+    stop = threading.Event()
+
+    def write():
+        with sql.TimeblockDB(filename) as database:
+            i = 0
+            while not stop.is_set():
+                database.add_action(Action(f"new {i}"))
+                i += 1
+                time.sleep(0.001)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        report = maintenance.backup(
+            filename, str(tmp_path / "copy.sql"), pages=8
+        )
+    finally:
+        stop.set()
+        writer.join()
+    assert report["batches"] > 1
+    with sql.TimeblockDB(report["target"]) as copy:
+        assert len(copy.read_query("SELECT * FROM action")) >= 1000
+    assert not (tmp_path / "copy.sql.partial").exists()
+
+
+def test_backup_fails(tmp_path):
+    """Test that a failed backup removes its partial copy."""
+    source = tmp_path / "broken.sql"
+    source.write_bytes(b"not a database" * 100)
+    target = tmp_path / "copy.sql"
+    with pytest.raises(sqlite3.DatabaseError):
+        maintenance.backup(str(source), str(target))
+    assert not target.exists()
+    assert not (tmp_path / "copy.sql.partial").exists()
+
+
+def test_snapshot(tmp_path):
+    """Test that snapshot() prunes all but the newest copies."""
+    filename = make_db(tmp_path / "db.sql", count=10)
+    directory = str(tmp_path / "snapshots")
+    reports = [
+        maintenance.snapshot(filename, directory, keep=2) for _ in range(3)
+    ]
+    assert reports[2]["removed"] == [reports[0]["target"].split("/")[-1]]
+    assert len(list((tmp_path / "snapshots").iterdir())) == 2
+
+
+def test_snapshot_prefix(tmp_path):
+    """Test that snapshot() leaves snapshots of a longer name alone."""
+    alice = make_db(tmp_path / "alice.sql", count=10)
+    work = make_db(tmp_path / "alice-work.sql", count=10)
+    directory = str(tmp_path / "snapshots")
+    kept = maintenance.snapshot(work, directory, keep=1)["target"]
+    report = maintenance.snapshot(alice, directory, keep=1)
+    assert report["removed"] == []
+    assert os.path.exists(kept)
+    assert os.path.exists(report["target"])
+
+
+def test_scheduler(tmp_path):
+    """Test that the scheduler compacts and snapshots in the background."""
+    filename = make_db(tmp_path / "db.sql")
+    scheduler = maintenance.MaintenanceScheduler(
+        filename, interval=0.01, snapshot_directory=str(tmp_path / "snaps")
+    )
+    scheduler.start()
+    for _ in range(500):
+        if scheduler.last_report:
+            break
+        time.sleep(0.01)
+    scheduler.stop()
+    assert scheduler.last_report["checkpoint"] > 0
+    assert scheduler.last_report["compact"]["after"]["freelist_count"] == 0
+    assert (tmp_path / "snaps").exists()
+
+
+def test_scheduler_shards(tmp_path):
+    """Test that the scheduler maintains every tenant database."""
+    filename = make_db(tmp_path / "db.sql", count=10)
+    router = ShardRouter(str(tmp_path / "shards"))
+    for tenant in ("alice", "db"):
+        with router.connect(tenant) as database:
+            database.add_action(Action("write report"))
+    router.close()
+    directory = tmp_path / "snaps"
+    scheduler = maintenance.MaintenanceScheduler(
+        filename, snapshot_directory=str(directory), shards=router
+    )
+    report = scheduler.run_once()
+    assert report["checkpoint"] > 0
+    assert sorted(report["shards"]) == ["alice", "db"]
+    assert report["shards"]["alice"]["checkpoint"] > 0
+    assert report["shards"]["db"]["compact"]["method"] == "incremental_vacuum"
+    # the tenant named like the app's database keeps its own snapshots
+    assert len(list(directory.glob("db-*.sql"))) == 1
+    assert len(list((directory / "shards").glob("*.sql"))) == 2
+
+
+def test_admin_route(tmp_path):
+    """Test that /admin/maintenance reports stats and runs tasks."""
+    filename = make_db(tmp_path / "db.sql")
+    config = {"DATABASE": filename, "SNAPSHOT_DIRECTORY": str(tmp_path / "b")}
+    client = create_app(config).test_client()
+    auth = {"Authorization": "Bearer secret"}
+    response = client.post("/admin/maintenance", data={"task": "compact"})
+    assert response.status_code == 404
+    assert client.get("/admin/maintenance", headers=auth).status_code == 404
+    client = create_app({**config, "ADMIN_TOKEN": "secret"}).test_client()
+    response = client.post("/admin/maintenance", data={"task": "compact"})
+    assert response.status_code == 401
+    assert "vacuum" not in response.text
+    client.environ_base["HTTP_AUTHORIZATION"] = auth["Authorization"]
+    assert client.get("/admin/maintenance").json["stats"]["page_count"] > 0
+    report = client.post("/admin/maintenance", data={"task": "compact"}).json
+    assert report["after"]["freelist_count"] == 0
+    report = client.post("/admin/maintenance", data={"task": "backup"}).json
+    assert report["target"].startswith(str(tmp_path / "b"))
+    response = client.post("/admin/maintenance", data={"task": "drop"})
+    assert response.status_code == 400
+
+
+def test_cli(tmp_path):
+    """Test that maintenance commands print JSON reports."""
+    filename = make_db(tmp_path / "db.sql")
+    out = StringIO()
+    assert cli.run(["compact", "--db", filename], out=out) == 0
+    assert json.loads(out.getvalue())["after"]["freelist_count"] == 0
+    out = StringIO()
+    target = str(tmp_path / "copy.sql")
+    assert cli.run(["backup", target, "--db", filename], out=out) == 0
+    assert json.loads(out.getvalue())["target"] == target
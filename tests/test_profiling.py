@@ -0,0 +1,99 @@
+"""
+Tests for request profiling.
+
+This module uses pytest's built-in tmp_path fixture for the database
+and profile directory.
+
+The tests cover the following:
+    - Requests are only profiled with the header, or when sampled.
+    - Profiles include queries, cProfile stats and allocations.
+    - The oldest profiles are deleted beyond the caps.
+    - /admin/profiles lists the slowest profiles.
+"""
+
+import pstats
+import tracemalloc
+
+from timeblock import create_app
+from timeblock.profiling import PROFILE_HEADER, PROFILE_ID_HEADER
+
+
+def make_app(tmp_path, **config):
+    """Return app with profiles written to tmp_path/profiles."""
+    return create_app(
+        {
+            "DATABASE": str(tmp_path / "db.sql"),
+            "PROFILE_DIRECTORY": str(tmp_path / "profiles"),
+            **config,
+        }
+    )
+
+
+def test_opt_in(tmp_path):
+    """Test that only requests with the header are profiled."""
+    client = make_app(tmp_path).test_client()
+    assert PROFILE_ID_HEADER not in client.get("/").headers
+    response = client.get("/", headers={PROFILE_HEADER: "1"})
+    name = response.headers[PROFILE_ID_HEADER]
+    directory = tmp_path / "profiles"
+    assert sorted(path.name for path in directory.iterdir()) == [
+        f"{name}.json",
+        f"{name}.prof",
+        f"{name}.tracemalloc",
+    ]
+    stats = pstats.Stats(str(directory / f"{name}.prof"))
+    assert any(func[2] == "read_query" for func in stats.stats)
+    snapshot = tracemalloc.Snapshot.load(
+        str(directory / f"{name}.tracemalloc")
+    )
+    assert snapshot.traces
+    assert not tracemalloc.is_tracing()
+
+
+def test_sample_rate(tmp_path):
+    """Test that every request is profiled with a sample rate of 1."""
+    client = make_app(tmp_path, PROFILE_SAMPLE_RATE=1.0).test_client()
+    client.post("/", data={"action": "first"})
+    assert PROFILE_ID_HEADER in client.get("/").headers
+
+
+def test_caps(tmp_path):
+    """Test that only the newest profiles are kept."""
+    client = make_app(tmp_path, PROFILE_MAX_FILES=2).test_client()
+    names = [
+        client.get("/", headers={PROFILE_HEADER: "1"}).headers[
+            PROFILE_ID_HEADER
+        ]
+        for _ in range(3)
+    ]
+    kept = {path.stem for path in (tmp_path / "profiles").iterdir()}
+    assert kept == set(names[1:])
+    client = make_app(tmp_path, PROFILE_MAX_BYTES=1).test_client()
+    client.get("/", headers={PROFILE_HEADER: "1"})
+    assert not list((tmp_path / "profiles").iterdir())
+
+
+def test_admin_route(tmp_path):
+    """Test that /admin/profiles lists the slowest profiles first."""
+    client = make_app(tmp_path, ADMIN_TOKEN="secret").test_client()
+    client.environ_base["HTTP_AUTHORIZATION"] = "Bearer secret"
+    for i in range(3):
+        client.post(
+            "/", data={"action": f"action {i}"}, headers={PROFILE_HEADER: "1"}
+        )
+    client.get("/", headers={PROFILE_HEADER: "1"})
+    profiles = client.get("/admin/profiles").json
+    assert len(profiles) == 4
+    assert [p["seconds"] for p in profiles] == sorted(
+        (p["seconds"] for p in profiles), reverse=True
+    )
+    get = next(p for p in profiles if p["method"] == "GET")
+    assert get["query_count"] > 0
+    assert get["slowest_queries"][0]["seconds"] > 0
+    assert get["allocations"]
+    assert len(client.get("/admin/profiles?limit=1").json) == 1
+    client = create_app(
+        {"DATABASE": str(tmp_path / "db.sql"), "ADMIN_TOKEN": "secret"}
+    ).test_client()
+    client.environ_base["HTTP_AUTHORIZATION"] = "Bearer secret"
+    assert client.get("/admin/profiles").json == []
@@ -0,0 +1,124 @@
+"""
+Tests for rate limiting and admission control.
+
+This module uses pytest's built-in tmp_path fixture for the database.
+
+The tests cover the following:
+    - Token buckets refill over time, up to their burst.
+    - Buckets of the least recent clients are dropped beyond the cap.
+    - Writes wait for a slot, and are refused when the queue is full or
+        the wait times out.
+    - Clients over their limit get 429 with Retry-After, reads are never
+        limited, and /admin/ratelimit reports the counters.
+    - Writes that can't be admitted get 503 with Retry-After.
+"""
+
+import threading
+import time
+
+from timeblock import create_app
+from timeblock.ratelimit import RateLimiter
+
+
+def test_take():
+    """Test that buckets refill at the rate, up to the burst."""
+    limiter = RateLimiter(rate=2.0, burst=3)
+    assert [limiter.take("a", now=0.0) for _ in range(4)] == [0, 0, 0, 0.5]
+    assert limiter.take("b", now=0.0) == 0
+    assert limiter.take("a", now=0.5) == 0
+    assert limiter.take("a", now=100.0) == 0
+    assert [limiter.take("a", now=100.0) for _ in range(3)] == [0, 0, 0.5]
+    assert limiter.limited == 2
+    assert RateLimiter().take("a") == 0
+
+
+def test_max_clients():
+    """Test that the least recently seen clients are dropped."""
+    limiter = RateLimiter(rate=1.0, burst=1, max_clients=2)
+    limiter.take("a", now=0.0)
+    limiter.take("b", now=0.0)
+    assert limiter.take("a", now=0.0) == 1.0
+    limiter.take("c", now=0.0)
+    assert limiter.stats()["clients"] == 2
+    assert limiter.take("b", now=0.0) == 0
+    assert limiter.take("a", now=0.0) == 0
+
+
+def test_admit():
+    """Test that writes wait for a slot, up to the queue size."""
+    limiter = RateLimiter(concurrency=1, queue_size=1, queue_timeout=0.05)
+    assert limiter.admit()
+    assert not limiter.admit()
+    waited = []
+    waiter = threading.Thread(
+        target=lambda: waited.append(limiter.admit()), daemon=True
+    )
+    limiter.queue_timeout = 5.0
+    waiter.start()
+    while not limiter.stats()["waiting"]:
+        time.sleep(0.001)
+    assert not limiter.admit()
+    limiter.release()
+    waiter.join()
+    assert waited == [True]
+    assert limiter.rejected == 2
+    limiter.release()
+    assert RateLimiter().admit()
+
+
+def test_routes(tmp_path):
+    """Test that clients over their limit get 429 responses."""
+    app = create_app(
+        {
+            "DATABASE": str(tmp_path / "db.sql"),
+            "RATE_LIMIT": 0.01,
+            "RATE_LIMIT_BURST": 2,
+            "ADMIN_TOKEN": "secret",
+        }
+    )
+    client = app.test_client()
+    client.environ_base["HTTP_AUTHORIZATION"] = "Bearer secret"
+    assert client.post("/", data={"action": "first"}).status_code == 302
+    assert client.post("/", data={"action": "second"}).status_code == 302
+    response = client.post("/", data={"action": "third"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 99
+    other = client.post(
+        "/",
+        data={"action": "third"},
+        environ_base={"REMOTE_ADDR": "10.0.0.2"},
+    )
+    assert other.status_code == 302
+    assert client.get("/").status_code == 200
+    stats = client.get("/admin/ratelimit").get_json()
+    assert stats["admitted"] == 3
+    assert stats["limited"] == 1
+    assert stats["clients"] == 2
+
+
+def test_busy(tmp_path):
+    """Test that writes get 503 responses while every slot is taken."""
+    app = create_app(
+        {
+            "DATABASE": str(tmp_path / "db.sql"),
+            "WRITE_CONCURRENCY": 1,
+            "WRITE_QUEUE_TIMEOUT": 0.01,
+        }
+    )
+    client = app.test_client()
+    limiter = app.config["RATE_LIMITER"]
+    assert limiter.admit()
+    response = client.post("/", data={"action": "first"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    limiter.release()
+    assert client.post("/", data={"action": "first"}).status_code == 302
+    assert limiter.admit()
+    limiter.release()
+    unlimited = create_app(
+        {"DATABASE": str(tmp_path / "db.sql"), "ADMIN_TOKEN": "secret"}
+    ).test_client()
+    response = unlimited.get(
+        "/admin/ratelimit", headers={"Authorization": "Bearer secret"}
+    )
+    assert response.get_json() == {}
@@ -0,0 +1,115 @@
+"""
+Tests for the `ShardRouter` class.
+
+This module uses pytest's built-in tmp_path fixture for the shard directory.
+
+The tests cover the following:
+    - Tenant names that aren't safe file names are rejected.
+    - Each tenant's actions are kept in its own database file, and
+        each has its own dependency graph.
+    - The pool closes the least recently used idle handle when full.
+    - Handles apply events missing from the projection as they open.
+    - admin_query() combines rows from every tenant.
+    - Admin routes are only served without a tenant prefix, and take
+        the tenant as a parameter instead.
+"""
+
+import pytest
+
+from timeblock import create_app
+from timeblock.action import Action
+from timeblock.shard import ShardRouter
+from timeblock.sql import Database
+
+
+def test_path(tmp_path):
+    """Test that tenant names are mapped to files and validated."""
+    router = ShardRouter(str(tmp_path))
+    assert router.path("alice") == str(tmp_path / "alice.sql")
+    for tenant in ("../etc", "", "a b", "a" * 65):
+        with pytest.raises(ValueError):
+            router.path(tenant)
+
+
+def test_isolation(tmp_path):
+    """Test that tenants don't see each other's actions or graphs."""
+    router = ShardRouter(str(tmp_path))
+    with router.connect("alice") as database:
+        database.add_action(Action("write report"))
+    with router.connect("bob") as database:
+        assert database.get_actions() == []
+    with router.connect("alice") as database:
+        assert [a.desc for a in database.get_actions()] == ["write report"]
+    assert router.tenants() == ["alice", "bob"]
+    with router.connect("alice") as database:
+        graph = database.dependency_graph()
+    with router.connect("alice") as database:
+        assert database.dependency_graph() is graph
+    with router.connect("bob") as database:
+        assert database.dependency_graph() is not graph
+    router.close()
+
+
+def test_eviction(tmp_path):
+    """Test that the pool stays within max_open handles."""
+    router = ShardRouter(str(tmp_path), max_open=2)
+    for tenant in ("a", "b", "c"):
+        with router.connect(tenant):
+            pass
+    assert list(router._shards) == ["b", "c"]
+    with router.connect("b"), router.connect("d"):
+        assert list(router._shards) == ["b", "d"]
+    router.close()
+    assert not router._shards
+
+
+def test_catch_up(tmp_path):
+    """Test that a handle applies logged events as it opens."""
+    router = ShardRouter(str(tmp_path))
+    with router.connect("alice") as database:
+        database.add_action(Action("write report"))
+    router.close()
+    with Database(router.path("alice")) as database:
+        database.write_query(
+            """
+            INSERT INTO action_event(action_id, kind, data, created)
+            VALUES (1, 'delete', '{}', 0)
+            """
+        )
+    with router.connect("alice") as database:
+        assert database.get_actions() == []
+    router.close()
+
+
+def test_admin_query(tmp_path):
+    """Test that admin_query() attaches every shard, past SQLite's limit."""
+    router = ShardRouter(str(tmp_path))
+    tenants = [f"t{i:02}" for i in range(12)]
+    for count, tenant in enumerate(tenants):
+        with router.connect(tenant) as database:
+            for i in range(count):
+                database.add_action(Action(f"action {i}"))
+    router.close()
+    rows = router.admin_query("SELECT COUNT(*) FROM {shard}.action")
+    assert rows == [(tenant, i) for i, tenant in enumerate(tenants)]
+
+
+def test_admin_routes(tmp_path):
+    """Test that admin routes aren't served under a tenant prefix."""
+    app = create_app(
+        {
+            "DATABASE": str(tmp_path / "db.sql"),
+            "SHARD_DIRECTORY": str(tmp_path / "shards"),
+            "ADMIN_TOKEN": "secret",
+        }
+    )
+    client = app.test_client()
+    client.environ_base["HTTP_AUTHORIZATION"] = "Bearer secret"
+    client.post("/t/alice/", data={"action": "write report"})
+    assert client.get("/t/alice/admin/tenants").status_code == 404
+    assert client.get("/t/alice/admin/maintenance").status_code == 404
+    assert client.get("/admin/tenants").get_json() == {"alice": 1}
+    stats = client.get("/admin/maintenance?tenant=alice").json["stats"]
+    assert stats["page_count"] > 0
+    response = client.get("/admin/maintenance?tenant=../db")
+    assert response.status_code == 404
@@ -0,0 +1,131 @@
+"""
+Tests for schedule simulation.
+
+This module uses pytest's built-in tmp_path fixture for the database.
+
+The tests cover the following:
+    - Candidate orders respect dependencies and are the same for a seed.
+    - Working hours move actions that don't fit to the next day.
+    - The best schedules come first, whether scored in this process or
+        on a pool of workers.
+    - A timeout returns the best schedules scored so far.
+    - Invalid problems and counts raise ValueError.
+    - A pool broken by a dead worker is replaced.
+    - POST /simulate arranges the unscheduled actions.
+"""
+
+import pickle
+from datetime import datetime
+
+import pytest
+
+from timeblock import create_app
+from timeblock.action import Action
+from timeblock.simulate import Problem, Simulator, simulate
+from timeblock.sql import TimeblockDB
+
+HOUR = 3600
+
+
+def test_order():
+    """Test that orders respect dependencies and depend only on seed."""
+    problem = Problem(range(1, 7), [HOUR] * 6, [(3, 1), (1, 2), (4, 2)])
+    for seed in range(50):
+        order = [problem.ids[node] for node in problem.order(seed)]
+        assert order.index(3) < order.index(1) < order.index(2)
+        assert order.index(4) < order.index(2)
+    copy = pickle.loads(pickle.dumps(problem))
+    assert copy.order(7) == problem.order(7)
+    assert len(problem) == 6
+
+
+def test_starts():
+    """Test that actions that don't fit in the day start the next one."""
+    problem = Problem([1, 2, 3], [5 * HOUR, 2 * HOUR, 3 * HOUR])
+    assert problem.starts([0, 1, 2]) == [0, 5 * HOUR, 7 * HOUR]
+    problem.hours_per_day = 8
+    assert problem.starts([0, 1, 2]) == [0, 5 * HOUR, 24 * HOUR]
+    assert problem.starts([2, 0, 1]) == [0, 3 * HOUR, 24 * HOUR]
+
+
+def test_simulate():
+    """Test that the best schedules are found in process and on a pool."""
+    problem = Problem(
+        [1, 2, 3, 4],
+        [HOUR, 2 * HOUR, HOUR / 2, HOUR],
+        [(2, 4)],
+        deadlines=[None, None, None, 3 * HOUR],
+        weights=[1, 1, 1, 3],
+    )
+    local = simulate(problem, candidates=200, top=3, workers=0)
+    assert local["complete"] and local["scored"] == 200
+    best = local["schedules"]
+    assert best[0]["order"] == [2, 4, 3, 1]
+    assert best[0]["starts"] == [0, 2 * HOUR, 3 * HOUR, 3.5 * HOUR]
+    assert [s["score"] for s in best] == sorted(s["score"] for s in best)
+    with Simulator(workers=1) as simulator:
+        pooled = simulator.run(problem, candidates=200, top=3)
+    assert pooled["schedules"] == best
+
+
+def test_timeout():
+    """Test that a timeout returns the best schedules found so far."""
+    problem = Problem(range(200), [60.0] * 200)
+    result = simulate(problem, candidates=10**9, workers=0, timeout=0.1)
+    assert not result["complete"]
+    assert 0 < result["scored"] < 10**9
+    assert len(result["schedules"]) == 5
+
+
+def test_invalid():
+    """Test that cycles and mismatched arrays raise ValueError."""
+    with pytest.raises(ValueError):
+        simulate(Problem([1, 2], [60, 60], [(1, 2), (2, 1)]), workers=0)
+    with pytest.raises(ValueError):
+        Problem([1, 2], [60])
+    with pytest.raises(ValueError):
+        Problem([1], [60], hours_per_day=25)
+    for arguments in ({"top": 0}, {"candidates": 0}):
+        with pytest.raises(ValueError):
+            simulate(Problem([1], [60]), workers=0, **arguments)
+
+
+def test_broken_pool():
+    """Test that a pool with a dead worker is replaced."""
+    problem = Problem([1, 2], [60, 60])
+    with Simulator(workers=1) as simulator:
+        simulator.run(problem, candidates=10)
+        # pylint: disable=protected-access
+        broken = simulator._executor
+        for process in list(broken._processes.values()):
+            process.kill()
+            process.join()
+        result = simulator.run(problem, candidates=10)
+        assert result["complete"]
+        assert simulator._executor is not broken
+
+
+def test_route(tmp_path):
+    """Test that POST /simulate arranges the unscheduled actions."""
+    database = str(tmp_path / "db.sql")
+    app = create_app({"DATABASE": database, "SIMULATE_WORKERS": 0})
+    with TimeblockDB(database) as tb_db:
+        tb_db.add_actions([Action("first"), Action("second"), Action("third")])
+        tb_db.add_dependency(1, 3)
+        tb_db.schedule_action(2, datetime(2023, 1, 1))
+    client = app.test_client()
+    response = client.post(
+        "/simulate",
+        json={"start": "2023-01-16T09:00", "candidates": 20, "top": 1},
+    )
+    assert response.status_code == 200
+    (schedule,) = response.get_json()["schedules"]
+    assert schedule["order"] == [3, 1]
+    assert schedule["starts"] == ["2023-01-16T09:00:00", "2023-01-16T09:30:00"]
+    assert client.post("/simulate", json={"ids": [9]}).status_code == 404
+    assert client.post("/simulate", data="[]").status_code == 400
+    assert client.post("/simulate", json={"top": 0}).status_code == 400
+    assert (
+        client.post("/simulate", json={"candidates": "many"}).status_code
+        == 400
+    )
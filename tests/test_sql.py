@@ -17,12 +17,33 @@ This module contains the following tests:
     - test_script: Test scripts.
     - test_error_msg: Corrupts DB file to test error messages.
     - test_add_action: Test add_action method.
+    - test_transaction: Test writes are committed or rolled back together.
+    - test_event_log: Test edits, soft-deletes and restores are logged,
+        and unknown event kinds are refused.
+    - test_rebuild_projection: Test the action table is rebuilt from the
+        latest checkpoint and the events after it.
+    - test_migrate_app_data: Test old app_data and timer tables are
+        upgraded to a single keyed row.
+    - test_migrate_action_sync: Test existing actions get a uuid and
+        the time and seq of their latest event.
+    - test_timer_processes: Test concurrent processes can't start or stop
+        the timer twice, and agree on its running time.
+    - test_switch_timer: Test a switch that can't start the timer is
+        rolled back.
+    - test_dependencies: Test dependencies refuse cycles, are shared
+        between connections and order planned actions.
+    - test_plan_taken: Test planned actions move past taken starts, and
+        chains that can't be scheduled are left alone.
 """
 
 
+import multiprocessing
 from contextlib import redirect_stdout
+from datetime import datetime, timedelta
 from io import StringIO
 
+import pytest
+
 from constants import TEST_DB_PATH
 from timeblock import sql
 from timeblock.action import Action
@@ -210,3 +231,334 @@ def test_add_action(tb_db: sql.TimeblockDB) -> None:
         action = Action("test")
         tb_db.add_action(action)
         assert "test" in tb_db.read_query("SELECT * FROM action")[0]
+
+
+def test_transaction(tb_db: sql.TimeblockDB) -> None:
+    """
+    Verify that writes in a transaction are committed or rolled back.
+
+    Callbacks registered with on_commit() only run after a commit.
+
+    Args:
+        tb_db (sql.TimeblockDB): TimeblockDB instance.
+    """
+    committed = []
+    with tb_db:
+        with pytest.raises(RuntimeError), tb_db.transaction():
+            tb_db.add_actions([Action("first"), Action("second")])
+            tb_db.on_commit(lambda: committed.append("rolled back"))
+            raise RuntimeError
+        assert tb_db.read_query("SELECT * FROM action") == []
+
+        with tb_db.transaction():
+            tb_db.add_actions([Action("first"), Action("second")])
+            tb_db.on_commit(lambda: committed.append("committed"))
+            assert committed == []
+        assert committed == ["committed"]
+
+    with tb_db:
+        assert len(tb_db.read_query("SELECT * FROM action")) == 2
+
+
+def test_event_log(tb_db: sql.TimeblockDB) -> None:
+    """
+    Verify that changes are logged and deleted actions can be restored.
+
+    Args:
+        tb_db (sql.TimeblockDB): TimeblockDB instance.
+    """
+    with tb_db:
+        first, second = tb_db.add_actions([Action("first"), Action("second")])
+        assert tb_db.update_action(first, desc="renamed")
+        assert not tb_db.update_action(first, desc="second")
+        assert tb_db.schedule_action(first, datetime(2023, 1, 16, 9))
+        assert tb_db.delete_action(second)
+        assert not tb_db.delete_action(second)
+        assert tb_db.add_action(Action("third")) == 3
+        assert tb_db.read_query("SELECT id, desc FROM action") == [
+            (1, "renamed"),
+            (3, "third"),
+        ]
+        assert tb_db.restore_action(second)
+        assert not tb_db.restore_action(second)
+        assert tb_db.get_action(second).desc == "second"
+        assert [event["kind"] for event in tb_db.history(first)] == [
+            "create",
+            "update",
+            "update",
+        ]
+        assert tb_db.history(first)[2]["data"] == {
+            "start_datetime": datetime(2023, 1, 16, 9).timestamp()
+        }
+        with pytest.raises(ValueError):
+            tb_db.record("rename", first, {"desc": "other"})
+
+
+def test_rebuild_projection(tb_db: sql.TimeblockDB) -> None:
+    """
+    Verify that the projection is rebuilt from checkpoint and events.
+
+    Only events after the latest checkpoint are replayed, and catch_up()
+    applies events that were logged but not projected.
+
+    Args:
+        tb_db (sql.TimeblockDB): TimeblockDB instance.
+    """
+    with tb_db:
+        tb_db.add_actions([Action(f"action {i}") for i in range(10)])
+        tb_db.delete_action(4)
+        assert tb_db.checkpoint() == 11
+        tb_db.update_action(1, est_duration=timedelta(minutes=5))
+        tb_db.start_timer(2, datetime(2023, 1, 16, 9))
+        tb_db.stop_timer(datetime(2023, 1, 16, 9, 30))
+        expected = tb_db.read_query("SELECT * FROM action")
+
+        tb_db.write_query("DELETE FROM action")
+        assert tb_db.rebuild_projection() == 3
+        assert tb_db.read_query("SELECT * FROM action") == expected
+        assert tb_db.get_action(2).actual_duration == timedelta(minutes=30)
+
+        tb_db.write_query(
+            """
+            INSERT INTO action_event(action_id, kind, data, created)
+            VALUES (1, 'delete', '{}', 0)
+            """
+        )
+        assert tb_db.catch_up() == 1
+        assert tb_db.get_action(1) is None
+        assert tb_db.catch_up() == 0
+
+
+def test_migrate_app_data(database) -> None:
+    """
+    Verify that app_data without a key and the timer table are migrated.
+
+    Args:
+        database (sql.Database): Database instance.
+    """
+    with database:
+        database.script(
+            """
+            CREATE TABLE action(
+                id INTEGER PRIMARY KEY,
+                desc TEXT NOT NULL UNIQUE,
+                est_duration INTEGER,
+                actual_duration INTEGER,
+                start_datetime REAL UNIQUE
+            );
+            INSERT INTO action(desc) VALUES ('first'), ('second');
+            CREATE TABLE app_data(selected INTEGER);
+            INSERT INTO app_data VALUES (1);
+            CREATE TABLE timer(id INTEGER PRIMARY KEY, action_id, started);
+            INSERT INTO timer VALUES (1, 2, 1673859600.0);
+            """
+        )
+    with sql.TimeblockDB(TEST_DB_PATH) as tb_db:
+        assert tb_db.read_query("SELECT * FROM app_data") == [
+            (1, 2, 1673859600.0)
+        ]
+        assert tb_db.running_timer()[1].started == datetime.fromtimestamp(
+            1673859600.0
+        )
+        assert ("timer",) not in tb_db.read_query(
+            "SELECT name FROM sqlite_master WHERE type='table'"
+        )
+        changes, seq, _more = tb_db.changes_since(0)
+        assert [change[3] for change in changes] == ["first", "second"]
+        assert seq == 2
+
+
+def test_migrate_action_sync(tb_db: sql.TimeblockDB) -> None:
+    """
+    Verify that actions from before syncing are given sync columns.
+
+    Args:
+        tb_db (sql.TimeblockDB): TimeblockDB instance.
+    """
+    with tb_db:
+        tb_db.add_actions([Action("first"), Action("second")])
+        tb_db.update_action(1, desc="renamed")
+        tb_db.script(
+            """
+            DROP INDEX action_uuid;
+            DROP INDEX action_seq;
+            ALTER TABLE action DROP COLUMN uuid;
+            ALTER TABLE action DROP COLUMN updated;
+            ALTER TABLE action DROP COLUMN seq;
+            """
+        )
+        assert not tb_db.check_for_db()
+    with tb_db:
+        assert tb_db.check_for_db()
+        rows = tb_db.read_query("SELECT id, uuid, seq FROM action")
+        assert [(row[0], row[2]) for row in rows] == [(1, 3), (2, 2)]
+        assert len({row[1] for row in rows}) == 2
+        expected = tb_db.read_query("SELECT * FROM action")
+        tb_db.rebuild_projection()
+        assert tb_db.read_query("SELECT * FROM action") == expected
+
+
+def _timer_worker(barrier, results, task: str, action_id: int) -> None:
+    """Wait for every worker, then start or stop the timer once."""
+    with redirect_stdout(StringIO()), sql.TimeblockDB(TEST_DB_PATH) as db:
+        barrier.wait()
+        if task == "start":
+            results.put(db.start_timer(action_id))
+        else:
+            results.put(db.stop_timer() is not None)
+
+
+def _run_workers(task: str, count: int) -> list[bool]:
+    """Run count worker processes at once and return their results."""
+    barrier = multiprocessing.Barrier(count)
+    results: multiprocessing.Queue = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(
+            target=_timer_worker, args=(barrier, results, task, i % 2 + 1)
+        )
+        for i in range(count)
+    ]
+    for worker in workers:
+        worker.start()
+    outcome = [results.get(timeout=30) for _ in workers]
+    for worker in workers:
+        worker.join()
+    return outcome
+
+
+def test_timer_processes(tb_db: sql.TimeblockDB) -> None:
+    """
+    Verify that the timer is started and stopped once across processes.
+
+    Several processes try to start the timer at the same moment, then
+    several try to stop it. Exactly one of each succeeds, and the time
+    is added to the action once.
+
+    Args:
+        tb_db (sql.TimeblockDB): TimeblockDB instance.
+    """
+    with tb_db:
+        tb_db.add_actions([Action("first"), Action("second")])
+    assert sum(_run_workers("start", 6)) == 1
+    with tb_db:
+        action_id, stopwatch = tb_db.running_timer()
+        assert tb_db.selected() == action_id
+        assert not tb_db.select_action(3 - action_id)
+        assert timedelta(0) <= stopwatch.check() < timedelta(seconds=30)
+        later = stopwatch.started + timedelta(minutes=30)
+        assert stopwatch.check(later) == timedelta(minutes=30)
+        tb_db.write_query(
+            "UPDATE app_data SET started = ?",
+            ((datetime.now() - timedelta(minutes=5)).timestamp(),),
+        )
+    assert sum(_run_workers("stop", 6)) == 1
+    with tb_db:
+        assert tb_db.running_timer() is None
+        assert tb_db.read_query("SELECT SUM(actual_duration) FROM action") == [
+            (300,)
+        ]
+        assert [e["kind"] for e in tb_db.history(action_id)][1:] == [
+            "start",
+            "stop",
+        ]
+
+
+def test_switch_timer(tb_db: sql.TimeblockDB, monkeypatch) -> None:
+    """
+    Verify that a failed switch leaves the running timer alone.
+
+    Args:
+        tb_db (sql.TimeblockDB): TimeblockDB instance.
+        monkeypatch: Pytest fixture for replacing attributes.
+    """
+    with tb_db:
+        first, second = tb_db.add_actions([Action("first"), Action("second")])
+        assert tb_db.start_timer(first)
+        assert tb_db.switch_timer(second) is not None
+        assert tb_db.running_timer()[0] == second
+        monkeypatch.setattr(tb_db, "start_timer", lambda *args: False)
+        with pytest.raises(sql.TimerError):
+            tb_db.switch_timer(first)
+        assert tb_db.running_timer()[0] == second
+
+
+def test_dependencies(tb_db: sql.TimeblockDB) -> None:
+    """
+    Verify that dependencies refuse cycles and order planned actions.
+
+    A graph shared with another connection is reloaded once that
+    connection changes the dependencies, and after a rollback.
+
+    Args:
+        tb_db (sql.TimeblockDB): TimeblockDB instance.
+    """
+    minutes = [10, 20, 30, None]
+    with tb_db:
+        tb_db.add_actions(
+            Action(f"action {i}", est_duration=m and timedelta(minutes=m))
+            for i, m in enumerate(minutes)
+        )
+        with redirect_stdout(StringIO()) as output:
+            assert tb_db.add_dependency(1, 3)
+            assert tb_db.add_dependency(3, 2)
+            assert not tb_db.add_dependency(2, 1)
+            assert not tb_db.add_dependency(1, 9)
+        assert "Error: 1 already depends on 2" in output.getvalue()
+        assert tb_db.dependencies(1) == [3]
+        assert tb_db.critical_path() == (timedelta(minutes=60), [2, 3, 1])
+
+        with pytest.raises(RuntimeError), tb_db.transaction():
+            tb_db.add_dependency(4, 1)
+            raise RuntimeError
+        assert tb_db.graph is not None and tb_db.graph.version is None
+        assert tb_db.critical_path()[1] == [2, 3, 1]
+
+        with sql.TimeblockDB(TEST_DB_PATH, graph=tb_db.graph) as other:
+            assert other.remove_dependency(1, 3)
+            assert not other.remove_dependency(1, 3)
+        assert tb_db.dependencies(1) == []
+        assert tb_db.add_dependency(2, 1)
+
+        start = datetime(2023, 1, 16, 9)
+        assert tb_db.plan(start) == [1, 2, 3, 4]
+        assert [action.start for action in tb_db.get_actions()] == [
+            start + timedelta(minutes=m) for m in (0, 10, 30, 60)
+        ]
+
+
+def test_plan_taken(tb_db: sql.TimeblockDB) -> None:
+    """
+    Verify that plan() moves past taken starts and skips blocked chains.
+
+    An action whose start is taken moves to the end of the action there.
+    If it still can't be scheduled, the actions depending on it aren't
+    scheduled either, even if their own start would be free.
+
+    Args:
+        tb_db (sql.TimeblockDB): TimeblockDB instance.
+    """
+    start = datetime(2023, 1, 16, 9)
+    with tb_db:
+        tb_db.add_actions(
+            Action(f"action {i}", est_duration=timedelta(minutes=m))
+            for i, m in enumerate([20, 10, 10])
+        )
+        assert tb_db.schedule_action(1, start)
+        assert tb_db.add_dependency(3, 2)
+        assert tb_db.plan(start) == [2, 3]
+        assert [action.start for action in tb_db.get_actions()] == [
+            start + timedelta(minutes=m) for m in (0, 20, 30)
+        ]
+
+        tb_db.write_query("UPDATE action SET start_datetime = NULL")
+        tb_db.add_actions(
+            [Action("empty"), Action("before", timedelta(minutes=90))]
+        )
+        assert tb_db.update_action(4, est_duration=timedelta(0))
+        assert tb_db.schedule_action(4, start)
+        assert tb_db.schedule_action(5, start - timedelta(hours=1))
+        assert tb_db.add_dependency(2, 1)
+        assert tb_db.add_dependency(2, 5)
+        with redirect_stdout(StringIO()):
+            assert tb_db.plan(start) == []
+        assert tb_db.get_action(2).start is None
@@ -3,9 +3,10 @@ Tests for `Stopwatch` class.
 
 The test covers the following:
     - Start the Stopwatch and check that it returns a timedelta.
+    - A Stopwatch created from a start time measures from it.
 """
 
-from datetime import timedelta
+from datetime import datetime, timedelta
 from timeblock.stopwatch import Stopwatch
 
 
@@ -14,3 +15,10 @@ def test_start():
     watch = Stopwatch()
     watch.start()
     assert isinstance(watch.check(), timedelta)
+
+
+def test_check_from_stored_start():
+    """Test that a Stopwatch created from a start time counts from it."""
+    watch = Stopwatch(datetime(2023, 1, 16, 9))
+    assert watch.check(datetime(2023, 1, 16, 9, 30)) == timedelta(minutes=30)
+    assert Stopwatch().check() == timedelta(0)
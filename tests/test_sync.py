@@ -0,0 +1,226 @@
+"""
+Tests for syncing actions between instances.
+
+This module uses pytest's built-in tmp_path fixture for the databases.
+
+The tests cover the following:
+    - Changes since a seq include each action once, in its latest
+        state, and deleted actions as tombstones.
+    - The last writer wins when merging, with ties decided by the
+        values, and tombstones keep older changes out, even for actions
+        that were never seen.
+    - Two instances edited offline end up with the same actions, even
+        in batches of one, and a second sync exchanges nothing.
+    - Actions added on both instances with the same description or
+        start are renamed alike, and a second sync exchanges nothing.
+    - POST /sync is disabled without a SYNC_TOKEN, refuses requests
+        without it and refuses invalid bodies.
+"""
+
+import json
+import math
+from datetime import datetime
+
+from timeblock import create_app
+from timeblock.action import Action
+from timeblock.sql import SYNC_FIELDS, TimeblockDB
+from timeblock.sync import respond, sync
+
+AUTH = {"Authorization": "Bearer secret"}
+
+
+def test_changes_since(tmp_path):
+    """Test that only the latest state of changed actions is returned."""
+    with TimeblockDB(str(tmp_path / "db.sql")) as tb_db:
+        tb_db.add_actions([Action("first"), Action("second"), Action("third")])
+        tb_db.update_action(1, desc="renamed")
+        tb_db.delete_action(2)
+        changes, seq, more = tb_db.changes_since(0)
+        assert [change[3:4] for change in changes] == [
+            ["third"],
+            ["renamed"],
+            [],
+        ]
+        assert [change[1] for change in changes] == [3, 4, 5]
+        assert (seq, more) == (5, False)
+        assert len(changes[0]) == len(SYNC_FIELDS) and len(changes[2]) == 3
+        assert tb_db.changes_since(0, limit=2)[1:] == (4, True)
+        assert tb_db.changes_since(4) == ([changes[2]], 5, False)
+        assert tb_db.changes_since(5) == ([], 5, False)
+        tb_db.restore_action(2)
+        (restored,), _seq, _more = tb_db.changes_since(5)
+        assert restored[0] == changes[2][0] and restored[3] == "second"
+        assert tb_db.current_changes([restored[0], "unknown"]) == [restored]
+
+
+def test_merge_changes(tmp_path):
+    """Test that the change updated last wins."""
+    with TimeblockDB(str(tmp_path / "db.sql")) as tb_db:
+        merged = tb_db.merge_changes(
+            [
+                ["a", 1, 10.0, "first", None, None, None],
+                ["b", 2, 10.0, "second", None, None, None],
+                ["c", 3, 10.0, "third", None, None, None],
+            ]
+        )
+        assert merged == {
+            "applied": 3,
+            "stale": 0,
+            "renamed": 0,
+            "conflicts": 0,
+            "rejected": [],
+        }
+        merged = tb_db.merge_changes(
+            [
+                ["a", 4, 9.0, "older", None, None, None],
+                ["a", 5, 10.0, "tied", None, None, None],
+                ["b", 6, 11.0, "newer", 60, None, None],
+                ["c", 7, 11.0],
+                ["c", 8, 10.5, "resurrected", None, None, None],
+                ["d", 9, 10.0],
+                ["e", 10, 10.0, "newer", None, None, None],
+            ]
+        )
+        assert merged == {
+            "applied": 5,
+            "stale": 2,
+            "renamed": 1,
+            "conflicts": 0,
+            "rejected": ["a", "e"],
+        }
+        assert tb_db.read_query(
+            "SELECT uuid, desc, est_duration, updated FROM action ORDER BY id"
+        ) == [
+            ("a", "tied", None, 10.0),
+            ("b", "newer", 60, 11.0),
+            ("e", "newer (e)", None, math.nextafter(11.0, math.inf)),
+        ]
+        changes = tb_db.changes_since(0)[0]
+        assert [change[0] for change in changes if len(change) == 3] == [
+            "c",
+            "d",
+        ]
+        assert tb_db.merge_changes(
+            [["d", 11, 9.0, "older", None, None, None]]
+        )["stale"] == 1
+        assert tb_db.merge_changes(
+            [["a", 1, 10.0, "first", None, None, None]]
+        )["rejected"] == ["a"]
+
+
+def _sync_state(tb_db: TimeblockDB) -> list[tuple]:
+    """Return what both instances should agree on, seq being local."""
+    return sorted(
+        (change[0], change[2], *change[3:])
+        for change in tb_db.changes_since(0)[0]
+    )
+
+
+def test_sync(tmp_path):
+    """Test that instances edited offline converge."""
+    server = str(tmp_path / "server.sql")
+    client = str(tmp_path / "client.sql")
+    peer = create_app(
+        {"DATABASE": server, "SYNC_TOKEN": "secret"}
+    ).test_client()
+
+    def post(url, payload):
+        assert url == "http://server/sync"
+        return peer.post("/sync", json=payload, headers=AUTH).get_json()
+
+    with TimeblockDB(server) as tb_db:
+        tb_db.add_actions([Action(f"server {i}") for i in range(5)])
+    with TimeblockDB(client) as tb_db:
+        tb_db.add_actions([Action(f"client {i}") for i in range(3)])
+        report = sync(tb_db, "http://server/sync", batch=2, post=post)
+        # the server had more to send while merging, so what it was sent
+        # comes back once
+        assert report == {
+            "pushed": 3,
+            "pulled": 8,
+            "applied": 5,
+            "stale": 3,
+            "renamed": 0,
+            "conflicts": 0,
+        }
+
+        tb_db.update_action(1, desc="client renamed")
+        tb_db.delete_action(2)
+        with TimeblockDB(server) as other:
+            other.update_action(2, desc="server renamed")
+            other.delete_action(3)
+            other.add_action(Action("server new"))
+        report = sync(tb_db, "http://server/sync", batch=1, post=post)
+        assert report["pushed"] == 2 and report["conflicts"] == 0
+        assert sync(tb_db, "http://server/sync", post=post)["pulled"] == 0
+
+        with TimeblockDB(server) as other:
+            assert _sync_state(other) == _sync_state(tb_db)
+        descs = sorted(action.desc for action in tb_db.get_actions())
+        assert descs == [
+            "client 2",
+            "client renamed",
+            "server 0",
+            "server 3",
+            "server 4",
+            "server new",
+            "server renamed",
+        ]
+
+
+def test_sync_clash(tmp_path):
+    """Test that instances adding the same action offline converge."""
+    server = str(tmp_path / "server.sql")
+    client = str(tmp_path / "client.sql")
+
+    def post(_url, payload):
+        with TimeblockDB(server) as other:
+            response = respond(other, json.loads(json.dumps(payload)))
+        return json.loads(json.dumps(response))
+
+    with TimeblockDB(server) as tb_db:
+        tb_db.add_action(Action("lunch"))
+        tb_db.add_action(Action("server"))
+        tb_db.schedule_action(2, datetime(2023, 1, 16, 12))
+    with TimeblockDB(client) as tb_db:
+        tb_db.add_action(Action("lunch"))
+        tb_db.add_action(Action("client"))
+        tb_db.schedule_action(2, datetime(2023, 1, 16, 12))
+        report = sync(tb_db, "http://server/sync", post=post)
+        assert report["renamed"] == 2 and report["conflicts"] == 0
+        report = sync(tb_db, "http://server/sync", post=post)
+        assert report["pushed"] == report["pulled"] == 0
+        with TimeblockDB(server) as other:
+            assert _sync_state(other) == _sync_state(tb_db)
+        descs = sorted(action.desc for action in tb_db.get_actions())
+        assert len(descs) == 4 and descs.count("lunch") == 1
+        starts = [action.start for action in tb_db.get_actions()]
+        assert starts.count(datetime(2023, 1, 16, 12)) == 1
+
+
+def test_route(tmp_path):
+    """Test that POST /sync needs the token and refuses invalid bodies."""
+    database = str(tmp_path / "db.sql")
+    client = create_app({"DATABASE": database}).test_client()
+    assert client.post("/sync", json={}, headers=AUTH).status_code == 404
+    client = create_app(
+        {"DATABASE": database, "SYNC_TOKEN": "secret"}
+    ).test_client()
+    assert client.post("/sync", json={}).status_code == 401
+    wrong = {"Authorization": "Bearer guess"}
+    assert client.post("/sync", json={}, headers=wrong).status_code == 401
+    client.environ_base["HTTP_AUTHORIZATION"] = AUTH["Authorization"]
+    assert client.post("/sync", data="[]").status_code == 400
+    assert client.post("/sync", json={"changes": {}}).status_code == 400
+    assert client.post("/sync", json={"changes": [["a"]]}).status_code == 400
+    response = client.post(
+        "/sync", json={"changes": [["a", 1, "later", "x", 0, 0, 0]]}
+    )
+    assert response.status_code == 400
+    response = client.post("/sync", json={})
+    assert response.get_json() == {
+        "changes": [],
+        "seq": 0,
+        "more": False,
+        "merged": {"applied": 0, "stale": 0, "renamed": 0, "conflicts": 0},
+    }
@@ -7,18 +7,186 @@ To run the app, run the following command in the terminal:
 
 The app will be available at http://localhost:5000.
 
+Flask and the web modules are only imported by create_app(), so the
+non-web parts of the package, such as timeblock.action, timeblock.sql
+and timeblock.stopwatch, can be imported without paying for them.
+Submodules are also loaded lazily on attribute access, so
+'import timeblock' alone imports nothing else.
+
 Please note that Timeblock is currently a work-in-progress.
 """
+from importlib import import_module
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from flask import Flask
+
+
+SUBMODULES = {
+    "action",
+    "broadcast",
+    "cache",
+    "cli",
+    "compress",
+    "graph",
+    "loadtest",
+    "maintenance",
+    "profiling",
+    "ratelimit",
+    "shard",
+    "simulate",
+    "sql",
+    "stopwatch",
+    "sync",
+    "views",
+}
+
+
+def __getattr__(name: str):
+    """Import submodules on first access, e.g. timeblock.sql."""
+    if name in SUBMODULES:
+        return import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-from flask import Flask
+def create_app(config: Optional[dict] = None) -> "Flask":
+    """
+    Create the Timeblock Flask app.
 
-from timeblock.views import ROUTES
+    Args:
+        config (dict): Settings applied on top of the defaults:
+            DATABASE: Database file used for requests to '/'.
+            SHARD_DIRECTORY: Optional directory of per-tenant database
+                files, served under '/t/<tenant>/'.
+            ACTION_CACHE_SIZE: Number of actions held in the cache.
+            MAINTENANCE_INTERVAL: Seconds between background compactions
+                of DATABASE and the tenant databases, or None to only
+                compact on request.
+            SNAPSHOT_DIRECTORY: Directory for backups; scheduled runs
+                also take a snapshot when this is set.
+            PROFILE_DIRECTORY: Directory for request profiles, or None
+                to disable profiling. Requests sending the
+                X-Timeblock-Profile header are profiled.
+            PROFILE_SAMPLE_RATE: Share of other requests profiled.
+            PROFILE_MAX_FILES: Number of profiles kept.
+            PROFILE_MAX_BYTES: Total size of profile files kept.
+            RATE_LIMIT: Writes a second allowed for each client, or None
+                for no limit. Clients over it get 429 responses.
+            RATE_LIMIT_BURST: Writes a client may make at once.
+            WRITE_CONCURRENCY: Writes handled at once, or None for no
+                limit. Writes that can't get a slot get 503 responses.
+            WRITE_QUEUE_SIZE: Writes allowed to wait for a slot.
+            WRITE_QUEUE_TIMEOUT: Seconds a write waits for a slot.
+            SIMULATE_WORKERS: Processes scoring schedules for
+                '/simulate', the number of CPUs if None, or 0 to score
+                them in the request thread.
+            SIMULATE_MAX_CANDIDATES: Most schedules a request may try.
+            SIMULATE_TIMEOUT: Most seconds a request may take.
+            SYNC_TOKEN: Secret peers send to '/sync', or None to
+                disable it.
+            ADMIN_TOKEN: Secret sent to the '/admin' routes, or None to
+                disable them.
 
+    Returns:
+        Flask: The configured app.
+    """
+    # pylint: disable=import-outside-toplevel
+    from flask import Flask
+
+    from timeblock import compress, views
+    from timeblock.broadcast import Broadcaster
+    from timeblock.cache import ActionCache
+    from timeblock.graph import DependencyGraph
+    from timeblock.maintenance import MaintenanceScheduler
+    from timeblock.profiling import RequestProfiler
+    from timeblock.ratelimit import RateLimiter
+    from timeblock.shard import ShardRouter
+    from timeblock.simulate import Simulator
+    from timeblock.sql import TimeblockDB
 
-def main(database="db.sql"):
-    """Run the Timeblock app."""
     app = Flask(__name__)
-    app.register_blueprint(ROUTES)
-    app.config["DATABASE"] = database
-    app.run()
+    app.config["DATABASE"] = "db.sql"
+    app.config["SHARD_DIRECTORY"] = None
+    app.config["ACTION_CACHE_SIZE"] = 4096
+    app.config["MAINTENANCE_INTERVAL"] = None
+    app.config["SNAPSHOT_DIRECTORY"] = None
+    app.config["PROFILE_DIRECTORY"] = None
+    app.config["PROFILE_SAMPLE_RATE"] = 0.0
+    app.config["PROFILE_MAX_FILES"] = 100
+    app.config["PROFILE_MAX_BYTES"] = 50_000_000
+    app.config["RATE_LIMIT"] = None
+    app.config["RATE_LIMIT_BURST"] = 10
+    app.config["WRITE_CONCURRENCY"] = None
+    app.config["WRITE_QUEUE_SIZE"] = 64
+    app.config["WRITE_QUEUE_TIMEOUT"] = 5.0
+    app.config["SIMULATE_WORKERS"] = None
+    app.config["SIMULATE_MAX_CANDIDATES"] = 1_000_000
+    app.config["SIMULATE_TIMEOUT"] = 10.0
+    app.config["SYNC_TOKEN"] = None
+    app.config["ADMIN_TOKEN"] = None
+    app.config.update(config or {})
+
+    # apply events written since the projection was last updated, e.g. by
+    # a process that stopped between logging and projecting them
+    with TimeblockDB(app.config["DATABASE"]) as database:
+        database.catch_up()
+    app.register_blueprint(views.ROUTES)
+    app.register_blueprint(views.ADMIN)
+    compress.init_app(app)
+    # compile templates now rather than on the first request
+    app.jinja_env.get_template("actions.html")
+    app.config["ACTION_CACHE"] = ActionCache(app.config["ACTION_CACHE_SIZE"])
+    app.config["BROADCASTER"] = Broadcaster()
+    # kept between requests, and only reloaded when the stored
+    # dependencies were changed by another process
+    app.config["DEPENDENCY_GRAPH"] = DependencyGraph()
+    # worker processes are only started by the first simulation
+    app.config["SIMULATOR"] = Simulator(app.config["SIMULATE_WORKERS"])
+    if app.config["SHARD_DIRECTORY"]:
+        app.config["SHARDS"] = ShardRouter(
+            app.config["SHARD_DIRECTORY"],
+            broadcaster=app.config["BROADCASTER"],
+        )
+        app.register_blueprint(
+            views.ROUTES, url_prefix="/t/<tenant>", name="tenant"
+        )
+    if app.config["MAINTENANCE_INTERVAL"]:
+        app.config["MAINTENANCE"] = MaintenanceScheduler(
+            app.config["DATABASE"],
+            app.config["MAINTENANCE_INTERVAL"],
+            app.config["SNAPSHOT_DIRECTORY"],
+            shards=app.config.get("SHARDS"),
+        )
+        app.config["MAINTENANCE"].start()
+    if app.config["PROFILE_DIRECTORY"]:
+        app.config["PROFILER"] = RequestProfiler(
+            app.config["PROFILE_DIRECTORY"],
+            sample_rate=app.config["PROFILE_SAMPLE_RATE"],
+            max_profiles=app.config["PROFILE_MAX_FILES"],
+            max_bytes=app.config["PROFILE_MAX_BYTES"],
+        )
+        app.config["PROFILER"].init_app(app)
+    if app.config["RATE_LIMIT"] or app.config["WRITE_CONCURRENCY"]:
+        app.config["RATE_LIMITER"] = RateLimiter(
+            app.config["RATE_LIMIT"],
+            burst=app.config["RATE_LIMIT_BURST"],
+            concurrency=app.config["WRITE_CONCURRENCY"],
+            queue_size=app.config["WRITE_QUEUE_SIZE"],
+            queue_timeout=app.config["WRITE_QUEUE_TIMEOUT"],
+        )
+        app.config["RATE_LIMITER"].init_app(app)
+    return app
+
+
+def main(database="db.sql", shards=None, port=5000):
+    """
+    Run the Timeblock app.
+
+    Args:
+        database (str): Database file used for requests to '/'.
+        shards (str): Optional directory of per-tenant database files,
+            served under '/t/<tenant>/'.
+        port (int): Port to listen on.
+    """
+    app = create_app({"DATABASE": database, "SHARD_DIRECTORY": shards})
+    app.run(port=port)
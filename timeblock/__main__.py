@@ -1,15 +1,11 @@
-"""Allow database argument to be passed to main() from command line."""
+"""Run the command line interface, see timeblock.cli for subcommands."""
 import sys
 
-from . import main
+from timeblock.cli import run
 
 rc = 1
 try:
-    if len(sys.argv) > 1:
-        main(sys.argv[1])
-    else:
-        main()
-    rc = 0
+    rc = run(sys.argv[1:])
 except Exception as e:
     print(e)
 sys.exit(rc)
@@ -16,6 +16,7 @@ class Action:
         end
 
     Attributes:
+        id
         desc
         est_duration
         actual_duration
@@ -27,6 +28,7 @@ class Action:
         est_duration: Optional[timedelta] = None,
         start: Optional[datetime] = None,
         end: Optional[datetime] = None,
+        action_id: Optional[int] = None,
     ):
         """
         Instantiate Action object.
@@ -36,7 +38,9 @@ class Action:
 
             Optionally, datetimes can be passed to set start and end,
             or a timedelta can be passed to set est_duration.
+            action_id is the row id of the action once it is in the database.
         """
+        self.id = action_id
         self.actual_duration: Optional[timedelta] = None
         self.desc = desc
         self.est_duration = est_duration
@@ -59,7 +63,7 @@ class Action:
     @property
     def end(self):
         """Access the datetime the action ended or is expected to end."""
-        if self._start:
+        if self._start and self.est_duration:
             return self.start + self.est_duration
         return self._end
 
@@ -78,9 +82,19 @@ class Action:
         The tuple should be the same format as returned by the SQL query:
         "SELECT * FROM action"
         (id, description, estimated_duration, actual_duration, start_datetime)
+        Columns after those, used for syncing, are ignored.
 
         Args:
             action
         """
         est_duration = timedelta(seconds=action[2]) if action[2] else None
-        return cls(action[1], est_duration=est_duration)
+        start = datetime.fromtimestamp(action[4]) if action[4] else None
+        instance = cls(
+            action[1],
+            est_duration=est_duration,
+            start=start,
+            action_id=action[0],
+        )
+        if action[3] is not None:
+            instance.actual_duration = timedelta(seconds=action[3])
+        return instance
@@ -0,0 +1,192 @@
+"""
+Fan out changes to actions to Server-Sent Events clients.
+
+Broadcaster is fed by the TimeblockDB write methods and keeps a short
+history of recent events in memory for each channel, so a busy channel
+doesn't push the events of quiet ones out. Only the channels published
+to most recently keep a history. Clients block on a condition variable
+until something is published, so an idle client costs a waiting thread
+but never a database query.
+
+Event ids start from the time the Broadcaster was created, so ids from
+before a restart are older than anything in the history. A client that
+reconnects with a Last-Event-ID that is no longer in its channel's
+history is sent a 'reset' event, telling it to reload the page.
+
+Example:
+>>> from timeblock.broadcast import Broadcaster
+>>> broadcaster = Broadcaster()
+>>> event_id = broadcaster.publish("db.sql", "insert", {"id": 1})
+>>> broadcaster.events_since("db.sql", event_id - 1)
+[Event(id=..., channel='db.sql', kind='insert', data={'id': 1})]
+"""
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Iterator, NamedTuple, Optional
+
+
+RETRY_MS = 3000  # milliseconds a client waits before reconnecting
+
+
+class Event(NamedTuple):
+    """A change published to a channel, usually a database file."""
+
+    id: int
+    channel: str
+    kind: str
+    data: dict
+
+    def format(self) -> str:
+        """Return event in the text/event-stream wire format."""
+        return (
+            f"id: {self.id}\nevent: {self.kind}\n"
+            f"data: {json.dumps(self.data)}\n\n"
+        )
+
+
+class Broadcaster:
+    """
+    In-process publisher of change events with a bounded history.
+
+    Attributes:
+        history: Maximum number of recent events kept for resuming, on
+            each channel
+        channels: Maximum number of channels that keep a history
+
+    Methods:
+        publish(channel: str, kind: str, data: dict) -> int: Publish event
+        last_id() -> int: Return id of the latest event
+        events_since(channel: str, last_id: int) -> Optional[list[Event]]:
+            Return events after last_id, or None if they are forgotten
+        stream(channel: str, last_id: Optional[int]) -> Iterator[str]:
+            Yield events formatted for a text/event-stream response
+    """
+
+    def __init__(self, history: int = 1024, channels: int = 256):
+        """
+        Initialize Broadcaster object.
+
+        Args:
+            history (int): Number of recent events kept on each channel
+                for clients resuming with Last-Event-ID.
+            channels (int): Number of channels that keep a history. The
+                history of the channel published to least recently is
+                dropped first.
+        """
+        self.history = history
+        self.channels = channels
+        self._last_id = time.time_ns() // 1000
+        self._events: OrderedDict[str, deque[Event]] = OrderedDict()
+        # per channel, the newest id whose event may be lost; clients
+        # that have seen less must reset
+        self._lost: dict[str, int] = {}
+        self._forgotten = self._last_id  # for channels without a history
+        self._condition = threading.Condition()
+
+    def __repr__(self):
+        """Return string resembling constructor call."""
+        return (
+            f"Broadcaster(history={self.history}, "
+            f"channels={self.channels})"
+        )
+
+    def publish(self, channel: str, kind: str, data: dict) -> int:
+        """
+        Publish event and wake every waiting client.
+
+        Args:
+            channel (str): Channel the event belongs to.
+            kind (str): Type of change, 'insert', 'update' or 'delete'.
+            data (dict): JSON-serializable description of the change.
+
+        Returns:
+            int: Id of the new event.
+        """
+        with self._condition:
+            self._last_id += 1
+            events = self._events.get(channel)
+            if events is None:
+                events = self._events[channel] = deque(maxlen=self.history)
+                self._lost[channel] = self._forgotten
+                while len(self._events) > self.channels:
+                    old, dropped = self._events.popitem(last=False)
+                    del self._lost[old]
+                    if dropped:
+                        self._forgotten = max(self._forgotten, dropped[-1].id)
+            elif len(events) == events.maxlen:
+                self._lost[channel] = events[0].id
+            self._events.move_to_end(channel)
+            events.append(Event(self._last_id, channel, kind, data))
+            self._condition.notify_all()
+            return self._last_id
+
+    def last_id(self) -> int:
+        """Return id of the latest event."""
+        return self._last_id
+
+    def events_since(
+        self, channel: str, last_id: int
+    ) -> Optional[list[Event]]:
+        """
+        Return events on channel published after last_id.
+
+        Returns None if events after last_id may have been dropped from
+        the history, or if last_id is from another Broadcaster.
+        """
+        with self._condition:
+            return self._since(channel, last_id)
+
+    def _since(self, channel: str, last_id: int) -> Optional[list[Event]]:
+        if last_id > self._last_id:
+            return None
+        if last_id < self._lost.get(channel, self._forgotten):
+            return None
+        events = self._events.get(channel, ())
+        return [event for event in events if event.id > last_id]
+
+    def stream(
+        self,
+        channel: str,
+        last_id: Optional[int] = None,
+        keepalive: float = 15.0,
+    ) -> Iterator[str]:
+        """
+        Yield events on channel formatted for text/event-stream.
+
+        Args:
+            channel (str): Channel to follow.
+            last_id (int): Id of the last event the client has seen.
+                If None, only new events are sent.
+            keepalive (float): Seconds between comment lines sent to keep
+                idle connections open.
+
+        Starts with a 'retry' line, so response headers reach the client
+        without waiting for the first event. Yields a 'reset' event and
+        stops if the client has missed events that are no longer in the
+        history.
+        """
+        if last_id is None:
+            last_id = self._last_id
+        yield f"retry: {RETRY_MS}\n\n"
+        while True:
+            with self._condition:
+                deadline = time.monotonic() + keepalive
+                events = self._since(channel, last_id)
+                while events == []:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                    events = self._since(channel, last_id)
+                if events is not None:
+                    last_id = self._last_id
+            if events is None:
+                yield Event(self._last_id, channel, "reset", {}).format()
+                return
+            if events:
+                for event in events:
+                    yield event.format()
+            else:
+                yield ": keepalive\n\n"
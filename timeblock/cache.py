@@ -0,0 +1,176 @@
+"""
+Provide an in-process cache of decoded Action objects.
+
+ActionCache holds Action objects keyed by action id, so that reading an
+unchanged database doesn't rebuild every Action from tuples. The cache
+is filled by TimeblockDB.get_actions() and invalidated by the TimeblockDB
+write methods.
+
+Writes made by other processes are detected through the version counter
+in the 'app_version' table, which is bumped by triggers on every change
+to the 'action' table. When the version read from the database doesn't
+match the version the cache was filled at, the whole cache is dropped.
+
+Example:
+>>> from timeblock.cache import ActionCache
+>>> cache = ActionCache(maxsize=2)
+>>> cache.stats()
+{'size': 0, 'maxsize': 2, 'hits': 0, 'misses': 0, 'evictions': 0}
+"""
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from timeblock.action import Action
+
+
+class ActionCache:
+    """
+    Size-bounded LRU cache of Action objects keyed by action id.
+
+    Cached Actions are shared between readers and should be treated
+    as read-only.
+
+    Attributes:
+        maxsize: Maximum number of Actions held before evicting
+        version: Database version the cached entries are valid for
+        ids: Ordered ids of every action at 'version', or None if unknown
+        hits: Number of lookups answered from the cache
+        misses: Number of lookups that had to go to the database
+        evictions: Number of entries dropped to stay within 'maxsize'
+
+    Methods:
+        get(action_id: int) -> Optional[Action]: Look up a cached Action
+        put(action: Action, version: Optional[int]): Add an Action to
+            the cache, unless it was read at an older version
+        set_ids(ids: list[int], version: int): Remember the ids of every
+            action, unless they were read at an older version
+        sync(version: int): Drop everything if the database has changed
+        invalidate(action_ids: list[int], version: int): Drop the
+            Actions written in one transaction
+        clear(): Drop every cached Action
+        stats() -> dict: Return size and hit/miss/eviction counters
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        """
+        Initialize ActionCache object.
+
+        Args:
+            maxsize (int): Maximum number of Actions to hold.
+        """
+        self.maxsize = maxsize
+        self.version: Optional[int] = None
+        self.ids: Optional[list[int]] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._actions: OrderedDict[int, Action] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return number of cached Actions."""
+        return len(self._actions)
+
+    def __repr__(self):
+        """Return string resembling constructor call."""
+        return f"ActionCache(maxsize={self.maxsize})"
+
+    def get(self, action_id: int) -> Optional[Action]:
+        """Return cached Action for action_id, or None on a miss."""
+        with self._lock:
+            action = self._actions.get(action_id)
+            if action is None:
+                self.misses += 1
+                return None
+            self._actions.move_to_end(action_id)
+            self.hits += 1
+            return action
+
+    def put(self, action: Action, version: Optional[int] = None) -> None:
+        """
+        Add Action to the cache, evicting the least recently used.
+
+        Args:
+            action (Action): Action read from the database.
+            version (int): Database version the action was read at. If
+                the cache has been invalidated since, the action may be
+                stale and isn't stored. None stores it unconditionally.
+        """
+        if action.id is None:
+            return
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._actions[action.id] = action
+            self._actions.move_to_end(action.id)
+            while len(self._actions) > self.maxsize:
+                self._actions.popitem(last=False)
+                self.evictions += 1
+
+    def set_ids(self, ids: list[int], version: int) -> None:
+        """
+        Remember the ids of every action, as read at version.
+
+        The ids are dropped if the cache has been invalidated since they
+        were read, so a list missing a new action is never kept.
+        """
+        with self._lock:
+            if version == self.version:
+                self.ids = ids
+
+    def sync(self, version: int) -> None:
+        """
+        Check the cache against the current database version.
+
+        If the version has changed since the cache was filled, some other
+        connection has written to the database and every entry is dropped.
+        """
+        with self._lock:
+            if version != self.version:
+                self._clear()
+                self.version = version
+
+    def invalidate(self, action_ids: list[int], version: int) -> None:
+        """
+        Drop the Actions for action_ids after they have been written.
+
+        Args:
+            action_ids (list[int]): Ids of the actions inserted or changed
+                in one transaction, once for every write.
+            version (int): Database version read after the writes.
+
+        If the writes were the only changes since the cache was filled,
+        the version is expected to have moved on by exactly one for each
+        of them and the rest of the cache stays valid. Otherwise another
+        connection has also written to the database, and the whole cache
+        is dropped.
+        """
+        with self._lock:
+            expected = len(action_ids)
+            if self.version is not None and version == self.version + expected:
+                for action_id in action_ids:
+                    self._actions.pop(action_id, None)
+                self.ids = None
+            else:
+                self._clear()
+            self.version = version
+
+    def clear(self) -> None:
+        """Drop every cached Action."""
+        with self._lock:
+            self._clear()
+
+    def _clear(self) -> None:
+        self._actions.clear()
+        self.ids = None
+
+    def stats(self) -> dict:
+        """Return size and hit/miss/eviction counters."""
+        return {
+            "size": len(self._actions),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
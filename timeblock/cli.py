@@ -0,0 +1,560 @@
+"""
+Command line interface for Timeblock.
+
+Subcommands work on the database directly, without going through the
+web server, and each invocation runs in a single transaction. Commands
+that write take the write lock as they start, so other connections
+can't write in between:
+
+    $ python -m timeblock add "write report" "email Bob" --duration 25
+    $ cat tasks.txt | python -m timeblock add -
+    $ python -m timeblock list
+    $ python -m timeblock schedule 1 2023-01-16T09:00
+    $ python -m timeblock edit 1 --desc "write summary" --duration 30
+    $ python -m timeblock delete 1
+    $ python -m timeblock restore 1
+    $ python -m timeblock history 1
+    $ python -m timeblock start 1
+    $ python -m timeblock stop
+    $ python -m timeblock depend 3 --on 1 2
+    $ python -m timeblock undepend 3 --on 2
+    $ python -m timeblock plan 2023-01-16T09:00 --duration 30
+    $ python -m timeblock critical
+    $ python -m timeblock export --format csv
+    $ python -m timeblock batch < operations.ndjson
+    $ python -m timeblock backup backups/db-copy.sql
+    $ python -m timeblock snapshot --dir backups --keep 7
+    $ python -m timeblock compact
+    $ python -m timeblock checkpoint
+    $ python -m timeblock stats
+    $ python -m timeblock sync http://desktop:5000/sync
+    $ python -m timeblock serve --db db.sql
+
+Maintenance commands (backup, snapshot, compact, checkpoint, stats and
+sync) print JSON reports and don't run in a transaction. 'sync' sends
+the peer's SYNC_TOKEN, taken from --token or the TIMEBLOCK_SYNC_TOKEN
+environment variable.
+
+For backwards compatibility, 'python -m timeblock [database] [shards]'
+without a subcommand runs the web server.
+
+Input read from stdin is newline-delimited. For 'add' each line is a
+description, optionally followed by a tab and the estimated duration in
+minutes. For 'schedule' each line is an action id, a tab and an ISO
+datetime. For 'batch' each line is a JSON object with an "op" key of
+"add", "schedule", "start" or "stop" and the same arguments as the
+subcommand, for example {"op": "add", "desc": "nap", "duration": 20}.
+
+The following functions are defined:
+    run - Parse arguments and run subcommand, returning exit status.
+    build_parser - Return the argparse parser for the subcommands.
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, Optional, TextIO
+
+from timeblock import maintenance, sync
+from timeblock.action import Action
+from timeblock.sql import TimeblockDB, TimerError
+
+COMMANDS = {
+    "serve",
+    "add",
+    "list",
+    "schedule",
+    "edit",
+    "delete",
+    "restore",
+    "history",
+    "start",
+    "stop",
+    "depend",
+    "undepend",
+    "plan",
+    "critical",
+    "export",
+    "batch",
+    "backup",
+    "snapshot",
+    "compact",
+    "checkpoint",
+    "stats",
+    "sync",
+}
+READ_COMMANDS = {"list", "history", "critical", "export"}
+EXPORT_FIELDS = ["id", "desc", "est_duration", "actual_duration", "start"]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Return the argparse parser for the subcommands."""
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--db", default="db.sql", help="database file")
+
+    parser = argparse.ArgumentParser(prog="timeblock")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser(
+        "serve", parents=[common], help="run the web server"
+    )
+    serve.add_argument("--shards", help="directory of tenant databases")
+    serve.add_argument("--port", type=int, default=5000, help="port to use")
+
+    add = commands.add_parser("add", parents=[common], help="add actions")
+    add.add_argument("desc", nargs="+", help="descriptions, or - for stdin")
+    add.add_argument(
+        "--duration", type=float, help="estimated duration in minutes"
+    )
+
+    commands.add_parser("list", parents=[common], help="list actions")
+
+    schedule = commands.add_parser(
+        "schedule", parents=[common], help="set start of an action"
+    )
+    schedule.add_argument("id", help="action id, or - for stdin")
+    schedule.add_argument("start", nargs="?", help="ISO datetime")
+
+    edit = commands.add_parser(
+        "edit", parents=[common], help="change an action"
+    )
+    edit.add_argument("id", type=int, help="action id")
+    edit.add_argument("--desc", help="new description")
+    edit.add_argument(
+        "--duration", type=float, help="estimated duration in minutes"
+    )
+
+    for name, text in [
+        ("delete", "delete an action, keeping its history"),
+        ("restore", "bring back a deleted action"),
+        ("history", "show every change to an action as JSON"),
+    ]:
+        command = commands.add_parser(name, parents=[common], help=text)
+        command.add_argument("id", type=int, help="action id")
+
+    start = commands.add_parser(
+        "start", parents=[common], help="start timing an action"
+    )
+    start.add_argument("id", type=int, help="action id")
+
+    commands.add_parser("stop", parents=[common], help="stop the timer")
+
+    for name, text in [
+        ("depend", "make an action wait for others"),
+        ("undepend", "remove dependencies of an action"),
+    ]:
+        command = commands.add_parser(name, parents=[common], help=text)
+        command.add_argument("id", type=int, help="action id")
+        command.add_argument(
+            "--on", type=int, nargs="+", required=True, help="action ids"
+        )
+
+    plan = commands.add_parser(
+        "plan",
+        parents=[common],
+        help="schedule unscheduled actions after their dependencies",
+    )
+    plan.add_argument("start", help="ISO datetime of the first block")
+    plan.add_argument(
+        "--duration",
+        type=float,
+        default=30,
+        help="minutes for actions without an estimate",
+    )
+
+    commands.add_parser(
+        "critical", parents=[common], help="show longest dependency chain"
+    )
+
+    export = commands.add_parser(
+        "export", parents=[common], help="write every action to stdout"
+    )
+    export.add_argument("--format", choices=["json", "csv"], default="json")
+
+    commands.add_parser(
+        "batch", parents=[common], help="run JSON operations from stdin"
+    )
+
+    backup = commands.add_parser(
+        "backup", parents=[common], help="copy database while in use"
+    )
+    backup.add_argument("target", help="file to write the copy to")
+    backup.add_argument(
+        "--pages", type=int, default=64, help="pages copied per batch"
+    )
+
+    snapshot = commands.add_parser(
+        "snapshot", parents=[common], help="back up to a timestamped file"
+    )
+    snapshot.add_argument("--dir", default="backups", help="directory")
+    snapshot.add_argument(
+        "--keep", type=int, default=7, help="number of snapshots to keep"
+    )
+
+    compact = commands.add_parser(
+        "compact", parents=[common], help="free unused pages"
+    )
+    compact.add_argument(
+        "--pages", type=int, help="maximum number of pages to free"
+    )
+
+    commands.add_parser(
+        "checkpoint",
+        parents=[common],
+        help="save a snapshot of actions for fast replay",
+    )
+
+    commands.add_parser(
+        "stats", parents=[common], help="show size and fragmentation"
+    )
+
+    sync_parser = commands.add_parser(
+        "sync", parents=[common], help="exchange changes with a peer"
+    )
+    sync_parser.add_argument("url", help="URL of the peer's /sync route")
+    sync_parser.add_argument(
+        "--batch",
+        type=int,
+        default=sync.SYNC_BATCH,
+        help="changes sent each way per request",
+    )
+    sync_parser.add_argument(
+        "--token",
+        default=os.environ.get("TIMEBLOCK_SYNC_TOKEN"),
+        help="SYNC_TOKEN of the peer, $TIMEBLOCK_SYNC_TOKEN by default",
+    )
+    return parser
+
+
+def run(
+    argv: list[str],
+    stdin: Optional[TextIO] = None,
+    out: Optional[TextIO] = None,
+) -> int:
+    """
+    Parse arguments and run subcommand.
+
+    Args:
+        argv (list[str]): Command line arguments, without the program.
+        stdin (TextIO): Stream read for '-' arguments and 'batch',
+            defaults to sys.stdin.
+        out (TextIO): Stream for output, defaults to sys.stdout.
+
+    Returns:
+        int: Exit status, 0 on success.
+    """
+    if not argv or (argv[0] not in COMMANDS and not argv[0].startswith("-")):
+        legacy = zip(["--db", "--shards"], argv)
+        argv = ["serve", *(arg for pair in legacy for arg in pair)]
+    args = build_parser().parse_args(argv)
+
+    if args.command == "serve":
+        # pylint: disable=import-outside-toplevel
+        from timeblock import main
+
+        main(args.db, args.shards, args.port)
+        return 0
+
+    stdin = stdin or sys.stdin
+    out = out or sys.stdout
+    # Database prints connection messages, keep them out of the output
+    with redirect_stdout(sys.stderr):
+        if args.command in MAINTENANCE_FUNCTIONS:
+            with TimeblockDB(args.db):
+                pass  # creates the database file if it doesn't exist yet
+            try:
+                report = MAINTENANCE_FUNCTIONS[args.command](args)
+            except sqlite3.Error as error:
+                print(f"Error: {error}", file=sys.stderr)
+                return 1
+            json.dump(report, out, indent=2)
+            print(file=out)
+            return 0
+        immediate = args.command not in READ_COMMANDS
+        try:
+            with TimeblockDB(args.db) as database, database.transaction(
+                immediate=immediate
+            ):
+                return COMMAND_FUNCTIONS[args.command](
+                    database, args, stdin, out
+                )
+        except TimerError as error:
+            # raised inside the transaction, so nothing was changed
+            print(f"Error: {error}", file=sys.stderr)
+            return 1
+
+
+def _lines(stdin: TextIO) -> Iterator[list[str]]:
+    """Yield tab-separated fields of each non-blank line."""
+    for line in stdin:
+        line = line.rstrip("\n")
+        if line.strip():
+            yield line.split("\t")
+
+
+def _minutes(value) -> Optional[timedelta]:
+    return timedelta(minutes=float(value)) if value not in (None, "") else None
+
+
+def _add(database: TimeblockDB, args, stdin: TextIO, out: TextIO) -> int:
+    if args.desc == ["-"]:
+        actions: Iterable[Action] = (
+            Action(
+                fields[0],
+                est_duration=_minutes(fields[1] if len(fields) > 1 else None),
+            )
+            for fields in _lines(stdin)
+        )
+    else:
+        duration = _minutes(args.duration)
+        actions = [Action(desc, est_duration=duration) for desc in args.desc]
+    ids = database.add_actions(actions)
+    print(f"Added {sum(1 for i in ids if i)} of {len(ids)} actions", file=out)
+    return 0 if all(ids) else 1
+
+
+def _list(database: TimeblockDB, _args, _stdin: TextIO, out: TextIO) -> int:
+    for action in database.get_actions():
+        minutes = (
+            f"{action.est_duration.total_seconds() / 60:g}m"
+            if action.est_duration
+            else "-"
+        )
+        start = (
+            action.start.isoformat(timespec="minutes") if action.start else "-"
+        )
+        print(f"{action.id}\t{action.desc}\t{minutes}\t{start}", file=out)
+    return 0
+
+
+def _schedule(database: TimeblockDB, args, stdin: TextIO, out: TextIO) -> int:
+    if args.id == "-":
+        pairs = [(fields[0], fields[1]) for fields in _lines(stdin)]
+    elif args.start:
+        pairs = [(args.id, args.start)]
+    else:
+        print("Error: schedule needs an id and a start", file=sys.stderr)
+        return 2
+    scheduled = sum(
+        database.schedule_action(int(action_id), datetime.fromisoformat(start))
+        for action_id, start in pairs
+    )
+    print(f"Scheduled {scheduled} of {len(pairs)} actions", file=out)
+    return 0 if scheduled == len(pairs) else 1
+
+
+def _edit(database: TimeblockDB, args, _stdin: TextIO, out: TextIO) -> int:
+    if not database.update_action(
+        args.id, desc=args.desc, est_duration=_minutes(args.duration)
+    ):
+        print(f"Error: could not change action {args.id}", file=sys.stderr)
+        return 1
+    print(f"Changed action {args.id}", file=out)
+    return 0
+
+
+def _delete(database: TimeblockDB, args, _stdin: TextIO, out: TextIO) -> int:
+    if not database.delete_action(args.id):
+        print(f"Error: no action with id {args.id}", file=sys.stderr)
+        return 1
+    print(f"Deleted action {args.id}", file=out)
+    return 0
+
+
+def _restore(database: TimeblockDB, args, _stdin: TextIO, out: TextIO) -> int:
+    if not database.restore_action(args.id):
+        print(f"Error: could not restore action {args.id}", file=sys.stderr)
+        return 1
+    print(f"Restored action {args.id}", file=out)
+    return 0
+
+
+def _history(database: TimeblockDB, args, _stdin: TextIO, out: TextIO) -> int:
+    events = database.history(args.id)
+    json.dump(events, out, indent=2, default=datetime.isoformat)
+    print(file=out)
+    return 0 if events else 1
+
+
+def _start(database: TimeblockDB, args, _stdin: TextIO, out: TextIO) -> int:
+    if database.get_action(args.id) is None:
+        print(f"Error: no action with id {args.id}", file=sys.stderr)
+        return 1
+    elapsed = database.switch_timer(args.id)
+    if elapsed is not None:
+        print(f"Stopped previous timer after {elapsed}", file=out)
+    print(f"Started timer for action {args.id}", file=out)
+    return 0
+
+
+def _stop(database: TimeblockDB, _args, _stdin: TextIO, out: TextIO) -> int:
+    elapsed = database.stop_timer()
+    if elapsed is None:
+        print("Error: no timer is running", file=sys.stderr)
+        return 1
+    print(f"Stopped timer after {elapsed}", file=out)
+    return 0
+
+
+def _depend(database: TimeblockDB, args, _stdin: TextIO, out: TextIO) -> int:
+    added = sum(database.add_dependency(args.id, other) for other in args.on)
+    print(f"Added {added} of {len(args.on)} dependencies", file=out)
+    return 0 if added == len(args.on) else 1
+
+
+def _undepend(database: TimeblockDB, args, _stdin: TextIO, out: TextIO) -> int:
+    removed = sum(
+        database.remove_dependency(args.id, other) for other in args.on
+    )
+    print(f"Removed {removed} of {len(args.on)} dependencies", file=out)
+    return 0 if removed == len(args.on) else 1
+
+
+def _plan(database: TimeblockDB, args, _stdin: TextIO, out: TextIO) -> int:
+    scheduled = database.plan(
+        datetime.fromisoformat(args.start), timedelta(minutes=args.duration)
+    )
+    for action_id in scheduled:
+        action = database.get_action(action_id)
+        if action and action.start:
+            start = action.start.isoformat(timespec="minutes")
+            print(f"{action.id}\t{action.desc}\t{start}", file=out)
+    print(f"Scheduled {len(scheduled)} actions", file=out)
+    return 0
+
+
+def _critical(
+    database: TimeblockDB, _args, _stdin: TextIO, out: TextIO
+) -> int:
+    total, path = database.critical_path()
+    for action_id in path:
+        action = database.get_action(action_id)
+        if action:
+            print(f"{action.id}\t{action.desc}", file=out)
+    print(f"Total {total}", file=out)
+    return 0
+
+
+def _export(database: TimeblockDB, args, _stdin: TextIO, out: TextIO) -> int:
+    rows = [
+        {
+            "id": action.id,
+            "desc": action.desc,
+            "est_duration": (
+                action.est_duration.total_seconds()
+                if action.est_duration is not None
+                else None
+            ),
+            "actual_duration": (
+                action.actual_duration.total_seconds()
+                if action.actual_duration is not None
+                else None
+            ),
+            "start": action.start.isoformat() if action.start else None,
+        }
+        for action in database.get_actions()
+    ]
+    if args.format == "csv":
+        writer = csv.DictWriter(out, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        json.dump(rows, out, indent=2)
+        print(file=out)
+    return 0
+
+
+def _batch(database: TimeblockDB, _args, stdin: TextIO, out: TextIO) -> int:
+    counts: dict[str, int] = {}
+    failed = 0
+    for number, line in enumerate(stdin, start=1):
+        if not line.strip():
+            continue
+        try:
+            operation = json.loads(line)
+            op = operation.get("op")
+            ok = _operation(database, op, operation)
+        except KeyError as error:
+            raise ValueError(f"Line {number}: missing {error}") from error
+        except (AttributeError, TypeError, ValueError) as error:
+            raise ValueError(f"Line {number}: {error}") from error
+        except TimerError as error:
+            raise TimerError(f"Line {number}: {error}") from error
+        counts[op] = counts.get(op, 0) + ok
+        failed += not ok
+    summary = ", ".join(f"{op}: {count}" for op, count in counts.items())
+    print(f"Done ({summary or 'nothing'}), {failed} failed", file=out)
+    return 0 if not failed else 1
+
+
+def _operation(database: TimeblockDB, op: str, operation: dict) -> bool:
+    """Run one operation of a batch, returning whether it succeeded."""
+    if op == "add":
+        return bool(
+            database.add_action(
+                Action(
+                    operation["desc"],
+                    est_duration=_minutes(operation.get("duration")),
+                )
+            )
+        )
+    if op == "schedule":
+        return database.schedule_action(
+            int(operation["id"]),
+            datetime.fromisoformat(operation["start"]),
+        )
+    if op == "start":
+        ok = database.get_action(int(operation["id"])) is not None
+        database.switch_timer(int(operation["id"]))
+        return ok
+    if op == "stop":
+        return database.stop_timer() is not None
+    raise ValueError(f"Unknown operation: {op!r}")
+
+
+def _checkpoint(filename: str) -> int:
+    with TimeblockDB(filename) as database:
+        return database.checkpoint()
+
+
+def _sync(
+    filename: str, url: str, batch: int, token: Optional[str]
+) -> dict:
+    with TimeblockDB(filename) as database:
+        return sync.sync(database, url, batch=batch, token=token)
+
+
+COMMAND_FUNCTIONS = {
+    "add": _add,
+    "list": _list,
+    "schedule": _schedule,
+    "edit": _edit,
+    "delete": _delete,
+    "restore": _restore,
+    "history": _history,
+    "start": _start,
+    "stop": _stop,
+    "depend": _depend,
+    "undepend": _undepend,
+    "plan": _plan,
+    "critical": _critical,
+    "export": _export,
+    "batch": _batch,
+}
+
+MAINTENANCE_FUNCTIONS = {
+    "backup": lambda args: maintenance.backup(
+        args.db, args.target, pages=args.pages
+    ),
+    "snapshot": lambda args: maintenance.snapshot(
+        args.db, args.dir, keep=args.keep
+    ),
+    "compact": lambda args: maintenance.compact(args.db, pages=args.pages),
+    "checkpoint": lambda args: {"seq": _checkpoint(args.db)},
+    "stats": lambda args: maintenance.file_stats(args.db),
+    "sync": lambda args: _sync(args.db, args.url, args.batch, args.token),
+}
@@ -0,0 +1,218 @@
+"""
+Response compression and static file caching for the web server.
+
+Responses are compressed with brotli when the client accepts it and the
+brotli package is installed, otherwise with gzip from the standard
+library. Streamed responses are compressed chunk by chunk, flushing the
+compressor after each chunk so the client can render what has arrived
+instead of waiting for the whole body. Server-Sent Events are never
+compressed, since a flush per event would cost more than it saves and
+some proxies buffer compressed streams.
+
+Static files are linked with static_url(), which adds a hash of the
+file's contents to the URL. Requests carrying the current hash are sent
+with 'Cache-Control: immutable', so browsers don't revalidate them; a
+changed file gets a new URL.
+
+The following constants are defined:
+    MIN_SIZE - Smallest body, in bytes, worth compressing.
+    STREAM_BUFFER - Characters collected before a streamed chunk is sent.
+    COMPRESSIBLE - Mimetypes that are compressed.
+    IMMUTABLE - Cache-Control value for fingerprinted static files.
+
+The following functions are defined:
+    init_app - Register compression and static caching on an app.
+    negotiate - Pick the encoding to use from an Accept-Encoding header.
+    buffered - Join small streamed chunks into larger ones.
+    compress_response - Compress a response for the current request.
+    static_url - Return fingerprinted URL of a static file.
+"""
+import hashlib
+import os
+import zlib
+from functools import lru_cache
+from typing import Iterable, Iterator, Optional, Union
+
+from flask import Flask, Response, current_app, request, url_for
+
+try:
+    import brotli  # type: ignore[import-not-found]
+except ImportError:  # optional, gzip is used without it
+    brotli = None
+
+MIN_SIZE = 500
+STREAM_BUFFER = 16_384
+COMPRESSIBLE = {
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/csv",
+    "application/json",
+    "application/javascript",
+    "text/javascript",
+    "image/svg+xml",
+}
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def init_app(app: Flask) -> None:
+    """Compress responses of app and cache its fingerprinted files."""
+    app.add_template_global(static_url)
+    app.after_request(cache_static)
+    app.after_request(compress_response)
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """
+    Pick the encoding to use from an Accept-Encoding header.
+
+    Returns:
+        str: "br" or "gzip", or None to send the body uncompressed.
+    """
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, *params = [item.strip() for item in part.split(";")]
+        weight = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    weight = float(param[2:])
+                except ValueError:
+                    weight = 0.0
+        weights[name.lower()] = weight
+    supported = ["br", "gzip"] if brotli is not None else ["gzip"]
+    candidates = [
+        (weights.get(name, weights.get("*", 0.0)), -rank, name)
+        for rank, name in enumerate(supported)
+    ]
+    weight, _, name = max(candidates)
+    return name if weight > 0 else None
+
+
+def buffered(
+    chunks: Iterable[str], size: int = STREAM_BUFFER
+) -> Iterator[str]:
+    """
+    Join small chunks, e.g. from a streamed template, into larger ones.
+
+    Templates yield a chunk per tag and variable. Sending, and flushing
+    the compressor, for each of those would waste most of the savings.
+    """
+    parts: list[str] = []
+    length = 0
+    for chunk in chunks:
+        parts.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield "".join(parts)
+            parts, length = [], 0
+    if parts:
+        yield "".join(parts)
+
+
+def _compressor(encoding: str):
+    """Return a compressor object for encoding."""
+    if encoding == "br":
+        return brotli.Compressor(quality=5)
+    return zlib.compressobj(6, zlib.DEFLATED, 31)
+
+
+def _flush(compressor, encoding: str, final: bool = False) -> bytes:
+    """Flush compressor, ending the stream if final."""
+    if encoding == "br":
+        return compressor.finish() if final else compressor.flush()
+    return compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+def _process(compressor, encoding: str, data: bytes) -> bytes:
+    """Feed data to compressor, returning any output ready."""
+    if encoding == "br":
+        return compressor.process(data)
+    return compressor.compress(data)
+
+
+def _compress_stream(
+    chunks: Iterable[Union[str, bytes]], encoding: str
+) -> Iterator[bytes]:
+    """Compress chunks, flushing after each one so it can be decoded."""
+    compressor = _compressor(encoding)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        if chunk:
+            yield _process(compressor, encoding, chunk) + _flush(
+                compressor, encoding
+            )
+    yield _flush(compressor, encoding, final=True)
+
+
+def compress_response(response: Response) -> Response:
+    """
+    Compress response if the client accepts it and it's worth it.
+
+    Responses that are already encoded, have no body, are event streams
+    or aren't text are left alone. Every response that could have been
+    compressed gets 'Vary: Accept-Encoding', so caches keep the variants
+    apart.
+    """
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate(request.headers.get("Accept-Encoding", ""))
+    if encoding is None:
+        return response
+    if response.direct_passthrough:
+        # static files are sent as file wrappers, read them to compress
+        response.direct_passthrough = False
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    if response.is_streamed:
+        source = response.response
+        if hasattr(source, "close"):
+            response.call_on_close(source.close)
+        response.response = _compress_stream(source, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+        if len(body) < MIN_SIZE:
+            return response
+        compressor = _compressor(encoding)
+        response.set_data(
+            _process(compressor, encoding, body)
+            + _flush(compressor, encoding, final=True)
+        )
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+@lru_cache(maxsize=None)
+def _fingerprint(path: str, _mtime: float) -> str:
+    """Return short hash of file contents, cached until it changes."""
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()[:12]
+
+
+def static_url(filename: str) -> str:
+    """Return URL of static file, with a hash of its contents."""
+    path = os.path.join(current_app.static_folder or "", filename)
+    version = _fingerprint(path, os.path.getmtime(path))
+    return url_for("static", filename=filename, v=version)
+
+
+def cache_static(response: Response) -> Response:
+    """Mark static files requested with their current hash immutable."""
+    if request.endpoint != "static" or response.status_code != 200:
+        return response
+    version = request.args.get("v")
+    filename = (request.view_args or {}).get("filename", "")
+    path = os.path.join(current_app.static_folder or "", filename)
+    if version and os.path.isfile(path):
+        if version == _fingerprint(path, os.path.getmtime(path)):
+            response.headers["Cache-Control"] = IMMUTABLE
+    return response
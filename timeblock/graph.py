@@ -0,0 +1,270 @@
+"""
+Dependency graph of actions, kept in topological order as it changes.
+
+DependencyGraph keeps every node at a position such that each action
+comes after the actions it depends on. Adding an edge uses the
+Pearce-Kelly algorithm: if the edge already agrees with the order
+nothing moves, otherwise only the nodes between the two ends that are
+reachable from them are searched and shuffled. Most edits touch a
+handful of nodes however large the graph is, and a cycle is found by
+the same search, without recomputing the whole order.
+
+Example:
+>>> from timeblock.graph import DependencyGraph
+>>> graph = DependencyGraph()
+>>> graph.add_edge(1, 2)  # 2 depends on 1
+>>> graph.add_edge(2, 3)
+>>> graph.add_edge(3, 1)
+Traceback (most recent call last):
+    ...
+timeblock.graph.CycleError: 3 already depends on 1, directly or not
+
+The following classes are defined:
+    CycleError - Raised when an edge would create a cycle.
+    DependencyGraph - Directed acyclic graph kept in topological order.
+"""
+import heapq
+import threading
+from collections import deque
+from typing import Hashable, Iterable, Mapping, Optional
+
+
+class CycleError(ValueError):
+    """Raised when adding an edge would create a cycle."""
+
+
+class DependencyGraph:
+    """
+    Directed acyclic graph of actions, kept in topological order.
+
+    An edge (before, after) means 'after' depends on 'before', so
+    'before' has to be done first.
+
+    Attributes:
+        version: Version of the stored edges this graph reflects
+        lock: Lock for callers sharing the graph between threads
+
+    Methods:
+        add_node(node): Add node at the end of the order
+        add_edge(before, after): Add dependency, raising CycleError
+        remove_edge(before, after): Remove dependency
+        remove_node(node): Remove node and its edges
+        load(edges: Iterable): Replace graph with edges
+        position(node) -> int: Return position of node in the order
+        topological_order -> list: Return every node in order
+        edges(nodes: Iterable) -> list: Return edges between nodes
+        order(nodes: Iterable) -> list: Order nodes, earliest first
+        critical_path(durations: Mapping) -> tuple[float, list]:
+            Return the longest chain of dependencies
+    """
+
+    def __init__(self, edges: Iterable[tuple[Hashable, Hashable]] = ()):
+        """
+        Initialize DependencyGraph object.
+
+        Args:
+            edges (Iterable): Pairs (before, after) to start with.
+        """
+        self.version: Optional[int] = None
+        self.lock = threading.RLock()
+        self._before: dict[Hashable, set] = {}
+        self._after: dict[Hashable, set] = {}
+        self._position: dict[Hashable, int] = {}
+        self._next = 0
+        self.load(edges)
+
+    def __repr__(self):
+        """Return string resembling constructor call."""
+        return f"DependencyGraph(<{len(self._position)} nodes>)"
+
+    def __contains__(self, node) -> bool:
+        """Return whether node is in the graph."""
+        return node in self._position
+
+    def __len__(self) -> int:
+        """Return number of nodes."""
+        return len(self._position)
+
+    def add_node(self, node: Hashable) -> None:
+        """Add node at the end of the order, if it isn't there yet."""
+        if node not in self._position:
+            self._position[node] = self._next
+            self._next += 1
+            self._before[node] = set()
+            self._after[node] = set()
+
+    def add_edge(self, before: Hashable, after: Hashable) -> None:
+        """
+        Add dependency of after on before.
+
+        Raises:
+            CycleError: If before already depends on after, directly or
+                through other nodes. The graph is left unchanged.
+        """
+        if before == after:
+            raise CycleError(f"{after} can't depend on itself")
+        self.add_node(before)
+        self.add_node(after)
+        if after in self._after[before]:
+            return
+        lower, upper = self._position[after], self._position[before]
+        if lower < upper:
+            forward = self._search(after, self._after, upper, before)
+            backward = self._search(before, self._before, lower)
+            self._reorder(backward, forward)
+        self._after[before].add(after)
+        self._before[after].add(before)
+
+    def _search(self, start, edges: dict, bound: int, target=None) -> list:
+        """
+        Find nodes reachable from start within bound of the order.
+
+        Following edges forward, nodes at or before bound are visited;
+        following them backward, nodes at or after bound are.
+        """
+        forward = edges is self._after
+        seen = {start}
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for other in edges[node]:
+                if other == target:
+                    raise CycleError(
+                        f"{target} already depends on {start}, "
+                        "directly or not"
+                    )
+                position = self._position[other]
+                inside = position <= bound if forward else position >= bound
+                if inside and other not in seen:
+                    seen.add(other)
+                    stack.append(other)
+        return list(seen)
+
+    def _reorder(self, backward: list, forward: list) -> None:
+        """Move backward nodes ahead of forward ones, reusing positions."""
+        backward.sort(key=self._position.__getitem__)
+        forward.sort(key=self._position.__getitem__)
+        nodes = backward + forward
+        positions = sorted(self._position[node] for node in nodes)
+        for node, position in zip(nodes, positions):
+            self._position[node] = position
+
+    def remove_edge(self, before: Hashable, after: Hashable) -> None:
+        """Remove dependency of after on before, if there is one."""
+        if before in self._after:
+            self._after[before].discard(after)
+        if after in self._before:
+            self._before[after].discard(before)
+
+    def remove_node(self, node: Hashable) -> None:
+        """Remove node and every edge to or from it."""
+        if node not in self._position:
+            return
+        for other in self._after.pop(node):
+            self._before[other].discard(node)
+        for other in self._before.pop(node):
+            self._after[other].discard(node)
+        del self._position[node]
+
+    def load(self, edges: Iterable[tuple[Hashable, Hashable]]) -> None:
+        """
+        Replace the graph with edges, ordering it from scratch.
+
+        Raises:
+            CycleError: If the edges contain a cycle.
+        """
+        self._before, self._after, self._position = {}, {}, {}
+        self._next = 0
+        for before, after in edges:
+            for node in (before, after):
+                if node not in self._before:
+                    self._before[node] = set()
+                    self._after[node] = set()
+            self._after[before].add(after)
+            self._before[after].add(before)
+        waiting = {node: len(nodes) for node, nodes in self._before.items()}
+        ready = deque(node for node, count in waiting.items() if not count)
+        while ready:
+            node = ready.popleft()
+            self._position[node] = self._next
+            self._next += 1
+            for other in self._after[node]:
+                waiting[other] -= 1
+                if not waiting[other]:
+                    ready.append(other)
+        if len(self._position) < len(self._before):
+            raise CycleError("Dependencies contain a cycle")
+
+    def position(self, node: Hashable) -> int:
+        """Return position of node; earlier nodes come first."""
+        return self._position[node]
+
+    def topological_order(self) -> list:
+        """Return every node, each after the nodes it depends on."""
+        return sorted(self._position, key=self._position.__getitem__)
+
+    def edges(self, nodes: Optional[Iterable] = None) -> list[tuple]:
+        """Return edges (before, after), only between nodes if given."""
+        chosen = set(self._position if nodes is None else nodes)
+        return [
+            (before, after)
+            for after in chosen
+            for before in self._before.get(after, ())
+            if before in chosen
+        ]
+
+    def order(self, nodes: Iterable) -> list:
+        """
+        Return nodes in an order that respects their dependencies.
+
+        Among nodes whose dependencies are met, the smallest comes
+        first, so without dependencies nodes keep their natural order.
+        Dependencies on nodes outside 'nodes' are ignored.
+        """
+        chosen = set(nodes)
+        waiting = {
+            node: len(self._before.get(node, set()) & chosen)
+            for node in chosen
+        }
+        ready = [node for node, count in waiting.items() if not count]
+        heapq.heapify(ready)
+        ordered = []
+        while ready:
+            node = heapq.heappop(ready)
+            ordered.append(node)
+            for other in self._after.get(node, ()):
+                if other in chosen:
+                    waiting[other] -= 1
+                    if not waiting[other]:
+                        heapq.heappush(ready, other)
+        return ordered
+
+    def critical_path(
+        self, durations: Mapping[Hashable, float]
+    ) -> tuple[float, list]:
+        """
+        Return the chain of dependencies that takes longest to finish.
+
+        Args:
+            durations (Mapping): Duration of each node, 0 if missing.
+
+        Returns:
+            tuple: Total duration and the nodes of the chain, in order.
+        """
+        finish: dict[Hashable, float] = {}
+        previous: dict[Hashable, Hashable] = {}
+        for node in self.topological_order():
+            start = 0.0
+            for other in self._before[node]:
+                if finish[other] > start:
+                    start, previous[node] = finish[other], other
+            finish[node] = start + durations.get(node, 0)
+        if not finish:
+            return 0.0, []
+        node = max(finish, key=finish.__getitem__)
+        total = finish[node]
+        path = [node]
+        while node in previous:
+            node = previous[node]
+            path.append(node)
+        return total, path[::-1]
@@ -0,0 +1,413 @@
+"""
+Load test for the Timeblock web server.
+
+Replays a mix of 'GET /' and 'POST /' requests from many concurrent
+clients and prints throughput, latency percentiles and error rates as
+JSON. Clients are asyncio tasks, so thousands of them fit in one
+process; each request uses its own connection, like a browser loading
+the page.
+
+The server is started in-process on a free port by default, or with
+--spawn as 'python -m timeblock serve' in a subprocess on a free port,
+or an already running server is used with --url:
+
+    $ python -m timeblock.loadtest --clients 1000 --duration 10
+    $ python -m timeblock.loadtest --clients 200 --mix get=1,post=1
+    $ python -m timeblock.loadtest --url http://127.0.0.1:5000/
+
+Every mode waits for the server with a readiness probe, polling until it
+answers instead of sleeping for a fixed time.
+
+The following functions are defined:
+    wait_until_ready - Poll a URL until the server answers.
+    serve - Run the app in a background thread, yielding its URL.
+    spawn - Run 'python -m timeblock serve' in a subprocess, yielding its
+        URL.
+    parse_mix - Parse a mix such as 'get=9,post=1' into weights.
+    run_load - Run the load test against a URL and return the report.
+    main - Parse arguments, run the load test and print the report.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager, redirect_stdout
+from typing import Iterator, Optional
+from urllib.parse import urlencode, urlsplit
+
+DEFAULT_MIX = {"get": 9, "post": 1}
+FILE_LIMIT = 65536
+
+
+def wait_until_ready(
+    url: str,
+    timeout: float = 30.0,
+    interval: float = 0.05,
+    process: Optional[subprocess.Popen] = None,
+) -> float:
+    """
+    Poll url until the server answers.
+
+    Any HTTP response counts as ready, even an error status, since it
+    means the server is accepting requests.
+
+    Args:
+        url (str): URL to request.
+        timeout (float): Seconds to wait before giving up.
+        interval (float): Seconds between attempts.
+        process (Popen): Server process, which must still be running
+            when the server answers.
+
+    Returns:
+        float: Seconds waited.
+
+    Raises:
+        TimeoutError: If the server didn't answer within timeout.
+        RuntimeError: If process exited, e.g. because the port was taken.
+    """
+    started = time.perf_counter()
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=interval * 20):
+                pass
+            break
+        except urllib.error.HTTPError:
+            break
+        except OSError as error:
+            if process is not None and process.poll() is not None:
+                break
+            if time.perf_counter() - started > timeout:
+                raise TimeoutError(f"{url} not ready: {error}") from error
+            time.sleep(interval)
+    if process is not None and process.poll() is not None:
+        # whatever answered, it wasn't this server
+        raise RuntimeError(
+            f"Server for {url} exited with status {process.returncode}"
+        )
+    return time.perf_counter() - started
+
+
+@contextmanager
+def serve(database: str, host: str = "127.0.0.1") -> Iterator[str]:
+    """
+    Run the app in a background thread on a free port.
+
+    Args:
+        database (str): Database file for the app.
+        host (str): Address to listen on.
+
+    Yields:
+        str: URL of the running server.
+    """
+    # pylint: disable=import-outside-toplevel
+    from werkzeug.serving import make_server
+
+    from timeblock import create_app
+
+    app = create_app({"DATABASE": database})
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server(host, 0, app, threaded=True)
+    server.socket.listen(1024)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://{host}:{server.server_port}/"
+    try:
+        wait_until_ready(url)
+        yield url
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+@contextmanager
+def spawn(database: str, port: int = 0) -> Iterator[str]:
+    """
+    Run 'python -m timeblock serve' in a subprocess.
+
+    Args:
+        database (str): Database file for the server.
+        port (int): Port for the server to listen on, a free one if 0.
+
+    Yields:
+        str: URL of the running server.
+
+    Raises:
+        OSError: If port is already taken.
+        RuntimeError: If the server exited before it answered, e.g.
+            because another process took the port in the meantime.
+    """
+    host = "127.0.0.1"
+    # binding checks the port is free, and has the system pick one for 0
+    with socket.socket() as probe:
+        probe.bind((host, port))
+        port = probe.getsockname()[1]
+    url = f"http://{host}:{port}/"
+    with subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "timeblock",
+            "serve",
+            "--db",
+            database,
+            "--port",
+            str(port),
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    ) as proc:
+        try:
+            wait_until_ready(url, process=proc)
+            yield url
+        finally:
+            proc.terminate()
+
+
+def parse_mix(text: str) -> dict[str, int]:
+    """
+    Parse a mix such as 'get=9,post=1' into request weights.
+
+    Raises:
+        ValueError: If a request type is unknown or a weight invalid.
+    """
+    mix: dict[str, int] = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip().lower()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown request type: {name!r}")
+        mix[name] = int(weight) if weight else 1
+        if mix[name] < 0:
+            raise ValueError(f"Negative weight for {name!r}")
+    if not any(mix.values()):
+        raise ValueError("Mix has no requests")
+    return mix
+
+
+def _percentiles(latencies: list[float]) -> dict:
+    """Return p50/p90/p99/max of latencies in milliseconds."""
+    if not latencies:
+        return {"p50_ms": None, "p90_ms": None, "p99_ms": None, "max_ms": None}
+    ordered = sorted(latencies)
+
+    def at(share: float) -> float:
+        index = min(len(ordered) - 1, int(share * len(ordered)))
+        return round(ordered[index] * 1000, 2)
+
+    return {
+        "p50_ms": at(0.5),
+        "p90_ms": at(0.9),
+        "p99_ms": at(0.99),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+async def _request(
+    host: str, port: int, path: str, method: str, body: bytes, timeout: float
+) -> int:
+    """Send one HTTP/1.1 request on a new connection, return the status."""
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(host, port), timeout
+    )
+    try:
+        head = [
+            f"{method} {path} HTTP/1.1",
+            f"Host: {host}:{port}",
+            "Connection: close",
+        ]
+        if method == "POST":
+            head.append("Content-Type: application/x-www-form-urlencoded")
+            head.append(f"Content-Length: {len(body)}")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        if not status_line:
+            raise ConnectionError("connection closed without a response")
+        await asyncio.wait_for(reader.read(), timeout)
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def _client(
+    number: int,
+    url: str,
+    mix: dict[str, int],
+    deadline: float,
+    requests: Optional[int],
+    timeout: float,
+    results: list[tuple[str, float, str]],
+) -> None:
+    """Send requests until deadline, or until requests have been sent."""
+    parts = urlsplit(url)
+    host, port = parts.hostname or "127.0.0.1", parts.port or 80
+    path = parts.path or "/"
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    rng = random.Random(number)
+    sent = 0
+    while time.perf_counter() < deadline and (
+        requests is None or sent < requests
+    ):
+        name = rng.choices(names, weights)[0]
+        body = b""
+        if name == "post":
+            body = urlencode({"action": f"load {number}-{sent}"}).encode()
+        started = time.perf_counter()
+        try:
+            status = await _request(
+                host, port, path, name.upper(), body, timeout
+            )
+            outcome = str(status) if status >= 400 else "ok"
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError) as e:
+            outcome = type(e).__name__
+        results.append((name, time.perf_counter() - started, outcome))
+        sent += 1
+
+
+def run_load(
+    url: str,
+    clients: int = 100,
+    duration: Optional[float] = 10.0,
+    requests: Optional[int] = None,
+    mix: Optional[dict[str, int]] = None,
+    timeout: float = 30.0,
+) -> dict:
+    """
+    Run the load test against url.
+
+    Args:
+        url (str): Root URL of the server.
+        clients (int): Number of concurrent clients.
+        duration (float): Seconds to send requests for, or None to stop
+            only after requests.
+        requests (int): Requests sent by each client, or None to send
+            until duration is up.
+        mix (dict): Relative weights of 'get' and 'post' requests.
+        timeout (float): Seconds before a request counts as failed.
+
+    Returns:
+        dict: Throughput, latency percentiles and error counts, overall
+            and for each request type.
+    """
+    mix = mix or DEFAULT_MIX
+    results: list[tuple[str, float, str]] = []
+
+    async def load() -> None:
+        deadline = time.perf_counter() + duration if duration else float("inf")
+        await asyncio.gather(
+            *(
+                _client(i, url, mix, deadline, requests, timeout, results)
+                for i in range(clients)
+            )
+        )
+
+    started = time.perf_counter()
+    asyncio.run(load())
+    seconds = time.perf_counter() - started
+
+    report: dict = {
+        "url": url,
+        "clients": clients,
+        "mix": mix,
+        "seconds": round(seconds, 3),
+    }
+    for name in ["all", *mix]:
+        chosen = [r for r in results if name in ("all", r[0])]
+        errors: dict[str, int] = {}
+        for _, _, outcome in chosen:
+            if outcome != "ok":
+                errors[outcome] = errors.get(outcome, 0) + 1
+        failed = sum(errors.values())
+        report[name] = {
+            "requests": len(chosen),
+            "throughput_rps": round(len(chosen) / seconds, 1),
+            "error_rate": round(failed / len(chosen), 4) if chosen else 0.0,
+            "errors": errors,
+            **_percentiles([r[1] for r in chosen if r[2] == "ok"]),
+        }
+    return report
+
+
+def _raise_file_limit() -> None:
+    """
+    Allow as many open files as the hard limit, for many clients.
+
+    An unlimited hard limit, the default on macOS, can't be used as the
+    soft limit, so FILE_LIMIT is asked for instead. If the system still
+    refuses, the test runs with the current limit.
+    """
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+    except ImportError:  # not available on Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = FILE_LIMIT if hard == resource.RLIM_INFINITY else hard
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+        except (ValueError, OSError):
+            pass
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Parse arguments, run the load test and print the report as JSON."""
+    parser = argparse.ArgumentParser(prog="python -m timeblock.loadtest")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument(
+        "--duration", type=float, default=10.0, help="seconds to run for"
+    )
+    parser.add_argument(
+        "--requests", type=int, help="requests per client, instead of time"
+    )
+    parser.add_argument(
+        "--mix", type=parse_mix, default=DEFAULT_MIX, help="e.g. get=9,post=1"
+    )
+    parser.add_argument("--timeout", type=float, default=30.0)
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="test a server that is already running")
+    target.add_argument(
+        "--spawn",
+        action="store_true",
+        help="start 'python -m timeblock serve' instead of in-process",
+    )
+    parser.add_argument(
+        "--db", help="database file, a temporary one by default"
+    )
+    args = parser.parse_args(argv)
+    _raise_file_limit()
+    duration = None if args.requests else args.duration
+
+    def load(url: str) -> dict:
+        return run_load(
+            url, args.clients, duration, args.requests, args.mix, args.timeout
+        )
+
+    report: dict = {}
+    if args.url:
+        wait_until_ready(args.url)
+        report = load(args.url)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            database = args.db or os.path.join(tmp, "load.sql")
+            server = spawn(database) if args.spawn else serve(database)
+            # the app prints a line for every database connection
+            with open(os.devnull, "w", encoding="utf-8") as devnull:
+                with redirect_stdout(devnull), server as url:
+                    report = load(url)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,333 @@
+"""
+Maintenance tools for Timeblock database files.
+
+Backups use the SQLite online backup API, copying a batch of pages at a
+time and pausing between batches. The source is only locked while a
+batch is copied, so writers can commit between batches instead of
+waiting for the whole copy. If another connection writes to the source
+while a backup is running, SQLite starts the copy again from the first
+page. Under constant writes that could go on forever, so every restart
+doubles the batch size and drops the pause; after max_restarts the
+rest is copied in a single step.
+
+Compaction returns free pages left behind by deletes to the file system
+with 'PRAGMA incremental_vacuum', then runs 'PRAGMA optimize'. This
+needs auto_vacuum=INCREMENTAL, which new databases are created with.
+Older databases are converted on their first compaction with a one-off
+VACUUM, which blocks writers while it runs and ignores the page limit.
+
+MaintenanceScheduler checkpoints the action projection and runs
+compaction, and optionally a snapshot, on a background thread at a fixed
+interval. Given a ShardRouter, it maintains every tenant's database
+file after the app's own. Snapshots of tenant files go in the
+SHARD_SNAPSHOTS subdirectory, apart from those of the app's database.
+
+The following constants are defined:
+    SHARD_SNAPSHOTS - Subdirectory for snapshots of tenant databases.
+
+The following functions are defined:
+    file_stats - Return size and fragmentation of a database file.
+    backup - Copy a database to another file while it is in use.
+    snapshot - Back up a database to a timestamped file in a directory.
+    compact - Free unused pages and optimize a database file.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from timeblock.shard import ShardRouter
+from timeblock.sql import Database, TimeblockDB
+
+
+SHARD_SNAPSHOTS = "shards"
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+
+def file_stats(filename: str) -> dict:
+    """
+    Return size and fragmentation of database file.
+
+    Fragmentation is the share of pages in the file that are free,
+    and would be returned to the file system by compaction.
+    """
+    with Database(filename) as database:
+        (page_size,) = database.read_query("PRAGMA page_size")[0]
+        (page_count,) = database.read_query("PRAGMA page_count")[0]
+        (freelist_count,) = database.read_query("PRAGMA freelist_count")[0]
+        (auto_vacuum,) = database.read_query("PRAGMA auto_vacuum")[0]
+    return {
+        "file_bytes": os.path.getsize(filename),
+        "page_size": page_size,
+        "page_count": page_count,
+        "freelist_count": freelist_count,
+        "fragmentation": freelist_count / page_count if page_count else 0.0,
+        "auto_vacuum": AUTO_VACUUM_MODES.get(auto_vacuum, str(auto_vacuum)),
+    }
+
+
+class _Restarted(Exception):
+    """Raised from the progress callback when SQLite restarts a backup."""
+
+
+def backup(
+    source: str,
+    target: str,
+    pages: int = 64,
+    pause: float = 0.005,
+    max_restarts: int = 8,
+) -> dict:
+    """
+    Copy database source to target while it is in use.
+
+    Args:
+        source (str): Database file to copy.
+        target (str): File to write the copy to, replaced if it exists.
+        pages (int): Pages copied per batch, or -1 to copy in one go.
+        pause (float): Seconds to wait between batches, letting writers
+            commit.
+        max_restarts (int): Restarts caused by writers before the copy
+            is done in a single step.
+
+    Returns:
+        dict: Pages copied, number of batches and restarts, and seconds
+            taken.
+
+    Raises:
+        sqlite3.Error: If the copy fails. The partly written copy is
+            removed and target is left as it was.
+    """
+    batches = 0
+    restarts = 0
+    last_remaining: Optional[int] = None
+
+    def progress(_status, remaining, _total):
+        nonlocal batches, last_remaining
+        batches += 1
+        if last_remaining is not None and remaining > last_remaining:
+            raise _Restarted
+        last_remaining = remaining
+
+    started = time.perf_counter()
+    partial = f"{target}.partial"
+    try:
+        with Database(source) as src, Database(partial) as dst:
+            while src.connection and dst.connection:
+                last_remaining = None
+                try:
+                    src.connection.backup(
+                        dst.connection,
+                        pages=pages,
+                        progress=progress,
+                        sleep=pause,
+                    )
+                    break
+                except _Restarted:
+                    restarts += 1
+                    if restarts >= max_restarts or pages < 0:
+                        pages = -1
+                    else:
+                        pages *= 2
+                    pause = 0.0
+            (page_count,) = dst.read_query("PRAGMA page_count")[0]
+        os.replace(partial, target)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    return {
+        "target": target,
+        "pages": page_count,
+        "batches": batches,
+        "restarts": restarts,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def snapshot(
+    source: str, directory: str, keep: int = 7, pages: int = 64
+) -> dict:
+    """
+    Back up source to a timestamped file in directory.
+
+    Args:
+        source (str): Database file to copy.
+        directory (str): Directory for snapshots, created if missing.
+        keep (int): Number of most recent snapshots to keep.
+        pages (int): Pages copied per batch, see backup().
+
+    Returns:
+        dict: Result of backup(), plus the snapshots that were removed.
+    """
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(source))[0]
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    result = backup(
+        source, os.path.join(directory, f"{stem}-{stamp}.sql"), pages=pages
+    )
+    # only this source's snapshots, not those of "alice-work" for "alice"
+    pattern = re.compile(rf"{re.escape(stem)}-\d{{8}}T\d+\.sql")
+    snapshots = sorted(
+        name for name in os.listdir(directory) if pattern.fullmatch(name)
+    )
+    removed = snapshots[:-keep] if keep > 0 else []
+    for name in removed:
+        os.remove(os.path.join(directory, name))
+    result["removed"] = removed
+    return result
+
+
+def compact(filename: str, pages: Optional[int] = None) -> dict:
+    """
+    Free unused pages and optimize database file.
+
+    A database without auto_vacuum=INCREMENTAL is converted with a full
+    VACUUM instead. That rewrites the whole file, blocking writers until
+    it's done, and frees every page regardless of 'pages'.
+
+    Args:
+        filename (str): Database file to compact.
+        pages (int): Maximum number of free pages to release, all if None.
+
+    Returns:
+        dict: file_stats() from before and after compaction, and the
+            'method' used, "incremental_vacuum" or "vacuum".
+
+    Raises:
+        sqlite3.Error: If the database can't be vacuumed, e.g. because
+            another connection kept it busy.
+    """
+    before = file_stats(filename)
+    method = "incremental_vacuum"
+    with Database(filename) as database:
+        if before["auto_vacuum"] != "incremental":
+            method = "vacuum"
+            # script() raises, write_query() would only print the error
+            database.script("PRAGMA auto_vacuum = INCREMENTAL; VACUUM;")
+        else:
+            # executescript() steps the pragma until every page is freed,
+            # execute() would only free the first one
+            count = "" if pages is None else f"({int(pages)})"
+            database.script(f"PRAGMA incremental_vacuum{count};")
+        database.read_query("PRAGMA optimize")
+    return {
+        "method": method,
+        "before": before,
+        "after": file_stats(filename),
+    }
+
+
+class MaintenanceScheduler:
+    """
+    Run checkpoints, compaction and optionally snapshots in the background.
+
+    Attributes:
+        filename: Database file to maintain
+        interval: Seconds between runs
+        snapshot_directory: Directory for snapshots, or None to skip them
+        shards: Optional ShardRouter whose tenants are maintained too
+        last_report: Result of the latest run, or None before the first;
+            a run that failed reports its 'error', and each tenant's
+            result is kept by tenant under 'shards'
+
+    Methods:
+        start(): Start the background thread
+        stop(): Stop the background thread
+        run_once() -> dict: Run maintenance now
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        interval: float = 3600.0,
+        snapshot_directory: Optional[str] = None,
+        shards: Optional[ShardRouter] = None,
+    ):
+        """
+        Initialize MaintenanceScheduler object.
+
+        Args:
+            filename (str): Database file to maintain.
+            interval (float): Seconds between runs.
+            snapshot_directory (str): Directory for snapshots, if wanted.
+            shards (ShardRouter): Router of tenant databases to maintain
+                after filename.
+        """
+        self.filename = filename
+        self.interval = interval
+        self.snapshot_directory = snapshot_directory
+        self.shards = shards
+        self.last_report: Optional[dict] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __repr__(self):
+        """Return string resembling constructor call."""
+        return (
+            f'MaintenanceScheduler("{self.filename}", '
+            f"interval={self.interval})"
+        )
+
+    def run_once(self) -> dict:
+        """
+        Checkpoint, snapshot if configured, then compact the database.
+
+        Tenant databases are maintained one after the other, and one
+        that fails, e.g. because it is busy, doesn't stop the others.
+        """
+        report: dict = {"time": datetime.now().isoformat()}
+        report.update(self._maintain(self.filename, self.snapshot_directory))
+        if self.shards is not None:
+            directory = self.snapshot_directory and os.path.join(
+                self.snapshot_directory, SHARD_SNAPSHOTS
+            )
+            report["shards"] = {}
+            for tenant in self.shards.tenants():
+                try:
+                    report["shards"][tenant] = self._maintain(
+                        self.shards.path(tenant), directory
+                    )
+                except sqlite3.Error as error:
+                    report["shards"][tenant] = {"error": str(error)}
+        self.last_report = report
+        return report
+
+    @staticmethod
+    def _maintain(filename: str, directory: Optional[str]) -> dict:
+        report: dict = {}
+        with TimeblockDB(filename) as database:
+            report["checkpoint"] = database.checkpoint()
+        if directory:
+            report["snapshot"] = snapshot(filename, directory)
+        report["compact"] = compact(filename)
+        return report
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            if os.path.exists(self.filename):
+                try:
+                    self.run_once()
+                except sqlite3.Error as error:
+                    # e.g. busy, try again next interval
+                    self.last_report = {
+                        "time": datetime.now().isoformat(),
+                        "error": str(error),
+                    }
+
+    def start(self) -> None:
+        """Start running maintenance every interval seconds."""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="timeblock-maintenance", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread, waiting for a run to finish."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,244 @@
+"""
+Opt-in profiling of requests to the web server.
+
+RequestProfiler wraps handling of selected requests with cProfile and
+tracemalloc, and times every Database query made during the request.
+For each profiled request it writes three files to a directory:
+
+    <name>.json - Path, status, seconds, slowest queries and the lines
+        that allocated the most memory
+    <name>.prof - cProfile stats, for pstats or snakeviz
+    <name>.tracemalloc - tracemalloc snapshot, for tracemalloc.Snapshot.load
+
+A request is profiled when it sends the PROFILE_HEADER header, or is
+picked at random with probability sample_rate. Only one request is
+profiled at a time, since cProfile and tracemalloc are process-wide;
+requests arriving while another is profiled are served normally.
+Allocations made by other threads during a profiled request are
+included in its snapshot. Streamed responses are rendered in full
+before profiling stops, so profiled requests aren't streamed.
+
+The oldest profiles are deleted once there are more than max_profiles,
+or the directory holds more than max_bytes.
+
+The following constants are defined:
+    PROFILE_HEADER - Request header asking for a request to be profiled.
+    PROFILE_ID_HEADER - Response header naming the saved profile.
+"""
+import cProfile
+import json
+import os
+import random
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Optional
+
+from flask import Flask, Response, g, request
+
+from timeblock.sql import QUERY_LOG
+
+PROFILE_HEADER = "X-Timeblock-Profile"
+PROFILE_ID_HEADER = "X-Timeblock-Profile-Id"
+
+
+class RequestProfiler:
+    """
+    Profile selected requests and save the results to a directory.
+
+    Attributes:
+        directory: Directory profiles are written to
+        sample_rate: Share of requests profiled without the header
+        max_profiles: Number of profiles kept
+        max_bytes: Total size of profile files kept
+        traceback_limit: Frames stored for each allocation
+        top_allocations: Allocating lines listed in each summary
+        skipped: Requests not profiled because another one was
+
+    Methods:
+        init_app(app: Flask): Register request hooks on app
+        wanted -> bool: Return whether the current request is profiled
+        profiles(limit: int) -> list[dict]: Summaries, slowest first
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        sample_rate: float = 0.0,
+        max_profiles: int = 100,
+        max_bytes: int = 50_000_000,
+        traceback_limit: int = 5,
+        top_allocations: int = 20,
+    ):
+        """
+        Initialize RequestProfiler object.
+
+        Args:
+            directory (str): Directory for profiles, created if missing.
+            sample_rate (float): Share of requests profiled without the
+                header, from 0 to 1.
+            max_profiles (int): Number of profiles kept.
+            max_bytes (int): Total size of profile files kept.
+            traceback_limit (int): Frames stored for each allocation.
+            top_allocations (int): Allocating lines listed in summaries.
+        """
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_profiles = max_profiles
+        self.max_bytes = max_bytes
+        self.traceback_limit = traceback_limit
+        self.top_allocations = top_allocations
+        self.skipped = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def __repr__(self):
+        """Return string resembling constructor call."""
+        return (
+            f'RequestProfiler("{self.directory}", '
+            f"sample_rate={self.sample_rate})"
+        )
+
+    def init_app(self, app: Flask) -> None:
+        """Register hooks that profile requests to app."""
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._abandon)
+
+    def wanted(self) -> bool:
+        """Return whether the current request should be profiled."""
+        if request.headers.get(PROFILE_HEADER, "").lower() in (
+            "1",
+            "true",
+            "yes",
+        ):
+            return True
+        return random.random() < self.sample_rate
+
+    def _start(self) -> None:
+        if not self.wanted():
+            return
+        if not self._lock.acquire(blocking=False):
+            self.skipped += 1
+            return
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start(self.traceback_limit)
+        tracemalloc.reset_peak()
+        queries: list[tuple[str, float]] = []
+        profile = cProfile.Profile()
+        g.profile = {
+            "profile": profile,
+            "queries": queries,
+            "token": QUERY_LOG.set(queries),
+            "was_tracing": tracing,
+            "started": time.perf_counter(),
+        }
+        profile.enable()
+
+    def _stop(self) -> Optional[dict]:
+        """Stop profiling the current request, returning its state."""
+        state = g.pop("profile", None)
+        if state is None:
+            return None
+        state["profile"].disable()
+        state["seconds"] = time.perf_counter() - state["started"]
+        QUERY_LOG.reset(state["token"])
+        state["snapshot"] = tracemalloc.take_snapshot()
+        state["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        if not state["was_tracing"]:
+            tracemalloc.stop()
+        self._lock.release()
+        return state
+
+    def _finish(self, response: Response) -> Response:
+        if "profile" in g and response.is_streamed:
+            # render streamed bodies, e.g. templates, while still profiling
+            response.make_sequence()
+        state = self._stop()
+        if state is not None:
+            name = self._save(state, response.status_code)
+            response.headers[PROFILE_ID_HEADER] = name
+        return response
+
+    def _abandon(self, _error: Optional[BaseException]) -> None:
+        """Stop profiling a request that raised before after_request."""
+        self._stop()
+
+    def _save(self, state: dict, status: int) -> str:
+        """Write profile files for a request and return their name."""
+        name = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+        path = os.path.join(self.directory, name)
+        snapshot = state["snapshot"].filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        queries = sorted(state["queries"], key=lambda q: q[1], reverse=True)
+        summary = {
+            "name": name,
+            "method": request.method,
+            "path": request.path,
+            "status": status,
+            "seconds": round(state["seconds"], 6),
+            "query_count": len(queries),
+            "query_seconds": round(sum(q[1] for q in queries), 6),
+            "slowest_queries": [
+                {"query": query, "seconds": round(seconds, 6)}
+                for query, seconds in queries[:10]
+            ],
+            "peak_bytes": state["peak_bytes"],
+            "allocations": [
+                {
+                    "line": str(stat.traceback[0]),
+                    "bytes": stat.size,
+                    "count": stat.count,
+                }
+                for stat in snapshot.statistics("lineno")[
+                    : self.top_allocations
+                ]
+            ],
+        }
+        state["profile"].dump_stats(f"{path}.prof")
+        snapshot.dump(f"{path}.tracemalloc")
+        with open(f"{path}.json", "w", encoding="utf-8") as file:
+            json.dump(summary, file, indent=2)
+        self._prune()
+        return name
+
+    def _prune(self) -> None:
+        """Delete the oldest profiles beyond max_profiles or max_bytes."""
+        files: dict[str, list[str]] = {}
+        for filename in os.listdir(self.directory):
+            stem, extension = os.path.splitext(filename)
+            if extension in (".json", ".prof", ".tracemalloc"):
+                files.setdefault(stem, []).append(filename)
+        sizes = {
+            stem: sum(
+                os.path.getsize(os.path.join(self.directory, filename))
+                for filename in filenames
+            )
+            for stem, filenames in files.items()
+        }
+        total = sum(sizes.values())
+        stems = sorted(files)
+        while stems and (
+            len(stems) > self.max_profiles or total > self.max_bytes
+        ):
+            stem = stems.pop(0)
+            total -= sizes[stem]
+            for filename in files[stem]:
+                os.remove(os.path.join(self.directory, filename))
+
+    def profiles(self, limit: int = 20) -> list[dict]:
+        """Return summaries of saved profiles, slowest first."""
+        summaries = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".json"):
+                path = os.path.join(self.directory, filename)
+                try:
+                    with open(path, encoding="utf-8") as file:
+                        summaries.append(json.load(file))
+                except (OSError, ValueError):
+                    continue  # pruned or still being written
+        summaries.sort(key=lambda summary: summary["seconds"], reverse=True)
+        return summaries[:limit]
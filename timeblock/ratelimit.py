@@ -0,0 +1,227 @@
+"""
+Rate limiting and admission control for writes to the web server.
+
+Every request that can write, i.e. any method but GET, HEAD and OPTIONS,
+passes two checks before its view runs:
+
+    1. A token bucket per client, keyed by remote address, refilled at
+       'rate' tokens a second up to 'burst'. A client with an empty
+       bucket gets '429 Too Many Requests' with Retry-After set to the
+       seconds until it has a token again.
+    2. A global admission queue in front of the database. At most
+       'concurrency' writes run at once; others wait up to
+       'queue_timeout' seconds for a slot, and at most 'queue_size' of
+       them wait at all. A write that can't be admitted gets '503
+       Service Unavailable' with Retry-After, since the server rather
+       than the client is the one that is too busy.
+
+SQLite has a single writer, so letting every thread queue on its lock
+only makes everyone slow; waiting here instead bounds the number of
+threads blocked on the database and fails fast when it falls behind.
+
+Buckets of clients not seen for a while are dropped once there are more
+than 'max_clients' of them, which resets those clients to a full bucket.
+
+Example:
+>>> from timeblock.ratelimit import RateLimiter
+>>> limiter = RateLimiter(rate=1.0, burst=2)
+>>> limiter.take("10.0.0.1", now=0.0), limiter.take("10.0.0.1", now=0.0)
+(0.0, 0.0)
+>>> limiter.take("10.0.0.1", now=0.0)
+1.0
+
+The following constants are defined:
+    SAFE_METHODS - Methods that never write and aren't limited.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from flask import Flask, Response, g, request
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class RateLimiter:
+    """
+    Per-client token buckets and a global admission queue for writes.
+
+    Attributes:
+        rate: Tokens added to each bucket a second, or None for no limit
+        burst: Size of each bucket
+        concurrency: Writes handled at once, or None for no limit
+        queue_size: Writes allowed to wait for a slot
+        queue_timeout: Seconds a write waits for a slot
+        max_clients: Buckets kept before the least recent are dropped
+        limited: Requests refused because their bucket was empty
+        rejected: Requests refused because no slot was free in time
+        admitted: Requests let through
+
+    Methods:
+        init_app(app: Flask): Register request hooks on app
+        take(client: str) -> float: Take a token, or return seconds to
+            wait for one
+        admit -> bool: Wait for a write slot
+        release(): Give a write slot back
+        stats() -> dict: Return limits, counters and queue length
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        burst: int = 10,
+        concurrency: Optional[int] = None,
+        queue_size: int = 64,
+        queue_timeout: float = 5.0,
+        max_clients: int = 10_000,
+    ):
+        """
+        Initialize RateLimiter object.
+
+        Args:
+            rate (float): Writes a second allowed for each client in the
+                long run, or None for no per-client limit.
+            burst (int): Writes a client may make at once.
+            concurrency (int): Writes handled at once, or None to admit
+                every write.
+            queue_size (int): Writes allowed to wait for a slot.
+            queue_timeout (float): Seconds a write waits for a slot.
+            max_clients (int): Buckets kept in memory.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.max_clients = max_clients
+        self.limited = 0
+        self.rejected = 0
+        self.admitted = 0
+        self._buckets: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._slots = (
+            threading.BoundedSemaphore(concurrency) if concurrency else None
+        )
+        self._waiting = 0
+
+    def __repr__(self):
+        """Return string resembling constructor call."""
+        return (
+            f"RateLimiter(rate={self.rate}, burst={self.burst}, "
+            f"concurrency={self.concurrency})"
+        )
+
+    def init_app(self, app: Flask) -> None:
+        """Register hooks that limit writes to app."""
+        app.before_request(self._check)
+        app.teardown_request(self._finish)
+
+    def take(self, client: str, now: Optional[float] = None) -> float:
+        """
+        Take a token from the bucket of client.
+
+        Args:
+            client (str): Key of the client, e.g. its address.
+            now (float): time.monotonic() reading, the current one if
+                None.
+
+        Returns:
+            float: 0 if a token was taken, otherwise the seconds until
+                the bucket has one.
+        """
+        if self.rate is None:
+            return 0.0
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = [float(self.burst), now]
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket[0] = min(
+                    self.burst, bucket[0] + (now - bucket[1]) * self.rate
+                )
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            self.limited += 1
+            return (1 - bucket[0]) / self.rate
+
+    def admit(self) -> bool:
+        """
+        Wait for a write slot, for at most queue_timeout seconds.
+
+        Returns:
+            bool: True if a slot was taken, which must be given back
+                with release(); False if the queue is full or the wait
+                timed out.
+        """
+        if self._slots is None:
+            return True
+        if self._slots.acquire(blocking=False):
+            return True
+        with self._lock:
+            if self._waiting >= self.queue_size:
+                self.rejected += 1
+                return False
+            self._waiting += 1
+        try:
+            admitted = self._slots.acquire(timeout=self.queue_timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        if not admitted:
+            with self._lock:
+                self.rejected += 1
+        return admitted
+
+    def release(self) -> None:
+        """Give back a slot taken by admit()."""
+        if self._slots is not None:
+            self._slots.release()
+
+    def _check(self) -> Optional[Response]:
+        if request.method in SAFE_METHODS:
+            return None
+        wait = self.take(request.remote_addr or "")
+        if wait:
+            return self._refuse("Too many requests", 429, wait)
+        if not self.admit():
+            return self._refuse("Server busy", 503, self.queue_timeout)
+        g.write_slot = True
+        with self._lock:
+            self.admitted += 1
+        return None
+
+    def _finish(self, _error: Optional[BaseException]) -> None:
+        if g.pop("write_slot", False):
+            self.release()
+
+    @staticmethod
+    def _refuse(message: str, status: int, wait: float) -> Response:
+        """Return response asking the client to retry after wait seconds."""
+        return Response(
+            message,
+            status=status,
+            headers={"Retry-After": str(max(1, math.ceil(wait)))},
+        )
+
+    def stats(self) -> dict:
+        """Return limits, counters and the number of waiting writes."""
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "concurrency": self.concurrency,
+                "clients": len(self._buckets),
+                "waiting": self._waiting,
+                "admitted": self.admitted,
+                "limited": self.limited,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,222 @@
+"""
+Route each tenant (a user or calendar) to its own SQLite database file.
+
+Keeping every tenant in a separate file means each has its own write
+lock and its own 'app_data' row, so writers for different tenants don't
+wait on each other.
+
+ShardRouter keeps a bounded pool of open TimeblockDB handles, closing
+the least recently used idle handle when the pool is full. Handles are
+opened outside the pool's lock, so opening one tenant's file doesn't
+hold up requests for the others, and catch up on events missing from
+the projection as they open, like the app's own database. Each handle
+keeps its tenant's ActionCache and DependencyGraph while it is open.
+Queries across every tenant are run by attaching the shard files to a
+single in-memory connection.
+
+Example:
+>>> from timeblock.action import Action
+>>> from timeblock.shard import ShardRouter
+>>> router = ShardRouter("shards")
+>>> with router.connect("alice") as database:
+...     database.add_action(Action("write report"))
+>>> router.admin_query("SELECT COUNT(*) FROM {shard}.action")
+[('alice', 1)]
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from timeblock.broadcast import Broadcaster
+from timeblock.cache import ActionCache
+from timeblock.graph import DependencyGraph
+from timeblock.sql import Database, TimeblockDB
+
+
+TENANT_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+SHARD_SUFFIX = ".sql"
+MAX_ATTACHED = 10  # SQLite's default limit on attached databases
+
+
+class _Shard:
+    """TimeblockDB handle and the lock serializing its use."""
+
+    def __init__(self, database: TimeblockDB):
+        self.database = database
+        self.lock = threading.Lock()
+        self.users = 0
+        self.opened = False
+
+    def open(self) -> None:
+        """Open the handle, applying events missing from the projection."""
+        self.database.__enter__()
+        try:
+            self.database.catch_up()
+        except BaseException:
+            self.database.__exit__(None, None, None)
+            raise
+        self.opened = True
+
+
+class ShardRouter:
+    """
+    Map tenants to database files and pool their open handles.
+
+    Attributes:
+        directory: Directory holding one database file per tenant
+        max_open: Maximum number of handles kept open at once
+        cache_size: Size of the ActionCache given to each handle
+        broadcaster: Optional Broadcaster given to each handle
+
+    Methods:
+        path(tenant: str) -> str: Return database file for tenant
+        connect(tenant: str): Context manager yielding tenant's TimeblockDB
+        tenants() -> list[str]: Return tenants with a database file
+        admin_query(query: str) -> list[tuple]: Run query on every shard
+        close(): Close every open handle
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_open: int = 32,
+        cache_size: int = 1024,
+        broadcaster: Optional[Broadcaster] = None,
+    ):
+        """
+        Initialize ShardRouter object.
+
+        Args:
+            directory (str): Directory for the tenant database files,
+                created if it doesn't exist.
+            max_open (int): Maximum number of open handles.
+            cache_size (int): Size of the ActionCache for each handle.
+            broadcaster (Broadcaster): Publisher of changes to actions,
+                with the tenant's database file as channel.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_open = max_open
+        self.cache_size = cache_size
+        self.broadcaster = broadcaster
+        self._shards: OrderedDict[str, _Shard] = OrderedDict()
+        self._pool_lock = threading.Condition()
+
+    def __repr__(self):
+        """Return string resembling constructor call."""
+        return f'ShardRouter("{self.directory}", max_open={self.max_open})'
+
+    def path(self, tenant: str) -> str:
+        """
+        Return path to the database file for tenant.
+
+        Raises:
+            ValueError: If tenant isn't a safe file name.
+        """
+        if not TENANT_PATTERN.match(tenant):
+            raise ValueError(f"Invalid tenant name: {tenant!r}")
+        return os.path.join(self.directory, tenant + SHARD_SUFFIX)
+
+    @contextmanager
+    def connect(self, tenant: str) -> Iterator[TimeblockDB]:
+        """
+        Yield open TimeblockDB for tenant.
+
+        The handle is taken from the pool, or opened if it isn't there.
+        Only one thread uses a handle at a time.
+        """
+        shard = self._acquire(tenant)
+        try:
+            with shard.lock:
+                if not shard.opened:
+                    shard.open()
+                yield shard.database
+        finally:
+            with self._pool_lock:
+                shard.users -= 1
+                self._pool_lock.notify_all()
+
+    def _acquire(self, tenant: str) -> _Shard:
+        """Return pooled handle for tenant, marking it in use."""
+        path = self.path(tenant)
+        with self._pool_lock:
+            while True:
+                shard = self._shards.get(tenant)
+                if shard is not None:
+                    self._shards.move_to_end(tenant)
+                    break
+                if len(self._shards) < self.max_open or self._evict():
+                    # opened by connect(), without holding the pool lock
+                    shard = _Shard(
+                        TimeblockDB(
+                            path,
+                            cache=ActionCache(self.cache_size),
+                            check_same_thread=False,
+                            broadcaster=self.broadcaster,
+                            graph=DependencyGraph(),
+                        )
+                    )
+                    self._shards[tenant] = shard
+                    break
+                self._pool_lock.wait()
+            shard.users += 1
+            return shard
+
+    def _evict(self) -> bool:
+        """Close least recently used idle handle, if there is one."""
+        for tenant, shard in self._shards.items():
+            if shard.users == 0:
+                del self._shards[tenant]
+                if shard.opened:
+                    shard.database.__exit__(None, None, None)
+                return True
+        return False
+
+    def tenants(self) -> list[str]:
+        """Return sorted names of tenants that have a database file."""
+        return sorted(
+            name[: -len(SHARD_SUFFIX)]
+            for name in os.listdir(self.directory)
+            if name.endswith(SHARD_SUFFIX)
+            and TENANT_PATTERN.match(name[: -len(SHARD_SUFFIX)])
+        )
+
+    def admin_query(
+        self, query: str, tenants: Optional[list[str]] = None
+    ) -> list[tuple]:
+        """
+        Run read query on every shard and return the combined rows.
+
+        Args:
+            query (str): SELECT statement where '{shard}' stands for the
+                schema name of the attached shard, for example
+                "SELECT COUNT(*) FROM {shard}.action".
+            tenants (list[str]): Tenants to query, defaults to all.
+
+        Returns:
+            list[tuple]: Rows of the query, each prefixed with the tenant.
+        """
+        tenants = self.tenants() if tenants is None else tenants
+        result: list[tuple] = []
+        for start in range(0, len(tenants), MAX_ATTACHED):
+            group = tenants[start : start + MAX_ATTACHED]
+            with Database(":memory:") as database:
+                for i, tenant in enumerate(group):
+                    database.write_query(
+                        f"ATTACH DATABASE ? AS shard{i}", (self.path(tenant),)
+                    )
+                union = " UNION ALL ".join(
+                    f"SELECT ?, * FROM ({query.format(shard=f'shard{i}')})"
+                    for i in range(len(group))
+                )
+                result.extend(database.read_query(union, tuple(group)))
+        return result
+
+    def close(self) -> None:
+        """Close every idle handle in the pool."""
+        with self._pool_lock:
+            while self._evict():
+                pass
@@ -0,0 +1,485 @@
+"""
+What-if simulation of schedules on a pool of processes.
+
+A Problem holds the estimated durations of some actions and the
+constraints on them: dependencies, optional deadlines and weights, and
+optionally the hours available each day. Candidate schedules are random
+orders of the actions that respect the dependencies, each laid out back
+to back and scored by weighted finishing time plus lateness.
+
+Candidates are numbered by seed, and each one is generated from its
+seed alone, so workers are sent the problem as a few arrays plus a
+range of seeds, and send back only the scores and seeds of their best
+candidates. The parent regenerates the top schedules from their seeds.
+Neither Action objects nor whole schedules cross process boundaries.
+
+Every worker checks a deadline as it goes and returns what it has so far
+when the time is up, and chunks not started by then are cancelled, so a
+simulation that times out still returns the best schedules found.
+
+Example:
+>>> from timeblock.simulate import Problem, simulate
+>>> problem = Problem(
+...     [1, 2, 3], [3600, 1800, 600], deadlines=[3600, None, None]
+... )
+>>> simulate(problem, candidates=100, workers=0)["schedules"][0]["order"]
+[1, 3, 2]
+
+The following constants are defined:
+    CHUNKS_PER_WORKER - Chunks of seeds each worker is given.
+    LATENESS_WEIGHT - Cost of an hour of lateness, relative to an hour of
+        weighted finishing time.
+    DAY - Seconds in a day, the stride of working hours.
+
+The following classes are defined:
+    Problem - Actions to arrange and the constraints on them.
+    Simulator - Pool of worker processes shared between simulations.
+
+The following functions are defined:
+    simulate - Score candidate schedules and return the best ones.
+    evaluate - Score a range of candidates, as run by each worker.
+"""
+import heapq
+import math
+import multiprocessing
+import os
+import random
+import threading
+import time
+from array import array
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Sequence
+
+CHUNKS_PER_WORKER = 4
+LATENESS_WEIGHT = 10.0
+DAY = 86_400
+
+
+class Problem:
+    """
+    Actions to arrange and the constraints on them.
+
+    Everything is stored in flat arrays indexed by the position of the
+    action in 'ids', which pickle as a few bytes per action.
+
+    Attributes:
+        ids: Action ids
+        durations: Estimated seconds of each action
+        deadlines: Seconds from the start each action should be done by,
+            or infinity
+        weights: Importance of finishing each action early
+        edges: Pairs of positions (before, after), flattened
+        hours_per_day: Working hours from the start of each day, or None
+            to schedule around the clock
+
+    Methods:
+        order(seed: int) -> list[int]: Return positions in the order of
+            candidate seed
+        starts(order: list[int]) -> list[float]: Return start of each
+            action in order, in seconds
+        score(order: list[int]) -> float: Return cost of order
+    """
+
+    def __init__(
+        self,
+        ids: Sequence[int],
+        durations: Sequence[float],
+        dependencies: Sequence[tuple[int, int]] = (),
+        deadlines: Optional[Sequence[Optional[float]]] = None,
+        weights: Optional[Sequence[float]] = None,
+        hours_per_day: Optional[float] = None,
+    ):
+        """
+        Initialize Problem object.
+
+        Args:
+            ids (Sequence): Action ids.
+            durations (Sequence): Estimated seconds of each action.
+            dependencies (Sequence): Pairs of action ids (before, after),
+                meaning 'after' has to wait for 'before'. Pairs naming
+                other actions are ignored.
+            deadlines (Sequence): Seconds from the start of the schedule
+                each action should be done by, or None for no deadline.
+            weights (Sequence): Importance of each action, 1 by default.
+            hours_per_day (float): Working hours from the start of each
+                day; actions that don't fit move to the next day.
+
+        Raises:
+            ValueError: If the sequences differ in length, or a working
+                day isn't between 0 and 24 hours.
+        """
+        count = len(ids)
+        for name, values in [
+            ("durations", durations),
+            ("deadlines", deadlines),
+            ("weights", weights),
+        ]:
+            if values is not None and len(values) != count:
+                raise ValueError(f"{name} must have one value per action")
+        if hours_per_day is not None and not 0 < hours_per_day <= 24:
+            raise ValueError("hours_per_day must be between 0 and 24")
+        self.ids = array("q", ids)
+        self.durations = array("d", durations)
+        self.deadlines = array(
+            "d",
+            (
+                math.inf if deadline is None else deadline
+                for deadline in (deadlines or [None] * count)
+            ),
+        )
+        self.weights = array("d", weights or [1.0] * count)
+        position = {action_id: i for i, action_id in enumerate(ids)}
+        self.edges = array(
+            "q",
+            (
+                i
+                for before, after in dependencies
+                if before in position and after in position
+                for i in (position[before], position[after])
+            ),
+        )
+        self.hours_per_day = hours_per_day
+        self._graph: Optional[tuple[list[list[int]], list[int]]] = None
+
+    def __repr__(self):
+        """Return string resembling constructor call."""
+        return f"Problem(<{len(self.ids)} actions>)"
+
+    def __len__(self) -> int:
+        """Return number of actions."""
+        return len(self.ids)
+
+    def __getstate__(self) -> dict:
+        """Leave the adjacency lists out of pickles; they're rebuilt."""
+        state = self.__dict__.copy()
+        state["_graph"] = None
+        return state
+
+    def _adjacency(self) -> tuple[list[list[int]], list[int]]:
+        """Return actions after each action, and counts of those before."""
+        if self._graph is None:
+            after: list[list[int]] = [[] for _ in self.ids]
+            waiting = [0] * len(self.ids)
+            edges = self.edges
+            for i in range(0, len(edges), 2):
+                after[edges[i]].append(edges[i + 1])
+                waiting[edges[i + 1]] += 1
+            self._graph = after, waiting
+        return self._graph
+
+    def order(self, seed: int) -> list[int]:
+        """
+        Return positions of the actions in the order of candidate seed.
+
+        Raises:
+            ValueError: If the dependencies contain a cycle.
+        """
+        rng = random.Random(seed)
+        after, counts = self._adjacency()
+        waiting = counts.copy()
+        ready = [i for i, count in enumerate(waiting) if not count]
+        order = []
+        while ready:
+            index = rng.randrange(len(ready))
+            ready[index], ready[-1] = ready[-1], ready[index]
+            node = ready.pop()
+            order.append(node)
+            for other in after[node]:
+                waiting[other] -= 1
+                if not waiting[other]:
+                    ready.append(other)
+        if len(order) < len(waiting):
+            raise ValueError("Dependencies contain a cycle")
+        return order
+
+    def starts(self, order: list[int]) -> list[float]:
+        """Return start of each action in order, in seconds from start."""
+        window = self.hours_per_day * 3600 if self.hours_per_day else None
+        now = 0.0
+        starts = []
+        for node in order:
+            duration = self.durations[node]
+            if window is not None:
+                day, offset = divmod(now, DAY)
+                if offset >= window or (offset and offset + duration > window):
+                    now = (day + 1) * DAY
+            starts.append(now)
+            now += duration
+        return starts
+
+    def score(self, order: list[int]) -> float:
+        """
+        Return cost of order; lower is better.
+
+        The cost is the weighted sum of finishing times, plus the
+        lateness past deadlines times LATENESS_WEIGHT, in hours.
+        """
+        durations, deadlines, weights = (
+            self.durations,
+            self.deadlines,
+            self.weights,
+        )
+        total = 0.0
+        for node, start in zip(order, self.starts(order)):
+            finish = start + durations[node]
+            total += weights[node] * finish
+            if finish > deadlines[node]:
+                total += LATENESS_WEIGHT * (finish - deadlines[node])
+        return total / 3600
+
+
+def evaluate(
+    problem: Problem,
+    first: int,
+    count: int,
+    top: int,
+    deadline: float = math.inf,
+) -> tuple[list[tuple[float, int]], int]:
+    """
+    Score candidates first to first + count - 1.
+
+    Args:
+        problem (Problem): Actions and constraints.
+        first (int): Seed of the first candidate.
+        count (int): Number of candidates.
+        top (int): Number of best candidates to return.
+        deadline (float): time.time() to stop at, returning the best
+            candidates scored so far.
+
+    Returns:
+        tuple: The best (score, seed) pairs, lowest score first, and the
+            number of candidates scored.
+    """
+    best: list[tuple[float, int]] = []  # heap of (-score, seed)
+    scored = 0
+    for seed in range(first, first + count):
+        if not scored % 64 and time.time() > deadline:
+            break
+        score = problem.score(problem.order(seed))
+        scored += 1
+        if len(best) < top:
+            heapq.heappush(best, (-score, seed))
+        elif -score > best[0][0]:
+            heapq.heapreplace(best, (-score, seed))
+    return sorted((-score, seed) for score, seed in best), scored
+
+
+class Simulator:
+    """
+    Pool of worker processes shared between simulations.
+
+    Workers are started with 'spawn', so the pool is safe to create from
+    a threaded web server. They are started by the first run() and kept
+    until close() is called. If a worker dies, the broken pool is
+    replaced and the run is tried once more on the new one. With 0
+    workers, candidates are scored in the calling thread instead.
+
+    Attributes:
+        workers: Number of worker processes
+
+    Methods:
+        run(problem: Problem, ...) -> dict: Score candidates on the pool
+        close(): Stop the worker processes
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        """
+        Initialize Simulator object.
+
+        Args:
+            workers (int): Number of worker processes, the number of
+                CPUs if None, or 0 to score in the calling thread.
+        """
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        """Return string resembling constructor call."""
+        return f"Simulator(workers={self.workers})"
+
+    def __enter__(self):
+        """Return self, closing the pool on exit."""
+        return self
+
+    def __exit__(self, *_exc):
+        """Stop the worker processes."""
+        self.close()
+
+    def run(
+        self,
+        problem: Problem,
+        candidates: int = 10_000,
+        top: int = 5,
+        timeout: Optional[float] = None,
+        seed: int = 0,
+    ) -> dict:
+        """
+        Score candidates on the pool and return the best schedules.
+
+        See simulate() for the arguments and result.
+
+        Raises:
+            BrokenProcessPool: If a worker died on the new pool too.
+        """
+        if not self.workers:
+            return _run(None, 0, problem, candidates, top, timeout, seed)
+        started = time.time()
+        try:
+            return self._run_on_pool(problem, candidates, top, timeout, seed)
+        except BrokenProcessPool:
+            if timeout is not None:
+                timeout = max(0.0, timeout - (time.time() - started))
+            return self._run_on_pool(problem, candidates, top, timeout, seed)
+
+    def _run_on_pool(
+        self,
+        problem: Problem,
+        candidates: int,
+        top: int,
+        timeout: Optional[float],
+        seed: int,
+    ) -> dict:
+        """Run on the pool, discarding the pool if a worker died."""
+        executor = self._pool()
+        try:
+            return _run(
+                executor,
+                self.workers,
+                problem,
+                candidates,
+                top,
+                timeout,
+                seed,
+            )
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise
+
+    def _pool(self) -> ProcessPoolExecutor:
+        """Return the pool, starting it if there isn't one."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        """Drop broken executor, so the next run starts a new pool."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def close(self) -> None:
+        """Stop the worker processes, cancelling queued work."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def _run(
+    executor: Optional[ProcessPoolExecutor],
+    workers: int,
+    problem: Problem,
+    candidates: int,
+    top: int,
+    timeout: Optional[float],
+    seed: int,
+) -> dict:
+    """Score candidates in chunks, on executor or in this process."""
+    if candidates < 1 or top < 1:
+        raise ValueError("candidates and top must be at least 1")
+    started = time.time()
+    deadline = started + timeout if timeout is not None else math.inf
+    problem.order(seed)  # raise for a cycle here, not in every worker
+    results: list[tuple[list[tuple[float, int]], int]] = []
+    cancelled = 0
+    if executor is None:
+        results.append(evaluate(problem, seed, candidates, top, deadline))
+    else:
+        chunks = max(1, min(candidates, workers * CHUNKS_PER_WORKER))
+        size = -(-candidates // chunks)
+        futures: list[Future] = [
+            executor.submit(
+                evaluate,
+                problem,
+                seed + first,
+                min(size, candidates - first),
+                top,
+                deadline,
+            )
+            for first in range(0, candidates, size)
+        ]
+        # workers stop at the deadline, allow a moment to hear back
+        done, pending = wait(
+            futures, None if timeout is None else timeout + 1.0
+        )
+        for future in pending:
+            cancelled += future.cancel()
+        results.extend(future.result() for future in done)
+    best = heapq.nsmallest(
+        top, (pair for chunk, _ in results for pair in chunk)
+    )
+    scored = sum(count for _, count in results)
+    schedules = []
+    for score, candidate in best:
+        order = problem.order(candidate)
+        schedules.append(
+            {
+                "score": round(score, 3),
+                "seed": candidate,
+                "order": [problem.ids[node] for node in order],
+                "starts": problem.starts(order),
+            }
+        )
+    return {
+        "schedules": schedules,
+        "scored": scored,
+        "complete": scored == candidates,
+        "cancelled_chunks": cancelled,
+        "seconds": round(time.time() - started, 3),
+    }
+
+
+def simulate(
+    problem: Problem,
+    candidates: int = 10_000,
+    top: int = 5,
+    workers: Optional[int] = None,
+    timeout: Optional[float] = None,
+    seed: int = 0,
+) -> dict:
+    """
+    Score candidate schedules and return the best ones.
+
+    A pool is started for this call only; use a Simulator to keep one
+    between calls.
+
+    Args:
+        problem (Problem): Actions and constraints.
+        candidates (int): Number of candidate schedules to score.
+        top (int): Number of schedules to return.
+        workers (int): Worker processes, the number of CPUs if None, or
+            0 to score in this process.
+        timeout (float): Seconds to score for before returning the best
+            schedules found so far, or None to score every candidate.
+        seed (int): Seed of the first candidate.
+
+    Returns:
+        dict: "schedules", the best schedules with their "score",
+            "seed", action ids in "order" and "starts" in seconds from
+            the start; "scored", the number of candidates scored;
+            "complete", whether that is all of them; "cancelled_chunks"
+            and "seconds".
+
+    Raises:
+        ValueError: If the dependencies contain a cycle, or candidates or
+            top is less than 1.
+    """
+    with Simulator(workers) as simulator:
+        return simulator.run(problem, candidates, top, timeout, seed)
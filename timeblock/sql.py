@@ -5,16 +5,45 @@ Database class provides a context manager for managing SQLite connections
 and cursors. It provides methods for executing queries and scripts.
 
 TimeblockDB is a subclass of Database that provides methods specific
-to the Timeblock application.
+to the Timeblock application. TimerError is raised when switching the
+timer can't start the new one.
+
+Every change to an action is appended to the 'action_event' table, and
+the 'action' table is a projection of that log. A checkpoint stores a
+compressed copy of the projection, so it can be rebuilt by replaying
+only the events recorded after the latest checkpoint.
+
+For syncing with other instances, every action has a 'uuid' that is the
+same everywhere, the time it was 'updated' and the 'seq' of the event
+that last changed it. Deleted actions leave a row in 'action_tombstone'
+with the same three values. A synced change that takes the description
+or start of another action is settled by renaming whichever of the two
+was updated first. See timeblock.sync.
 
 This module contains the following constants:
     - DB: TypeVar for Database class, for type hinting
     - SqlType: Union of types that can be stored in SQLite3 database
     - SqlSeq: Type for parameters in queries
+    - PROJECTED_FIELDS: Columns of 'action' set by events, besides id
+        and the 'updated' and 'seq' columns set by every event
+    - SYNC_FIELDS: Fields of an action sent to other instances
+    - EVENT_KINDS: Kinds of event recorded in the 'action_event' table
+    - BROADCAST_KINDS: Broadcaster event kind for each event kind
+    - REPLAY_BATCH: Number of events read at a time during replay
+    - DEFAULT_BLOCK: Duration planned for actions without an estimate
+    - QUERY_LOG: Context variable that, when set to a list, collects
+        (query, seconds) for every query, e.g. while profiling a request
 """
 
+import json
+import math
 import sqlite3
+import time
+import uuid
+import zlib
 from sqlite3 import Error, Connection, Cursor
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 from typing import (
     Union,
@@ -23,17 +52,72 @@ from typing import (
     Sequence,
     Mapping,
     Iterable,
+    Iterator,
+    Callable,
 )
 from datetime import datetime, date, timedelta
+from functools import partial
 
-from typing_extensions import TypeGuard
+try:
+    from typing import TypeGuard
+except ImportError:  # Python < 3.10
+    from typing_extensions import TypeGuard
 
 from timeblock.action import Action
+from timeblock.broadcast import Broadcaster
+from timeblock.cache import ActionCache
+from timeblock.graph import CycleError, DependencyGraph
+from timeblock.stopwatch import Stopwatch
 
 
 DB = TypeVar("DB", bound="Database")
 SqlType = Union[None, int, float, str, bytes, date, datetime, timedelta]
 SqlSeq = Union[tuple[SqlType, ...], dict[str, SqlType]]
+PROJECTED_FIELDS = (
+    "desc",
+    "est_duration",
+    "actual_duration",
+    "start_datetime",
+    "uuid",
+)
+SYNC_FIELDS = (
+    "uuid",
+    "seq",
+    "updated",
+    "desc",
+    "est_duration",
+    "actual_duration",
+    "start_datetime",
+)
+EVENT_KINDS = ("create", "update", "start", "stop", "delete", "restore")
+BROADCAST_KINDS = {
+    "create": "insert",
+    "update": "update",
+    "start": "update",
+    "stop": "update",
+    "delete": "delete",
+    "restore": "insert",
+}
+REPLAY_BATCH = 10_000
+DEFAULT_BLOCK = timedelta(minutes=30)
+QUERY_LOG: ContextVar[Optional[list[tuple[str, float]]]] = ContextVar(
+    "QUERY_LOG", default=None
+)
+NEXT_ACTION_ID = """(
+    SELECT MAX(
+        COALESCE((SELECT MAX(id) FROM action), 0),
+        COALESCE((SELECT MAX(action_id) FROM action_event), 0)
+    ) + 1
+)"""
+LAST_EVENT_SEQ = """(
+    SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence
+    WHERE name = 'action_event'
+)"""
+NEW_UUID = "lower(hex(randomblob(16)))"
+
+
+class TimerError(RuntimeError):
+    """Raised when switch_timer() can't start the timer it was asked to."""
 
 
 class Database:
@@ -53,25 +137,41 @@ class Database:
             query: str,
             parameters: Union[SqlSeq, Sequence[SqlSeq], None] = None,
         ) -> Optional[int]: Send query to write to database
+        logged(query: str): Context manager timing query into QUERY_LOG
         is_not_string: Type checks if object is a string
         is_list_of_iter: Type checks if object is a list of iterables
         script: Execute SQL script
+        transaction(immediate: bool = False): Context manager grouping
+            writes into one commit
+        on_commit(func: Callable): Call func once writes are committed
+        on_rollback(func: Callable): Call func if writes are rolled back
     """
 
-    def __init__(self, filename: Optional[str] = None):
+    def __init__(
+        self, filename: Optional[str] = None, check_same_thread: bool = True
+    ):
         """
         Initialize Database object.
 
         Args:
             filename (str): Name or path to database file.
+            check_same_thread (bool): If False, the connection may be used
+                by threads other than the one that opened it. The caller
+                must then serialize access to it.
         """
         self.connection: Optional[Connection] = None
         self.cursor: Optional[Cursor] = None
         self.filename = filename if filename else "db.sql"
+        self.check_same_thread = check_same_thread
+        self._in_transaction = False
+        self._after_commit: list[Callable[[], None]] = []
+        self._after_rollback: list[Callable[[], None]] = []
 
     def __enter__(self: DB):
         """Enter context manager, open connection and cursor."""
-        self.connection = sqlite3.connect(self.filename)
+        self.connection = sqlite3.connect(
+            self.filename, check_same_thread=self.check_same_thread
+        )
         print(f"Connected to {self.filename}")
         self.cursor = self.connection.cursor()
         return self
@@ -94,11 +194,12 @@ class Database:
         result: list[tuple] = []
         if self.cursor:
             try:
-                if parameters:
-                    self.cursor.execute(query, parameters)
-                else:
-                    self.cursor.execute(query)
-                result = self.cursor.fetchall()
+                with self.logged(query):
+                    if parameters:
+                        self.cursor.execute(query, parameters)
+                    else:
+                        self.cursor.execute(query)
+                    result = self.cursor.fetchall()
             except Error as e:
                 print(f"Error: {e}")
         else:
@@ -121,15 +222,17 @@ class Database:
         """
         if self.cursor and self.connection:
             try:
-                if not parameters:
-                    self.cursor.execute(query)
-                elif isinstance(parameters, Sequence) and self.is_list_of_iter(
-                    parameters
-                ):
-                    self.cursor.executemany(query, parameters)
-                elif isinstance(parameters, (dict, tuple, list)):
-                    self.cursor.execute(query, parameters)
-                self.connection.commit()
+                with self.logged(query):
+                    if not parameters:
+                        self.cursor.execute(query)
+                    elif isinstance(
+                        parameters, Sequence
+                    ) and self.is_list_of_iter(parameters):
+                        self.cursor.executemany(query, parameters)
+                    elif isinstance(parameters, (dict, tuple, list)):
+                        self.cursor.execute(query, parameters)
+                    if not self._in_transaction:
+                        self.connection.commit()
                 return self.cursor.lastrowid
 
             except Error as e:
@@ -138,10 +241,28 @@ class Database:
             print("Error: no cursor, are you using 'with'?")
         return None
 
+    @staticmethod
+    @contextmanager
+    def logged(query: str) -> Iterator[None]:
+        """Time query if QUERY_LOG is collecting queries for this context."""
+        log = QUERY_LOG.get()
+        if log is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            log.append((" ".join(query.split()), elapsed))
+
     @staticmethod
     def is_not_string(obj) -> TypeGuard[Iterable]:
         """Type checks if object is a string."""
-        iter(obj)
+        try:
+            iter(obj)
+        except TypeError:
+            return False
         if isinstance(obj, str):
             return False
         return True
@@ -160,9 +281,152 @@ class Database:
                 cur = con.cursor()
                 cur.executescript(sql_script)
 
+    @contextmanager
+    def transaction(self: DB, immediate: bool = False) -> Iterator[DB]:
+        """
+        Group writes into a single transaction.
+
+        write_query() doesn't commit inside the block. Everything is
+        committed when the block exits, or rolled back if it raises.
+        Transactions don't nest; an inner block joins the outer one.
+
+        Args:
+            immediate (bool): Take the write lock when the block starts,
+                instead of at the first write, so values read in the
+                block can't be changed by other connections before the
+                block writes. An inner block joins the outer one as it
+                is, so only the outermost block's 'immediate' counts.
+        """
+        if self._in_transaction or not self.connection:
+            yield self
+            return
+        if immediate and not self.connection.in_transaction:
+            self.connection.execute("BEGIN IMMEDIATE")
+        self._in_transaction = True
+        try:
+            yield self
+        except BaseException:
+            self.connection.rollback()
+            self._after_commit.clear()
+            callbacks, self._after_rollback = self._after_rollback, []
+            for func in callbacks:
+                func()
+            raise
+        else:
+            self.connection.commit()
+        finally:
+            self._in_transaction = False
+        self._after_rollback.clear()
+        callbacks, self._after_commit = self._after_commit, []
+        for func in callbacks:
+            func()
+
+    def on_commit(self, func: Callable[[], None]) -> None:
+        """Call func now, or when the current transaction is committed."""
+        if self._in_transaction:
+            self._after_commit.append(func)
+        else:
+            func()
+
+    def on_rollback(self, func: Callable[[], None]) -> None:
+        """Call func if the current transaction is rolled back."""
+        if self._in_transaction:
+            self._after_rollback.append(func)
+
 
 class TimeblockDB(Database):
-    """SQL database tools for Timeblock app."""
+    """
+    SQL database tools for Timeblock app.
+
+    Attributes:
+        cache: Optional ActionCache shared between connections
+        broadcaster: Optional Broadcaster told about every change
+        graph: DependencyGraph of the actions, loaded when first needed
+
+    Methods:
+        create_db: Create tables if they don't exist
+        check_for_db -> bool: Check if tables exist
+        migrate_app_data: Upgrade app_data to a single keyed row
+        columns(table: str) -> list[str]: Return column names of table
+        data_version -> int: Return counter bumped by every action change
+        invalidate(action_ids: list[int]): Drop written actions from
+            the cache
+        publish(kind: str, action: Action): Tell broadcaster about change
+        get_actions -> list[Action]: Return every action, using the cache
+        get_action(action_id: int) -> Optional[Action]: Return one action
+        add_action(action: Action) -> Optional[int]: Add action to database
+        add_actions(actions: Iterable[Action]) -> list[Optional[int]]:
+            Add many actions in one transaction
+        update_action(action_id: int, desc, est_duration) -> bool:
+            Change description or estimated duration of action
+        schedule_action(action_id: int, start: datetime) -> bool:
+            Set the datetime an action is scheduled to start
+        delete_action(action_id: int) -> bool: Soft-delete action
+        restore_action(action_id: int) -> bool: Undo delete_action()
+        history(action_id: int) -> list[dict]: Return events of action
+        dependency_graph -> DependencyGraph: Return up to date graph
+        add_dependency(action_id: int, depends_on: int) -> bool:
+            Make action wait for another, refusing cycles
+        remove_dependency(action_id: int, depends_on: int) -> bool:
+            Remove dependency
+        dependencies(action_id: int) -> list[int]: Return prerequisites
+        critical_path -> tuple[timedelta, list[int]]: Return the longest
+            chain of dependencies
+        plan(start: datetime) -> list[int]: Schedule unscheduled actions
+            back to back, after their dependencies
+        selected -> Optional[int]: Return id of the selected action
+        select_action(action_id: int) -> bool: Select action
+        running_timer -> Optional[tuple[int, Stopwatch]]: Return the
+            action being timed and a Stopwatch for it
+        start_timer(action_id: int) -> bool: Start timing action, unless
+            a timer is running
+        stop_timer() -> Optional[timedelta]: Stop timer, record duration
+        switch_timer(action_id: int) -> Optional[timedelta]: Stop any
+            running timer and start timing action, raising TimerError
+            if it can't be started
+        record(kind: str, action_id, data: dict) -> Optional[int]:
+            Append event to the log and apply it to the projection
+        apply_event(kind: str, action_id, data: dict) -> Optional[int]:
+            Apply event to the projection without logging it
+        checkpoint -> int: Save a snapshot of the projection
+        rebuild_projection -> int: Rebuild 'action' from checkpoint and log
+        catch_up -> int: Apply events missing from the projection
+        changes_since(seq: int, limit: int) -> tuple[list, int, bool]:
+            Return actions and tombstones changed after seq
+        current_changes(uuids: Iterable[str]) -> list[list]: Return
+            current state of actions by uuid
+        merge_changes(changes: Iterable[list]) -> dict: Apply changes
+            from another instance, the last writer winning
+        settle_clashes(data: dict) -> list[str]: Rename whichever of a
+            change and the actions sharing its unique values lost
+        changed(kind: str, action: Action): Invalidate and publish on commit
+    """
+
+    def __init__(
+        self,
+        filename: Optional[str] = None,
+        cache: Optional[ActionCache] = None,
+        check_same_thread: bool = True,
+        broadcaster: Optional[Broadcaster] = None,
+        graph: Optional[DependencyGraph] = None,
+    ):
+        """
+        Initialize TimeblockDB object.
+
+        Args:
+            filename (str): Name or path to database file.
+            cache (ActionCache): Cache of Actions read from this database.
+            check_same_thread (bool): Passed on to Database.
+            broadcaster (Broadcaster): Publisher of changes to actions,
+                using the database filename as channel.
+            graph (DependencyGraph): Graph of dependencies shared between
+                connections, loaded from this database when needed.
+        """
+        super().__init__(filename, check_same_thread)
+        self.cache = cache
+        self.broadcaster = broadcaster
+        self.graph = graph
+        self._written: list[int] = []
 
     def __enter__(self):
         """Enter context manager, create database if it doesn't exist."""
@@ -172,23 +436,208 @@ class TimeblockDB(Database):
         return self
 
     def create_db(self):
-        """Create SQLite database."""
+        """
+        Create SQLite database.
+
+        New files use auto_vacuum=INCREMENTAL, so pages freed by deletes
+        can be released by timeblock.maintenance.compact().
+        """
+        self.migrate_app_data()
+        migrated = self.migrate_action_sync()
         script = """
+            PRAGMA auto_vacuum = INCREMENTAL;
+
             CREATE TABLE IF NOT EXISTS action(
                 id INTEGER PRIMARY KEY,
                 desc TEXT NOT NULL UNIQUE,
                 est_duration INTEGER,
                 actual_duration INTEGER,
-                start_datetime REAL UNIQUE
+                start_datetime REAL UNIQUE,
+                uuid TEXT,
+                updated REAL,
+                seq INTEGER
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS action_uuid ON action(uuid);
+            CREATE INDEX IF NOT EXISTS action_seq ON action(seq);
+
+            CREATE TABLE IF NOT EXISTS action_tombstone(
+                uuid TEXT PRIMARY KEY,
+                updated REAL NOT NULL,
+                seq INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS action_tombstone_seq
+            ON action_tombstone(seq);
+
+            CREATE TABLE IF NOT EXISTS sync_state(
+                peer TEXT PRIMARY KEY,
+                pulled INTEGER NOT NULL DEFAULT 0,
+                pushed INTEGER NOT NULL DEFAULT 0
             );
 
             CREATE TABLE IF NOT EXISTS app_data(
+                id INTEGER PRIMARY KEY CHECK (id = 1),
                 selected INTEGER,
+                started REAL,
                 FOREIGN KEY(selected) REFERENCES action(id)
             );
 
+            CREATE TABLE IF NOT EXISTS app_version(
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO app_version(id, version) VALUES (1, 0);
+
+            CREATE TRIGGER IF NOT EXISTS action_insert_version
+            AFTER INSERT ON action BEGIN
+                UPDATE app_version SET version = version + 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS action_update_version
+            AFTER UPDATE ON action BEGIN
+                UPDATE app_version SET version = version + 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS action_delete_version
+            AFTER DELETE ON action BEGIN
+                UPDATE app_version SET version = version + 1;
+            END;
+
+            CREATE TABLE IF NOT EXISTS action_event(
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                action_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS action_event_action
+            ON action_event(action_id, seq);
+
+            CREATE TABLE IF NOT EXISTS action_checkpoint(
+                seq INTEGER PRIMARY KEY,
+                created REAL NOT NULL,
+                data BLOB NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS projection_state(
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                seq INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO projection_state(id, seq) VALUES (1, 0);
+
+            CREATE TABLE IF NOT EXISTS action_dependency(
+                action_id INTEGER NOT NULL,
+                depends_on INTEGER NOT NULL,
+                PRIMARY KEY(action_id, depends_on),
+                CHECK (action_id != depends_on)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS action_dependency_depends_on
+            ON action_dependency(depends_on);
+
+            CREATE TABLE IF NOT EXISTS graph_version(
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO graph_version(id, version) VALUES (1, 0);
+
+            CREATE TRIGGER IF NOT EXISTS dependency_insert_version
+            AFTER INSERT ON action_dependency BEGIN
+                UPDATE graph_version SET version = version + 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS dependency_delete_version
+            AFTER DELETE ON action_dependency BEGIN
+                UPDATE graph_version SET version = version + 1;
+            END;
+        """
+        self.script(script)
+        # databases from before the event log already have actions, which
+        # the first checkpoint keeps for rebuild_projection()
+        if not self.read_query(
+            "SELECT 1 FROM action_checkpoint LIMIT 1"
+        ) and self.read_query("SELECT 1 FROM action LIMIT 1"):
+            self.checkpoint()
+        elif migrated:
+            # the uuids given to existing actions aren't in their events
+            self.checkpoint()
+        # actions from before the event log have no event to take a seq
+        # from, log one so they are synced like the others
+        with self.transaction():
+            for (action_id,) in self.read_query(
+                "SELECT id FROM action WHERE seq IS NULL"
+            ):
+                self.record("update", action_id, {})
+
+    def migrate_app_data(self) -> None:
+        """
+        Move app_data from a table without a key to a single keyed row.
+
+        The selection is kept, and a timer running in the old 'timer'
+        table is moved into app_data.started.
         """
+        query = "SELECT name FROM sqlite_master WHERE type='table'"
+        db_tables = [table for (table,) in self.read_query(query)]
+        if "app_data" in db_tables and "id" not in self.columns("app_data"):
+            self.script(
+                """
+                ALTER TABLE app_data RENAME TO app_data_old;
+                CREATE TABLE app_data(
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    selected INTEGER,
+                    started REAL,
+                    FOREIGN KEY(selected) REFERENCES action(id)
+                );
+                INSERT INTO app_data(id, selected)
+                SELECT 1, selected FROM app_data_old
+                WHERE selected IS NOT NULL LIMIT 1;
+                DROP TABLE app_data_old;
+                """
+            )
+        if "timer" in db_tables:
+            self.script(
+                """
+                INSERT INTO app_data(id, selected, started)
+                SELECT 1, action_id, started FROM timer WHERE true
+                ON CONFLICT(id) DO UPDATE
+                SET selected = excluded.selected, started = excluded.started;
+                DROP TABLE timer;
+                """
+            )
+
+    def migrate_action_sync(self) -> bool:
+        """
+        Add the columns used for syncing to an existing 'action' table.
+
+        Existing actions get a new uuid, and the time and seq of their
+        latest event.
+
+        Returns:
+            bool: True if the table was migrated.
+        """
+        columns = self.columns("action")
+        if not columns or "uuid" in columns:
+            return False
+        script = f"""
+            ALTER TABLE action ADD COLUMN uuid TEXT;
+            ALTER TABLE action ADD COLUMN updated REAL;
+            ALTER TABLE action ADD COLUMN seq INTEGER;
+            UPDATE action SET uuid = {NEW_UUID};
+        """
+        if self.columns("action_event"):
+            script += """
+                UPDATE action SET
+                    updated = (
+                        SELECT MAX(created) FROM action_event
+                        WHERE action_id = action.id
+                    ),
+                    seq = (
+                        SELECT MAX(seq) FROM action_event
+                        WHERE action_id = action.id
+                    );
+            """
         self.script(script)
+        return True
+
+    def columns(self, table: str) -> list[str]:
+        """Return names of the columns of table."""
+        rows = self.read_query(f"PRAGMA table_info({table})")
+        return [row[1] for row in rows]
 
     def check_for_db(self) -> bool:
         """Check if database exists."""
@@ -197,16 +646,1026 @@ class TimeblockDB(Database):
             WHERE type='table' ORDER BY name
         """
         db_tables = [table for (table,) in self.read_query(query)]
-        if set(["action", "app_data"]).issubset(db_tables):
+        tables = [
+            "action",
+            "action_checkpoint",
+            "action_dependency",
+            "action_event",
+            "action_tombstone",
+            "app_data",
+            "app_version",
+            "graph_version",
+            "projection_state",
+            "sync_state",
+        ]
+        if "timer" in db_tables or "started" not in self.columns("app_data"):
+            return False
+        if "uuid" not in self.columns("action"):
+            return False
+        if set(tables).issubset(db_tables):
             return True
         return False
 
     def add_action(self, action: Action) -> Optional[int]:
         """Add action to database."""
+        est_duration = (
+            int(action.est_duration.total_seconds())
+            if action.est_duration
+            else None
+        )
+        data = {
+            "desc": action.desc,
+            "est_duration": est_duration,
+            "actual_duration": None,
+            "start_datetime": None,
+        }
+        action_id = self.record("create", None, data)
+        if action_id:
+            action.id = action_id
+        return action_id
+
+    def add_actions(self, actions: Iterable[Action]) -> list[Optional[int]]:
+        """Add actions to database in a single transaction."""
+        with self.transaction():
+            return [self.add_action(action) for action in actions]
+
+    def get_action(self, action_id: int) -> Optional[Action]:
+        """Return action with action_id, or None if there isn't one."""
+        rows = self.read_query(
+            "SELECT * FROM action WHERE id = ?", (action_id,)
+        )
+        return Action.from_tuple(rows[0]) if rows else None
+
+    def update_action(
+        self,
+        action_id: int,
+        desc: Optional[str] = None,
+        est_duration: Optional[timedelta] = None,
+    ) -> bool:
+        """
+        Change the description or estimated duration of action.
+
+        Returns:
+            bool: False if there is no such action or the change failed.
+        """
+        data: dict = {}
+        if desc is not None:
+            data["desc"] = desc
+        if est_duration is not None:
+            data["est_duration"] = int(est_duration.total_seconds())
+        if not data:
+            return self.get_action(action_id) is not None
+        return self.record("update", action_id, data) is not None
+
+    def schedule_action(self, action_id: int, start: datetime) -> bool:
+        """
+        Set the datetime action is scheduled to start.
+
+        Returns:
+            bool: False if there is no such action or the start is taken.
+        """
+        data = {"start_datetime": start.timestamp()}
+        return self.record("update", action_id, data) is not None
+
+    def delete_action(self, action_id: int) -> bool:
+        """
+        Soft-delete action.
+
+        The action is removed from the 'action' table, but its history
+        stays in the event log and it can be brought back with
+        restore_action().
+
+        Returns:
+            bool: False if there is no such action.
+        """
+        rows = self.read_query(
+            "SELECT * FROM action WHERE id = ?", (action_id,)
+        )
+        if not rows:
+            return False
+        data = dict(zip(PROJECTED_FIELDS, rows[0][1:]))
+        return self.record("delete", action_id, data) is not None
+
+    def restore_action(self, action_id: int) -> bool:
+        """
+        Restore soft-deleted action, as it was when it was deleted.
+
+        Returns:
+            bool: False if the action wasn't deleted, or its description
+                or start have been taken since.
+        """
+        rows = self.read_query(
+            """
+            SELECT kind, data FROM action_event
+            WHERE action_id = ? ORDER BY seq DESC LIMIT 1
+            """,
+            (action_id,),
+        )
+        if not rows or rows[0][0] != "delete":
+            return False
+        data = json.loads(rows[0][1])
+        data.pop("updated", None)  # restoring is a change of its own
+        return self.record("restore", action_id, data) is not None
+
+    def history(self, action_id: int) -> list[dict]:
+        """Return every event recorded for action, oldest first."""
+        rows = self.read_query(
+            """
+            SELECT seq, kind, data, created FROM action_event
+            WHERE action_id = ? ORDER BY seq
+            """,
+            (action_id,),
+        )
+        return [
+            {
+                "seq": seq,
+                "kind": kind,
+                "data": json.loads(data),
+                "created": datetime.fromtimestamp(created),
+            }
+            for seq, kind, data, created in rows
+        ]
+
+    def dependency_graph(self) -> DependencyGraph:
+        """
+        Return graph of dependencies, loading it if it's out of date.
+
+        A graph shared between connections is only reloaded when another
+        connection has changed the dependencies since.
+        """
+        rows = self.read_query("SELECT version FROM graph_version")
+        version = rows[0][0] if rows else 0
+        if self.graph is None:
+            self.graph = DependencyGraph()
+        with self.graph.lock:
+            if self.graph.version != version:
+                edges = self.read_query(
+                    "SELECT depends_on, action_id FROM action_dependency"
+                )
+                self.graph.load(edges)
+                self.graph.version = version
+        return self.graph
+
+    def add_dependency(self, action_id: int, depends_on: int) -> bool:
+        """
+        Record that action_id can't start before depends_on is done.
+
+        Returns:
+            bool: False if either action doesn't exist, or the dependency
+                would create a cycle.
+        """
+        with self.transaction(immediate=True):
+            graph = self.dependency_graph()
+            for required in (action_id, depends_on):
+                if not self.get_action(required):
+                    print(f"Error: no action with id {required}")
+                    return False
+            with graph.lock:
+                try:
+                    graph.add_edge(depends_on, action_id)
+                except CycleError as e:
+                    print(f"Error: {e}")
+                    return False
+                query = """
+                    INSERT OR IGNORE INTO
+                    action_dependency(action_id, depends_on) VALUES (?, ?)
+                """
+                if self.write_query(query, (action_id, depends_on)) is None:
+                    graph.version = None
+                    return False
+                self._graph_changed(graph)
+        return True
+
+    def remove_dependency(self, action_id: int, depends_on: int) -> bool:
+        """
+        Remove dependency of action_id on depends_on.
+
+        Returns:
+            bool: False if there was no such dependency.
+        """
+        with self.transaction(immediate=True):
+            graph = self.dependency_graph()
+            query = """
+                DELETE FROM action_dependency
+                WHERE action_id = ? AND depends_on = ?
+            """
+            if self.write_query(query, (action_id, depends_on)) is None:
+                return False
+            if not self.cursor or not self.cursor.rowcount:
+                return False
+            with graph.lock:
+                graph.remove_edge(depends_on, action_id)
+                self._graph_changed(graph)
+        return True
+
+    def _graph_changed(self, graph: DependencyGraph) -> None:
+        """
+        Mark graph as matching the dependencies written so far.
+
+        If the transaction is rolled back, the graph is marked out of
+        date instead, so it's reloaded when next used.
+        """
+        (version,) = self.read_query("SELECT version FROM graph_version")[0]
+        graph.version = version
+
+        def stale() -> None:
+            with graph.lock:
+                graph.version = None
+
+        self.on_rollback(stale)
+
+    def dependencies(self, action_id: int) -> list[int]:
+        """Return ids of the actions action_id depends on."""
+        rows = self.read_query(
+            """
+            SELECT depends_on FROM action_dependency
+            WHERE action_id = ? ORDER BY depends_on
+            """,
+            (action_id,),
+        )
+        return [depends_on for (depends_on,) in rows]
+
+    def critical_path(self) -> tuple[timedelta, list[int]]:
+        """
+        Return the chain of dependencies that takes longest to finish.
+
+        Durations are the estimated durations of the actions, and
+        deleted actions count as already done.
+
+        Returns:
+            tuple: Total duration and ids of the actions in the chain.
+        """
+        durations = dict(
+            self.read_query("SELECT id, COALESCE(est_duration, 0) FROM action")
+        )
+        graph = self.dependency_graph()
+        with graph.lock:
+            total, path = graph.critical_path(durations)
+        path = [action_id for action_id in path if action_id in durations]
+        return timedelta(seconds=total), path
+
+    def plan(
+        self, start: datetime, default: timedelta = DEFAULT_BLOCK
+    ) -> list[int]:
+        """
+        Schedule unscheduled actions back to back, after their dependencies.
+
+        Actions are taken in id order, except that an action is moved
+        after the actions it depends on. An action that depends on one
+        already scheduled starts after that one ends. As start_datetime
+        is unique, an action whose start is taken by another action is
+        moved to the end of that one. If an action still can't be
+        scheduled, it and the actions depending on it are left
+        unscheduled.
+
+        Args:
+            start (datetime): Start of the first block.
+            default (timedelta): Duration of actions without an estimate.
+
+        Returns:
+            list[int]: Ids of the actions scheduled, in order.
+        """
+        scheduled = []
+        block = default.total_seconds()
+        with self.transaction(immediate=True):
+            durations = dict(
+                self.read_query(
+                    """
+                    SELECT id, COALESCE(est_duration, ?) FROM action
+                    WHERE start_datetime IS NULL
+                    """,
+                    (block,),
+                )
+            )
+            earliest = dict(
+                self.read_query(
+                    """
+                    SELECT d.action_id,
+                        MAX(a.start_datetime + COALESCE(a.est_duration, ?))
+                    FROM action_dependency AS d
+                    JOIN action AS a ON a.id = d.depends_on
+                    WHERE a.start_datetime IS NOT NULL
+                    GROUP BY d.action_id
+                    """,
+                    (block,),
+                )
+            )
+            graph = self.dependency_graph()
+            with graph.lock:
+                ordered = graph.order(durations)
+                edges = graph.edges(durations)
+            requires: dict[int, list[int]] = {}
+            for before, after in edges:
+                requires.setdefault(after, []).append(before)
+            skipped: set[int] = set()
+            now = start.timestamp()
+            for action_id in ordered:
+                if skipped.intersection(requires.get(action_id, ())):
+                    skipped.add(action_id)
+                    continue
+                begin = self._free_start(
+                    max(now, earliest.get(action_id, now)), block
+                )
+                if self.schedule_action(
+                    action_id, datetime.fromtimestamp(begin)
+                ):
+                    scheduled.append(action_id)
+                    now = begin + durations[action_id]
+                else:
+                    skipped.add(action_id)
+        return scheduled
+
+    def _free_start(self, begin: float, block: float) -> float:
+        """Return begin, moved past actions that already start there."""
+        while True:
+            rows = self.read_query(
+                """
+                SELECT start_datetime + COALESCE(est_duration, ?)
+                FROM action WHERE start_datetime = ?
+                """,
+                (block, begin),
+            )
+            if not rows or rows[0][0] <= begin:
+                return begin
+            begin = rows[0][0]
+
+    def selected(self) -> Optional[int]:
+        """Return id of the selected action, or None."""
+        rows = self.read_query("SELECT selected FROM app_data WHERE id = 1")
+        return rows[0][0] if rows else None
+
+    def select_action(self, action_id: int) -> bool:
+        """
+        Make action the selected one.
+
+        Returns:
+            bool: False if there is no such action, or a timer is running
+                for another action.
+        """
+        query = """
+            INSERT INTO app_data(id, selected)
+            SELECT 1, id FROM action WHERE id = ?
+            ON CONFLICT(id) DO UPDATE SET selected = excluded.selected
+            WHERE app_data.started IS NULL
+                OR app_data.selected = excluded.selected
+        """
+        if self.write_query(query, (action_id,)) is None:
+            return False
+        return bool(self.cursor and self.cursor.rowcount)
+
+    def running_timer(self) -> Optional[tuple[int, Stopwatch]]:
+        """
+        Return the action being timed and a Stopwatch for it.
+
+        The Stopwatch starts from the time stored in the database, so it
+        gives the same running time in every process.
+        """
+        rows = self.read_query(
+            """
+            SELECT selected, started FROM app_data
+            WHERE id = 1 AND started IS NOT NULL
+            """
+        )
+        if not rows:
+            return None
+        action_id, started = rows[0]
+        return action_id, Stopwatch(datetime.fromtimestamp(started))
+
+    def start_timer(
+        self, action_id: int, now: Optional[datetime] = None
+    ) -> bool:
+        """
+        Select action and start timing it, unless a timer is running.
+
+        The check and the start are one statement, so of several
+        connections starting a timer at the same time only one succeeds.
+
+        Returns:
+            bool: False if a timer is already running or there is no
+                such action.
+        """
+        started = (now or datetime.now()).timestamp()
+        query = """
+            INSERT INTO app_data(id, selected, started)
+            SELECT 1, id, ? FROM action WHERE id = ?
+            ON CONFLICT(id) DO UPDATE
+            SET selected = excluded.selected, started = excluded.started
+            WHERE app_data.started IS NULL
+        """
+        with self.transaction():
+            if self.write_query(query, (started, action_id)) is None:
+                return False
+            if not self.cursor or not self.cursor.rowcount:
+                return False
+            self.record("start", action_id, {"started": started})
+        return True
+
+    def stop_timer(
+        self, now: Optional[datetime] = None
+    ) -> Optional[timedelta]:
+        """
+        Stop the running timer and add its time to actual_duration.
+
+        The start time is only cleared if it is still the one that was
+        read, so of several connections stopping the timer at the same
+        time only one records the time.
+
+        Returns:
+            timedelta: Time the timer ran for, or None if none was running.
+        """
+        now = now or datetime.now()
+        with self.transaction():
+            rows = self.read_query(
+                """
+                SELECT selected, started FROM app_data
+                WHERE id = 1 AND started IS NOT NULL
+                """
+            )
+            if not rows:
+                return None
+            action_id, started = rows[0]
+            query = """
+                UPDATE app_data SET started = NULL
+                WHERE id = 1 AND started = ?
+            """
+            if self.write_query(query, (started,)) is None:
+                return None
+            if not self.cursor or not self.cursor.rowcount:
+                return None
+            elapsed = timedelta(seconds=now.timestamp() - started)
+            previous = self.read_query(
+                "SELECT actual_duration FROM action WHERE id = ?",
+                (action_id,),
+            )
+            if previous:
+                total = (previous[0][0] or 0) + round(elapsed.total_seconds())
+                self.record("stop", action_id, {"actual_duration": total})
+        return elapsed
+
+    def switch_timer(
+        self, action_id: int, now: Optional[datetime] = None
+    ) -> Optional[timedelta]:
+        """
+        Stop any running timer and start timing action.
+
+        Both happen in one immediate transaction, so no other connection
+        can start a timer in between. If this is called inside another
+        transaction, that one must be immediate for the same guarantee.
+
+        Returns:
+            timedelta: Time recorded for the stopped timer, if any.
+
+        Raises:
+            TimerError: If the timer couldn't be started. The transaction
+                is rolled back, so the stopped timer keeps running.
+        """
+        now = now or datetime.now()
+        with self.transaction(immediate=True):
+            if self.get_action(action_id) is None:
+                return None
+            elapsed = self.stop_timer(now)
+            if not self.start_timer(action_id, now):
+                raise TimerError(f"Could not start timer for {action_id}")
+        return elapsed
+
+    def record(
+        self, kind: str, action_id: Optional[int], data: dict
+    ) -> Optional[int]:
+        """
+        Append event to the log and apply it to the 'action' table.
+
+        Both happen in one transaction, so the 'action' table is always
+        the projection of every event up to projection_state.seq.
+
+        Args:
+            kind (str): One of EVENT_KINDS.
+            action_id (int): Action the event is about, None to create one.
+            data (dict): Field values after the event.
+
+        Returns:
+            int: Id of the action, or None if the event couldn't be applied.
+
+        Raises:
+            ValueError: If kind isn't one of EVENT_KINDS.
+        """
+        created = time.time()
+        if kind in ("create", "restore") and not data.get("uuid"):
+            data = {**data, "uuid": uuid.uuid4().hex}
+        with self.transaction():
+            action_id = self.apply_event(kind, action_id, data, None, created)
+            if action_id is None:
+                return None
+            seq = self.write_query(
+                """
+                INSERT INTO action_event(action_id, kind, data, created)
+                VALUES (?, ?, ?, ?)
+                """,
+                (action_id, kind, json.dumps(data), created),
+            )
+            self.write_query("UPDATE projection_state SET seq = ?", (seq,))
+            action = self.get_action(action_id) or Action(
+                data.get("desc", ""), action_id=action_id
+            )
+            self.changed(BROADCAST_KINDS[kind], action)
+        return action_id
+
+    def apply_event(
+        self,
+        kind: str,
+        action_id: Optional[int],
+        data: dict,
+        seq: Optional[int] = None,
+        created: Optional[float] = None,
+    ) -> Optional[int]:
+        """
+        Apply event to the 'action' table without logging it.
+
+        New actions get an id one higher than any action that has ever
+        existed, so ids of deleted actions are never reused. The action,
+        or its tombstone when it's deleted, is marked with the seq of
+        the event and the time it was updated: data["updated"] if the
+        change came from another instance, otherwise when it was made.
+
+        Args:
+            kind (str): One of EVENT_KINDS.
+            action_id (int): Action the event is about, None to create one.
+            data (dict): Field values after the event.
+            seq (int): Seq of the event, or None for the event about to
+                be logged.
+            created (float): Time the event was logged.
+
+        Returns:
+            int: Id of the action, or None if the event couldn't be
+                applied, for example because the action doesn't exist or
+                a unique value is taken.
+
+        Raises:
+            ValueError: If kind isn't one of EVENT_KINDS.
+        """
+        if kind not in EVENT_KINDS:
+            raise ValueError(f"Unknown event kind: {kind}")
+        seq_value = f"COALESCE(?, {LAST_EVENT_SEQ} + 1)"
+        updated = data.get("updated", created)
+        if kind in ("create", "restore"):
+            query = f"""
+                INSERT INTO action(
+                    id, {", ".join(PROJECTED_FIELDS)}, updated, seq
+                )
+                VALUES (
+                    COALESCE(?, {NEXT_ACTION_ID}), ?, ?, ?, ?,
+                    COALESCE(?, {NEW_UUID}), ?, {seq_value}
+                )
+            """
+            values = [data.get(field) for field in PROJECTED_FIELDS]
+            action_id = self.write_query(
+                query, (action_id, *values, updated, seq)
+            )
+            if action_id:
+                self.write_query(
+                    """
+                    DELETE FROM action_tombstone WHERE uuid = (
+                        SELECT uuid FROM action WHERE id = ?
+                    )
+                    """,
+                    (action_id,),
+                )
+            return action_id
+        if kind == "delete":
+            self.write_query(
+                f"""
+                INSERT OR REPLACE INTO action_tombstone(uuid, updated, seq)
+                SELECT uuid, COALESCE(?, updated), {seq_value}
+                FROM action WHERE id = ?
+                """,
+                (updated, seq, action_id),
+            )
+            query = "DELETE FROM action WHERE id = ?"
+            parameters: tuple = (action_id,)
+        else:
+            fields = [field for field in PROJECTED_FIELDS if field in data]
+            assignments = "".join(f"{field} = ?, " for field in fields)
+            query = f"""
+                UPDATE action SET {assignments}
+                updated = COALESCE(?, updated), seq = {seq_value}
+                WHERE id = ?
+            """
+            parameters = (
+                *(data[field] for field in fields),
+                updated,
+                seq,
+                action_id,
+            )
+        if self.write_query(query, parameters) is None:
+            return None
+        if not self.cursor or not self.cursor.rowcount:
+            return None
+        return action_id
+
+    def checkpoint(self) -> int:
+        """
+        Save a snapshot of the 'action' table.
+
+        rebuild_projection() starts from the latest snapshot and only
+        replays the events after it. Only the newest two snapshots are
+        kept.
+
+        Returns:
+            int: Sequence number of the last event in the snapshot.
+        """
+        with self.transaction():
+            (seq,) = self.read_query("SELECT seq FROM projection_state")[0]
+            rows = self.read_query("SELECT * FROM action ORDER BY id")
+            self.write_query(
+                """
+                INSERT OR REPLACE INTO action_checkpoint(seq, created, data)
+                VALUES (?, ?, ?)
+                """,
+                (
+                    seq,
+                    time.time(),
+                    zlib.compress(json.dumps(rows).encode()),
+                ),
+            )
+            self.write_query(
+                """
+                DELETE FROM action_checkpoint WHERE seq NOT IN (
+                    SELECT seq FROM action_checkpoint
+                    ORDER BY seq DESC LIMIT 2
+                )
+                """
+            )
+        return seq
+
+    def rebuild_projection(self) -> int:
+        """
+        Rebuild the 'action' table from the latest checkpoint and events.
+
+        Returns:
+            int: Number of events replayed after the checkpoint.
+        """
+        with self.transaction():
+            rows = self.read_query(
+                """
+                SELECT seq, data FROM action_checkpoint
+                ORDER BY seq DESC LIMIT 1
+                """
+            )
+            seq, snapshot = rows[0] if rows else (0, None)
+            self.write_query("DELETE FROM action")
+            if snapshot:
+                rows = json.loads(zlib.decompress(snapshot))
+                if rows:
+                    # checkpoints from before syncing have fewer columns
+                    columns = self.columns("action")[: len(rows[0])]
+                    query = f"""
+                        INSERT INTO action({", ".join(columns)})
+                        VALUES ({", ".join("?" * len(columns))})
+                    """
+                    rows = [tuple(row) for row in rows]
+                    self.write_query(query, rows)
+            self.write_query("UPDATE projection_state SET seq = ?", (seq,))
+            replayed = self.catch_up()
+        if self.cache is not None:
+            self.cache.clear()
+        return replayed
+
+    def catch_up(self) -> int:
+        """
+        Apply events the 'action' table doesn't include yet.
+
+        Events are read in batches, so the log never has to fit in
+        memory.
+
+        Returns:
+            int: Number of events applied.
+        """
+        applied = 0
+        with self.transaction():
+            (seq,) = self.read_query("SELECT seq FROM projection_state")[0]
+            while True:
+                events = self.read_query(
+                    """
+                    SELECT seq, action_id, kind, data, created
+                    FROM action_event
+                    WHERE seq > ? ORDER BY seq LIMIT ?
+                    """,
+                    (seq, REPLAY_BATCH),
+                )
+                for seq, action_id, kind, data, created in events:
+                    self.apply_event(
+                        kind, action_id, json.loads(data), seq, created
+                    )
+                applied += len(events)
+                if len(events) < REPLAY_BATCH:
+                    break
+            self.write_query("UPDATE projection_state SET seq = ?", (seq,))
+        return applied
+
+    def changes_since(
+        self, seq: int, limit: Optional[int] = None
+    ) -> tuple[list[list], int, bool]:
+        """
+        Return actions and tombstones changed after seq, oldest first.
+
+        Each action is only sent in its latest state, so the cost depends
+        on how much changed rather than on the size of the database.
+
+        Args:
+            seq (int): Seq the other instance has already seen.
+            limit (int): Maximum number of changes to return.
+
+        Returns:
+            tuple[list[list], int, bool]: Changes, the seq to ask from
+                next time, and whether more changes are left. Actions are
+                lists of SYNC_FIELDS and tombstones are [uuid, seq,
+                updated].
+        """
+        query = f"""
+            SELECT {", ".join(SYNC_FIELDS)} FROM action WHERE seq > ?
+            UNION ALL
+            SELECT uuid, seq, updated, NULL, NULL, NULL, NULL
+            FROM action_tombstone WHERE seq > ?
+            ORDER BY seq
+        """
+        parameters: tuple = (seq, seq)
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters += (limit + 1,)
+        rows = self.read_query(query, parameters)
+        more = limit is not None and len(rows) > limit
+        if more:
+            rows = rows[:limit]
+        if rows:
+            seq = rows[-1][1]
+        return [self._sync_row(row) for row in rows], seq, more
+
+    def current_changes(self, uuids: Iterable[str]) -> list[list]:
+        """Return current state of actions or tombstones, by uuid."""
+        changes: list[list] = []
+        for uuid_ in uuids:
+            rows = self.read_query(
+                f"""
+                SELECT {", ".join(SYNC_FIELDS)} FROM action WHERE uuid = ?
+                UNION ALL
+                SELECT uuid, seq, updated, NULL, NULL, NULL, NULL
+                FROM action_tombstone WHERE uuid = ?
+                """,
+                (uuid_, uuid_),
+            )
+            changes.extend(self._sync_row(row) for row in rows[:1])
+        return changes
+
+    @staticmethod
+    def _sync_row(row: tuple) -> list:
+        """Return change sent for row, tombstones without the values."""
+        return list(row) if row[3] is not None else list(row[:3])
+
+    def merge_changes(self, changes: Iterable[list]) -> dict:
+        """
+        Apply changes from another instance, the last writer winning.
+
+        A change wins if it was updated later than the local action or
+        tombstone, comparing the values themselves on a tie so every
+        instance picks the same one. Winning changes are recorded as
+        events like local ones, but keep their 'updated' time. A change
+        that shares its description or start with another action is
+        settled by settle_clashes() before it is applied. Tombstones of
+        actions this instance never had are kept, so older changes to
+        them from a third instance are refused.
+
+        Args:
+            changes (Iterable[list]): Changes from changes_since() of the
+                other instance.
+
+        Returns:
+            dict: Number of changes 'applied', changes that were 'stale'
+                or already known, actions 'renamed' to settle a clash,
+                and changes that still couldn't be applied because a
+                unique value is taken ('conflicts'), and the uuids
+                'rejected' for a newer local state or renamed, whose
+                current state the other instance should be sent.
+        """
+        fields = SYNC_FIELDS[3:]
+        report: dict = dict.fromkeys(
+            ("applied", "stale", "renamed", "conflicts"), 0
+        )
+        rejected = []
+        with self.transaction():
+            for change in changes:
+                uuid_, _seq, updated, *values = change
+                rows = self.read_query(
+                    f"""
+                    SELECT id, updated, {", ".join(fields)} FROM action
+                    WHERE uuid = ?
+                    """,
+                    (uuid_,),
+                )
+                if rows:
+                    action_id, local_updated, *local = rows[0]
+                    if local == values:
+                        report["stale"] += 1
+                        continue
+                    if (local_updated or 0, json.dumps(local)) >= (
+                        updated,
+                        json.dumps(values),
+                    ):
+                        report["stale"] += 1
+                        rejected.append(uuid_)
+                        continue
+                    kind = "update" if values else "delete"
+                    values = values or local
+                else:
+                    tombstone = self.read_query(
+                        "SELECT updated FROM action_tombstone WHERE uuid = ?",
+                        (uuid_,),
+                    )
+                    if tombstone and tombstone[0][0] >= updated:
+                        report["stale"] += 1
+                        continue
+                    if not values:
+                        self._bury(uuid_, updated)
+                        report["applied"] += 1
+                        continue
+                    action_id = None
+                    kind = "create"
+                data = {**dict(zip(fields, values)), "uuid": uuid_}
+                data["updated"] = updated
+                if kind != "delete":
+                    renamed = self.settle_clashes(data)
+                    report["renamed"] += len(renamed)
+                    rejected.extend(renamed)
+                if self.record(kind, action_id, data) is None:
+                    report["conflicts"] += 1
+                else:
+                    report["applied"] += 1
+        report["rejected"] = rejected
+        return report
+
+    def settle_clashes(self, data: dict) -> list[str]:
+        """
+        Settle clashes between a change and actions with the same values.
+
+        For each other action with the same description or start as the
+        change in data, the one updated later, or with the greater uuid
+        on a tie, keeps the value. The other gets the start of its uuid
+        added to its description, or is unscheduled, and is marked as
+        updated just after the winner. Local losers are changed at once
+        and data is changed in place. Every instance settles a clash
+        between the same two changes the same way, so instances agree
+        without another exchange.
+
+        Args:
+            data (dict): Values of the change, with 'uuid' and 'updated'.
+
+        Returns:
+            list[str]: Uuids of the actions that were renamed.
+        """
+        rows = self.read_query(
+            """
+            SELECT id, uuid, updated, desc, start_datetime FROM action
+            WHERE uuid != ? AND (desc = ? OR start_datetime = ?)
+            ORDER BY id
+            """,
+            (data["uuid"], data.get("desc"), data.get("start_datetime")),
+        )
+        renamed = []
+        change_key = (data["updated"], data["uuid"])
+        for action_id, uuid_, updated, desc, start in rows:
+            taken = {
+                field: value
+                for field, value in (("desc", desc), ("start_datetime", start))
+                if value is not None and value == data.get(field)
+            }
+            if not taken:
+                continue
+            if change_key > (updated or 0, uuid_):
+                loser = self._renamed(taken, uuid_, change_key[0])
+                if self.record("update", action_id, loser) is not None:
+                    renamed.append(uuid_)
+            else:
+                loser = self._renamed(taken, data["uuid"], updated or 0)
+                loser["updated"] = max(loser["updated"], data["updated"])
+                data.update(loser)
+                if data["uuid"] not in renamed:
+                    renamed.append(data["uuid"])
+        return renamed
+
+    @staticmethod
+    def _renamed(taken: dict, uuid_: str, winner: float) -> dict:
+        """Return values freeing taken for the winner, updated after it."""
+        values: dict = {"updated": math.nextafter(winner, math.inf)}
+        if "desc" in taken:
+            values["desc"] = f"{taken['desc']} ({uuid_[:8]})"
+        if "start_datetime" in taken:
+            values["start_datetime"] = None
+        return values
+
+    def _bury(self, uuid_: str, updated: float) -> None:
+        """
+        Keep tombstone of an action this instance never had.
+
+        There is no event to take a seq from, so one is reserved in the
+        event sequence. The tombstone is then synced to other peers.
+        """
         query = """
-            INSERT INTO action(desc, est_duration)
-            VALUES (?, ?)
+            UPDATE sqlite_sequence SET seq = seq + 1
+            WHERE name = 'action_event'
         """
-        desc = action.desc
-        est_duration = action.est_duration
-        return self.write_query(query, (desc, est_duration))
+        self.write_query(query)
+        if not self.cursor or not self.cursor.rowcount:
+            self.write_query(
+                """
+                INSERT INTO sqlite_sequence(name, seq)
+                VALUES ('action_event', 1)
+                """
+            )
+        self.write_query(
+            f"""
+            INSERT OR REPLACE INTO action_tombstone(uuid, updated, seq)
+            VALUES (?, ?, {LAST_EVENT_SEQ})
+            """,
+            (uuid_, updated),
+        )
+
+    def changed(self, kind: str, action: Action) -> None:
+        """Invalidate cache and publish change once it is committed."""
+        if action.id is not None and self.cache is not None:
+            # every action written in the transaction is dropped at once,
+            # so the cache can tell them from other connections' writes
+            self._written.append(action.id)
+            if len(self._written) == 1:
+                self.on_rollback(self._written.clear)
+                self.on_commit(self._invalidate_written)
+        self.on_commit(partial(self.publish, kind, action))
+
+    def data_version(self) -> int:
+        """Return counter that is bumped by every change to actions."""
+        rows = self.read_query("SELECT version FROM app_version")
+        return rows[0][0] if rows else 0
+
+    def invalidate(self, action_ids: list[int]) -> None:
+        """Drop actions from the cache after writing to them."""
+        if self.cache is not None:
+            self.cache.invalidate(action_ids, self.data_version())
+
+    def _invalidate_written(self) -> None:
+        written, self._written = self._written, []
+        self.invalidate(written)
+
+    def publish(self, kind: str, action: Action) -> None:
+        """Tell broadcaster that action was inserted, updated or deleted."""
+        if self.broadcaster is not None:
+            est_duration = action.est_duration
+            self.broadcaster.publish(
+                self.filename,
+                kind,
+                {
+                    "id": action.id,
+                    "desc": action.desc,
+                    "est_duration": (
+                        est_duration.total_seconds() if est_duration else None
+                    ),
+                },
+            )
+
+    def get_actions(self) -> list[Action]:
+        """
+        Return every action in the database.
+
+        Without a cache every row is read and decoded. With a cache only
+        the ids are read, and just the actions missing from the cache are
+        fetched and decoded. If the cache already knows the ids for the
+        current version, no action rows are read at all. What is read is
+        only cached if no write has invalidated the cache in the meantime.
+        """
+        if self.cache is None:
+            rows = self.read_query("SELECT * FROM action")
+            return [Action.from_tuple(row) for row in rows]
+
+        cache = self.cache
+        version = self.data_version()
+        cache.sync(version)
+        ids = cache.ids
+        if ids is None:
+            ids = [i for (i,) in self.read_query("SELECT id FROM action")]
+            cache.set_ids(ids, version)
+
+        found = {}
+        missing = []
+        for action_id in ids:
+            action = cache.get(action_id)
+            if action is None:
+                missing.append(action_id)
+            else:
+                found[action_id] = action
+        for start in range(0, len(missing), 500):
+            batch = missing[start : start + 500]
+            query = f"""
+                SELECT * FROM action
+                WHERE id IN ({", ".join("?" * len(batch))})
+            """
+            for row in self.read_query(query, tuple(batch)):
+                action = Action.from_tuple(row)
+                cache.put(action, version)
+                found[row[0]] = action
+        return [found[i] for i in ids if i in found]
@@ -0,0 +1,25 @@
+// Keep the list of actions in step with changes made elsewhere, using
+// the Server-Sent Events stream at 'events'.
+const list = document.getElementById("actions");
+const item = (id) => list.querySelector(`li[data-id="${id}"]`);
+const source = new EventSource(
+    `events?last_event_id=${list.dataset.lastEventId}`
+);
+source.addEventListener("insert", (event) => {
+    const action = JSON.parse(event.data);
+    if (item(action.id)) return;
+    const li = document.createElement("li");
+    li.dataset.id = action.id;
+    li.textContent = action.desc;
+    list.appendChild(li);
+});
+source.addEventListener("update", (event) => {
+    const action = JSON.parse(event.data);
+    const li = item(action.id);
+    if (li) li.textContent = action.desc;
+});
+source.addEventListener("delete", (event) => {
+    const li = item(JSON.parse(event.data).id);
+    if (li) li.remove();
+});
+source.addEventListener("reset", () => location.reload());
@@ -8,27 +8,46 @@ Example:
 >>> # Two minutes later...
 >>> watch.check()
 datetime.timedelta(seconds=120)
+
+A Stopwatch can also be created from a start time stored elsewhere, such
+as the timer in the database, so the running time doesn't depend on the
+process that started it:
+>>> from datetime import datetime
+>>> watch = stopwatch.Stopwatch(datetime(2023, 1, 16, 9))
+>>> watch.check(datetime(2023, 1, 16, 9, 30))
+datetime.timedelta(seconds=1800)
 """
 from datetime import datetime, timedelta
+from typing import Optional
 
 
 class Stopwatch:
     """
     Stopwatch object for measuring time.
 
+    Attributes:
+        started: Time the watch was started, or None
+
     Methods:
         start(): Starts watch by setting start time to now.
         check() -> timedelta: Check the time passed since watch started
     """
 
-    def __init__(self):
-        """Initialize Stopwatch object."""
-        self._start = None
+    def __init__(self, started: Optional[datetime] = None):
+        """
+        Initialize Stopwatch object.
+
+        Args:
+            started (datetime): Time the watch was started, if it's running.
+        """
+        self.started = started
 
     def start(self: "Stopwatch") -> None:
         """Start watch by recording the current time."""
-        self._start = datetime.now()
+        self.started = datetime.now()
 
-    def check(self: "Stopwatch") -> timedelta:
+    def check(self: "Stopwatch", now: Optional[datetime] = None) -> timedelta:
         """Return timedelta of time passed since watch started."""
-        return self._start - datetime.now()
+        if self.started is None:
+            return timedelta(0)
+        return (now or datetime.now()) - self.started
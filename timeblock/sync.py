@@ -0,0 +1,209 @@
+"""
+Sync actions between Timeblock instances that work offline.
+
+Every instance keeps working on its own database, and 'sync' exchanges
+only what changed since the last exchange with a peer. Each action has
+a uuid that is the same on every instance, the time it was last updated
+and the seq of the local event that last changed it; deleted actions
+leave a tombstone with the same values. See timeblock.sql.
+
+A client POSTs to the peer's /sync, which only answers when the peer's
+app has a SYNC_TOKEN and the request sends it in an
+'Authorization: Bearer <token>' header:
+
+    {"since": <peer seq seen>, "batch": <n>, "changes": [<local change>]}
+
+The peer merges the changes and answers with up to 'batch' of its own
+changes after 'since', none while the client is still pushing:
+
+    {"changes": [...], "seq": <seq to send next time>, "more": <bool>,
+     "merged": {"applied": <n>, "stale": <n>, "renamed": <n>,
+                "conflicts": <n>}}
+
+Changes are compact JSON arrays of sql.SYNC_FIELDS, or [uuid, seq,
+updated] for a deleted action, sent oldest first in batches. The last
+writer wins for the whole action: the change updated later replaces the
+other, and ties go to the greater values so both sides agree. Changes
+the peer rejected for a newer state of its own are sent back with the
+response, so both instances end up with the same actions. When a
+change takes the description or start of another action, e.g. two
+instances adding the same description, the one updated later keeps it
+and the other is renamed, or unscheduled, on both sides alike; see
+TimeblockDB.settle_clashes(). Renamed actions are sent back like
+rejected ones, and counted as 'renamed'. Changes that still break a
+unique constraint are counted as conflicts.
+
+The client remembers, for each peer, the seq it has pulled up to and
+the local seq it has pushed up to in the 'sync_state' table, so an
+interrupted sync resumes where it stopped. It pushes before it pulls,
+so changes it pulled are never pushed back. The peer skips the changes
+it was just sent once it has nothing older left to send; until then,
+e.g. during a first sync larger than a batch, they come back once and
+are counted as stale.
+
+Example:
+>>> from timeblock.sync import sync
+>>> with TimeblockDB("laptop.sql") as database:  # doctest: +SKIP
+...     sync(database, "http://desktop:5000/sync", token="secret")
+{'pushed': 3, 'pulled': 12, 'applied': 12, 'stale': 0, 'renamed': 0,
+ 'conflicts': 0}
+
+The following constants are defined:
+    SYNC_BATCH - Changes sent in each direction per request by default.
+    MAX_SYNC_BATCH - Most changes a server sends per request.
+
+The following functions are defined:
+    respond - Merge changes POSTed by a client and return the response.
+    sync - Exchange changes with a peer until both are up to date.
+    post_json - POST JSON to a URL and return the decoded response.
+"""
+import json
+import urllib.request
+from functools import partial
+from typing import Callable, Optional
+
+from timeblock.sql import LAST_EVENT_SEQ, SYNC_FIELDS, TimeblockDB
+
+SYNC_BATCH = 500
+MAX_SYNC_BATCH = 5_000
+
+
+def respond(database: TimeblockDB, body: dict) -> dict:
+    """
+    Merge changes POSTed by a client and return the response.
+
+    Reading the changes to send and merging the client's happen in one
+    transaction, so nothing written in between is skipped.
+
+    Args:
+        database (TimeblockDB): Database of this instance.
+        body (dict): Request with 'since', 'batch' and 'changes'.
+
+    Returns:
+        dict: Response with 'changes', 'seq', 'more' and 'merged'.
+
+    Raises:
+        ValueError: If the body isn't a sync request.
+        TypeError: If a change has values of the wrong type.
+    """
+    since = int(body.get("since", 0))
+    batch = min(int(body.get("batch", SYNC_BATCH)), MAX_SYNC_BATCH)
+    changes = body.get("changes", [])
+    if batch < 0 or not isinstance(changes, list):
+        raise ValueError("Expected a batch size and a list of changes")
+    sizes = (3, len(SYNC_FIELDS))
+    for change in changes:
+        if not isinstance(change, list) or len(change) not in sizes:
+            raise ValueError(
+                f"Expected changes of {sizes[0]} or {sizes[1]} values"
+            )
+        if not isinstance(change[0], str) or not isinstance(
+            change[2], (int, float)
+        ):
+            raise TypeError("Expected a uuid and an updated time")
+    with database.transaction(immediate=True):
+        outgoing, seq, more = database.changes_since(since, batch)
+        merged = database.merge_changes(changes)
+        if not more:
+            # the client already has the changes it just sent
+            seq = _last_seq(database)
+        rejected = dict.fromkeys(merged.pop("rejected"))
+        outgoing += database.current_changes(rejected)
+    return {"changes": outgoing, "seq": seq, "more": more, "merged": merged}
+
+
+def sync(
+    database: TimeblockDB,
+    url: str,
+    batch: int = SYNC_BATCH,
+    post: Optional[Callable[[str, dict], dict]] = None,
+    token: Optional[str] = None,
+) -> dict:
+    """
+    Exchange changes with the peer at url until both are up to date.
+
+    Local changes are pushed first, up to batch per request, and then
+    the peer's are pulled, so changes that were just pulled are never
+    pushed back. Each round trip is saved in 'sync_state' before the
+    next, so a sync that fails part way can simply be run again.
+
+    Args:
+        database (TimeblockDB): Database of this instance.
+        url (str): URL of the peer's /sync route.
+        batch (int): Changes sent in each direction per request.
+        post (Callable): Function that POSTs a JSON payload to a URL and
+            returns the decoded response, post_json() by default.
+        token (str): SYNC_TOKEN of the peer, sent by post_json().
+
+    Returns:
+        dict: Number of changes 'pushed' and 'pulled', how many of the
+            pulled ones were 'applied', 'stale' or 'conflicts', and how
+            many actions were 'renamed'.
+    """
+    post = post or partial(post_json, token=token)
+    report = dict.fromkeys(
+        ("pushed", "pulled", "applied", "stale", "renamed", "conflicts"),
+        0,
+    )
+    database.write_query(
+        "INSERT OR IGNORE INTO sync_state(peer) VALUES (?)", (url,)
+    )
+    while True:
+        ((pulled, pushed),) = database.read_query(
+            "SELECT pulled, pushed FROM sync_state WHERE peer = ?", (url,)
+        )
+        with database.transaction(immediate=True):
+            changes, pushing, more_local = database.changes_since(
+                pushed, batch
+            )
+            latest = _last_seq(database)
+        # pull nothing until everything local is pushed
+        pulling = 0 if more_local else batch
+        response = post(
+            url, {"since": pulled, "batch": pulling, "changes": changes}
+        )
+        with database.transaction(immediate=True):
+            # unless something changed locally meanwhile, the only new
+            # events are the pulled changes, which the peer already has
+            caught_up = not more_local and _last_seq(database) == latest
+            merged = database.merge_changes(response["changes"])
+            if caught_up:
+                pushing = _last_seq(database)
+            database.write_query(
+                """
+                UPDATE sync_state SET pulled = ?, pushed = ?
+                WHERE peer = ?
+                """,
+                (response["seq"], pushing, url),
+            )
+        report["pushed"] += len(changes)
+        report["pulled"] += len(response["changes"])
+        for key in ("applied", "stale", "renamed", "conflicts"):
+            report[key] += merged[key]
+        if not more_local and not response["more"]:
+            return report
+
+
+def post_json(
+    url: str,
+    payload: dict,
+    timeout: float = 30.0,
+    token: Optional[str] = None,
+) -> dict:
+    """POST payload to url as JSON, with token if any, and return reply."""
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode(),
+        headers=headers,
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.load(response)
+
+
+def _last_seq(database: TimeblockDB) -> int:
+    """Return seq of the latest event in database."""
+    return database.read_query(f"SELECT {LAST_EVENT_SEQ}")[0][0]
@@ -3,20 +3,155 @@ Module for handling requests to the web server.
 
 Constants:
     ROUTES - Blueprint object for registering URL routes with application.
+    ADMIN - Blueprint object for the '/admin' routes.
 
 The following functions are defined:
     index_get - Handles GET requests to root path.
-        Returns rendered HTML template.
+        Returns streamed HTML template.
     index_post - Handles POST requests to root.
         Inserts form data into database.
+    cache_stats - Handles GET requests to /admin/cache.
+        Returns JSON counters of the action cache.
+    tenant_stats - Handles GET requests to /admin/tenants.
+        Returns JSON action counts for every tenant database.
+    profile_list - Handles GET requests to /admin/profiles.
+        Returns JSON summaries of the slowest profiled requests.
+    rate_limit_stats - Handles GET requests to /admin/ratelimit.
+        Returns JSON limits and counters of the rate limiter.
+    timer_get - Handles GET requests to /timer.
+        Returns JSON selected action and running time of the timer.
+    timer_post - Handles POST requests to /timer.
+        Starts, stops or switches the timer.
+    events - Handles GET requests to /events.
+        Streams changes to actions as Server-Sent Events.
+    maintenance_get - Handles GET requests to /admin/maintenance.
+        Returns JSON size and fragmentation of the database file.
+    maintenance_post - Handles POST requests to /admin/maintenance.
+        Backs up or compacts the database file.
+    simulate_post - Handles POST requests to /simulate.
+        Returns JSON of the best candidate schedules of actions.
+    sync_post - Handles POST requests to /sync.
+        Merges changes from another instance and returns its own.
+
+When the app is configured with a ShardRouter under "SHARDS", ROUTES is
+also registered under the prefix '/t/<tenant>', and requests there use
+the tenant's own database. ADMIN is only registered at the root, as its
+routes can see every tenant; the maintenance routes take a 'tenant'
+parameter instead. The ADMIN routes are only served when the app has an
+ADMIN_TOKEN, to requests that send it.
 """
-from flask import render_template, request, redirect, Blueprint, current_app
+import hmac
+import os
+import sqlite3
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import ContextManager, Optional
+
+from flask import (
+    stream_template,
+    request,
+    redirect,
+    Blueprint,
+    current_app,
+    jsonify,
+    g,
+    abort,
+    stream_with_context,
+)
 from werkzeug.wrappers.response import Response
 
-from timeblock import sql
+from timeblock import maintenance, sql
 from timeblock.action import Action
+from timeblock.compress import buffered
+from timeblock.shard import TENANT_PATTERN
+from timeblock.simulate import Problem
+from timeblock.sync import respond
 
 ROUTES = Blueprint("routes", __name__)
+ADMIN = Blueprint("admin", __name__, url_prefix="/admin")
+
+
+@ROUTES.url_value_preprocessor
+def pull_tenant(_endpoint, values) -> None:
+    """Move tenant from the URL prefix to 'g', out of the view arguments."""
+    g.tenant = values.pop("tenant", None) if values else None
+    if g.tenant is not None and not TENANT_PATTERN.match(g.tenant):
+        abort(404)
+
+
+def _database() -> ContextManager[sql.TimeblockDB]:
+    """Return TimeblockDB for the requested tenant, or the app's database."""
+    tenant = g.get("tenant")
+    if tenant is not None:
+        return current_app.config["SHARDS"].connect(tenant)
+    return sql.TimeblockDB(
+        current_app.config["DATABASE"],
+        cache=current_app.config.get("ACTION_CACHE"),
+        broadcaster=current_app.config.get("BROADCASTER"),
+        graph=current_app.config.get("DEPENDENCY_GRAPH"),
+    )
+
+
+def _database_file() -> str:
+    """Return database file, also the broadcast channel, for this request."""
+    tenant = g.get("tenant")
+    if tenant is not None:
+        return current_app.config["SHARDS"].path(tenant)
+    return current_app.config["DATABASE"]
+
+
+def _require_token(key: str) -> None:
+    """
+    Abort unless the request sends the token set in config[key].
+
+    The token is sent in an 'Authorization: Bearer <token>' header.
+
+    Args:
+        key (str): Config key of the token, e.g. "SYNC_TOKEN".
+
+    Raises:
+        NotFound: If no token is configured, so the route is disabled.
+        Unauthorized: If the request doesn't send the token.
+    """
+    token = current_app.config.get(key)
+    if not token:
+        abort(404)
+    sent = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(sent.encode(), f"Bearer {token}".encode()):
+        abort(
+            Response(
+                "Missing or wrong token",
+                status=401,
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        )
+
+
+@ADMIN.before_request
+def check_admin_token() -> None:
+    """Refuse admin requests without the app's ADMIN_TOKEN."""
+    _require_token("ADMIN_TOKEN")
+
+
+def _admin_tenant() -> None:
+    """Move the 'tenant' parameter of an admin request to 'g'."""
+    tenant = request.values.get("tenant")
+    if tenant is not None and (
+        "SHARDS" not in current_app.config or not TENANT_PATTERN.match(tenant)
+    ):
+        abort(404)
+    g.tenant = tenant
+
+
+def _last_event_id() -> Optional[int]:
+    """Return id of the last event the client has seen, if it sent one."""
+    value = request.headers.get("Last-Event-ID") or request.args.get(
+        "last_event_id"
+    )
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
 
 
 @ROUTES.route("/", methods=["POST"])
@@ -32,25 +167,368 @@ def index_post() -> Response:
     action = request.form["action"]
     action_obj = Action(action)
 
-    with sql.TimeblockDB(current_app.config["DATABASE"]) as database:
+    with _database() as database:
         database.add_action(action_obj)
-    return redirect("/")
+    return redirect(request.path)
 
 
 @ROUTES.route("/", methods=["GET"])
-def index_get() -> str:
+def index_get() -> Response:
     """
     Handle GET requests to root path.
 
-    Checks database for actions and renders template with them.
+    Checks database for actions and streams the template rendered with
+    them, so the page starts arriving before every action is rendered.
 
     Returns:
-        str: Rendered HTML template for the main page.
+        Response: Streamed HTML of the main page.
+    """
+    # read the event id first, so changes made while the actions are
+    # read are replayed to the page rather than lost
+    broadcaster = current_app.config.get("BROADCASTER")
+    last_event_id = broadcaster.last_id() if broadcaster else None
+    with _database() as database:
+        actions = database.get_actions()
+
+    context: dict = {"actions": actions, "last_event_id": last_event_id}
+    stream = stream_template("actions.html", **context)
+    return Response(buffered(stream), mimetype="text/html")
+
+
+@ADMIN.route("/cache", methods=["GET"])
+def cache_stats() -> Response:
     """
-    with sql.TimeblockDB(current_app.config["DATABASE"]) as database:
-        actions = database.read_query("SELECT * FROM action")
+    Handle GET requests to /admin/cache.
 
-    context: dict = {
-        "actions": [Action.from_tuple(action) for action in actions]
-    }
-    return render_template("actions.html", actions=context["actions"])
+    Returns:
+        Response: JSON with size and hit/miss/eviction counters of the
+            action cache, or an empty object if caching is disabled.
+    """
+    cache = current_app.config.get("ACTION_CACHE")
+    return jsonify(cache.stats() if cache else {})
+
+
+@ADMIN.route("/tenants", methods=["GET"])
+def tenant_stats() -> Response:
+    """
+    Handle GET requests to /admin/tenants.
+
+    Returns:
+        Response: JSON mapping each tenant to its number of actions,
+            or an empty object if the app isn't sharded.
+    """
+    router = current_app.config.get("SHARDS")
+    if router is None:
+        return jsonify({})
+    counts = router.admin_query("SELECT COUNT(*) FROM {shard}.action")
+    return jsonify(dict(counts))
+
+
+@ADMIN.route("/profiles", methods=["GET"])
+def profile_list() -> Response:
+    """
+    Handle GET requests to /admin/profiles.
+
+    The 'limit' query parameter sets how many profiles are listed,
+    20 by default.
+
+    Returns:
+        Response: JSON list of profile summaries, slowest first, or an
+            empty list if profiling is disabled.
+    """
+    profiler = current_app.config.get("PROFILER")
+    limit = request.args.get("limit", 20, type=int)
+    return jsonify(profiler.profiles(limit) if profiler else [])
+
+
+@ADMIN.route("/ratelimit", methods=["GET"])
+def rate_limit_stats() -> Response:
+    """
+    Handle GET requests to /admin/ratelimit.
+
+    Returns:
+        Response: JSON limits and counters of the rate limiter, or an
+            empty object if writes aren't limited.
+    """
+    limiter = current_app.config.get("RATE_LIMITER")
+    return jsonify(limiter.stats() if limiter else {})
+
+
+@ROUTES.route("/timer", methods=["GET"])
+def timer_get() -> Response:
+    """
+    Handle GET requests to /timer.
+
+    The running time is worked out from the start time stored in the
+    database, so every worker process reports the same timer.
+
+    Returns:
+        Response: JSON with the selected action id, whether the timer is
+            running and the seconds it has been running for.
+    """
+    with _database() as database:
+        selected = database.selected()
+        timer = database.running_timer()
+    return jsonify(
+        {
+            "selected": selected,
+            "running": timer is not None,
+            "elapsed": timer[1].check().total_seconds() if timer else None,
+        }
+    )
+
+
+@ROUTES.route("/timer", methods=["POST"])
+def timer_post() -> Response:
+    """
+    Handle POST requests to /timer.
+
+    The 'task' form field selects what to do:
+        start - Start timing action 'id', unless a timer is running.
+        stop - Stop the timer and add its time to the action.
+        switch - Stop any running timer and start timing action 'id'.
+
+    Returns:
+        Response: JSON with the recorded seconds, if any; 409 if the
+            timer is already running or stopped, 404 for an unknown
+            action and 400 for an unknown task.
+    """
+    task = request.form.get("task")
+    action_id = request.form.get("id", type=int)
+    with _database() as database:
+        if task == "stop":
+            elapsed = database.stop_timer()
+            if elapsed is None:
+                return Response("No timer is running", status=409)
+            return jsonify({"elapsed": elapsed.total_seconds()})
+        if task not in ("start", "switch"):
+            return Response("Unknown task, use start, stop or switch", 400)
+        if action_id is None or database.get_action(action_id) is None:
+            abort(404)
+        if task == "start":
+            if not database.start_timer(action_id):
+                return Response("A timer is already running", status=409)
+            return jsonify({"elapsed": None})
+        try:
+            elapsed = database.switch_timer(action_id)
+        except sql.TimerError:
+            return Response("A timer is already running", status=409)
+    return jsonify({"elapsed": elapsed.total_seconds() if elapsed else None})
+
+
+@ROUTES.route("/events", methods=["GET"])
+def events() -> Response:
+    """
+    Handle GET requests to /events.
+
+    Streams inserts, updates and deletes of actions as Server-Sent Events.
+    Clients resume from the Last-Event-ID header, or the 'last_event_id'
+    query parameter on their first connection. Waiting clients don't
+    query the database.
+
+    Returns:
+        Response: text/event-stream response, or 404 if the app has no
+            broadcaster.
+    """
+    broadcaster = current_app.config.get("BROADCASTER")
+    if broadcaster is None:
+        abort(404)
+    last_id = _last_event_id()
+    if last_id is None:
+        last_id = broadcaster.last_id()
+    stream = broadcaster.stream(_database_file(), last_id)
+    return Response(
+        stream_with_context(stream),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@ADMIN.route("/maintenance", methods=["GET"])
+def maintenance_get() -> Response:
+    """
+    Handle GET requests to /admin/maintenance.
+
+    The 'tenant' query parameter selects a tenant's database file.
+
+    Returns:
+        Response: JSON with size and fragmentation of the database file,
+            and the report of the latest scheduled run, if any.
+    """
+    _admin_tenant()
+    scheduler = current_app.config.get("MAINTENANCE")
+    last_report = scheduler.last_report if scheduler else None
+    if last_report and g.tenant is not None:
+        last_report = last_report.get("shards", {}).get(g.tenant)
+    with _database():
+        pass  # creates the database file if it doesn't exist yet
+    return jsonify(
+        {
+            "stats": maintenance.file_stats(_database_file()),
+            "last_report": last_report,
+        }
+    )
+
+
+@ADMIN.route("/maintenance", methods=["POST"])
+def maintenance_post() -> Response:
+    """
+    Handle POST requests to /admin/maintenance.
+
+    The 'task' form field selects what to run:
+        backup - Snapshot the database into SNAPSHOT_DIRECTORY, or its
+            SHARD_SNAPSHOTS subdirectory for a tenant.
+        compact - Free unused pages and optimize the database.
+    The 'tenant' field selects a tenant's database file.
+
+    Returns:
+        Response: JSON report of the task, 400 for an unknown task, or
+            503 if the task failed, e.g. because the database was busy.
+    """
+    _admin_tenant()
+    task = request.form.get("task")
+    filename = _database_file()
+    with _database():
+        pass  # creates the database file if it doesn't exist yet
+    try:
+        if task == "backup":
+            directory = (
+                current_app.config.get("SNAPSHOT_DIRECTORY") or "backups"
+            )
+            if g.tenant is not None:
+                directory = os.path.join(
+                    directory, maintenance.SHARD_SNAPSHOTS
+                )
+            return jsonify(maintenance.snapshot(filename, directory))
+        if task == "compact":
+            return jsonify(maintenance.compact(filename))
+    except sqlite3.Error as error:
+        return Response(f"Maintenance failed: {error}", status=503)
+    return Response("Unknown task, use 'backup' or 'compact'", status=400)
+
+
+@ROUTES.route("/simulate", methods=["POST"])
+def simulate_post() -> Response:
+    """
+    Handle POST requests to /simulate.
+
+    The JSON body may set:
+        ids - Actions to arrange, every unscheduled action by default.
+        start - ISO datetime the schedules start at, now by default.
+        deadlines - Object of action id to ISO datetime.
+        weights - Object of action id to importance, 1 by default.
+        hours_per_day - Working hours from the start of each day.
+        candidates - Schedules to try, at most SIMULATE_MAX_CANDIDATES.
+        top - Schedules to return, 5 by default.
+        timeout - Seconds to try for, at most SIMULATE_TIMEOUT.
+
+    Actions without an estimate take sql.DEFAULT_BLOCK, and the
+    dependencies between the actions are respected.
+
+    Returns:
+        Response: JSON with the best "schedules", each with its "score",
+            action ids in "order" and ISO "starts", and how many
+            candidates were scored; 400 for an invalid body, 404 for
+            an unknown action and 503 if the worker processes failed.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return Response("Expected a JSON object", status=400)
+    config = current_app.config
+    try:
+        start = (
+            datetime.fromisoformat(body["start"])
+            if body.get("start")
+            else datetime.now().replace(second=0, microsecond=0)
+        )
+        deadlines = {
+            int(action_id): datetime.fromisoformat(value)
+            for action_id, value in body.get("deadlines", {}).items()
+        }
+        weights = {
+            int(action_id): float(value)
+            for action_id, value in body.get("weights", {}).items()
+        }
+        candidates = min(
+            int(body.get("candidates", 1000)),
+            config["SIMULATE_MAX_CANDIDATES"],
+        )
+        top = int(body.get("top", 5))
+        if candidates < 1 or top < 1:
+            raise ValueError("candidates and top must be at least 1")
+        timeout = min(
+            float(body.get("timeout", config["SIMULATE_TIMEOUT"])),
+            config["SIMULATE_TIMEOUT"],
+        )
+        wanted = [int(action_id) for action_id in body.get("ids", [])]
+    except (AttributeError, TypeError, ValueError) as error:
+        return Response(f"Invalid simulation: {error}", status=400)
+
+    with _database() as database:
+        actions: dict[int, Action] = {}
+        for action in database.get_actions():
+            if action.id is None:  # stored actions always have an id
+                return Response("Found an action without an id", status=500)
+            actions[action.id] = action
+        if any(action_id not in actions for action_id in wanted):
+            abort(404)
+        ids = wanted or [
+            action_id
+            for action_id, action in actions.items()
+            if action.start is None
+        ]
+        graph = database.dependency_graph()
+        with graph.lock:
+            edges = graph.edges(ids)
+    try:
+        offsets = {
+            action_id: (deadline - start).total_seconds()
+            for action_id, deadline in deadlines.items()
+        }
+        problem = Problem(
+            ids,
+            [
+                (actions[i].est_duration or sql.DEFAULT_BLOCK).total_seconds()
+                for i in ids
+            ],
+            edges,
+            deadlines=[offsets.get(i) for i in ids],
+            weights=[weights.get(i, 1.0) for i in ids],
+            hours_per_day=body.get("hours_per_day"),
+        )
+        result = config["SIMULATOR"].run(problem, candidates, top, timeout)
+    except (TypeError, ValueError) as error:
+        return Response(f"Invalid simulation: {error}", status=400)
+    except BrokenProcessPool:
+        return Response("Simulation workers failed, try again", status=503)
+    for schedule in result["schedules"]:
+        schedule["starts"] = [
+            (start + timedelta(seconds=seconds)).isoformat()
+            for seconds in schedule["starts"]
+        ]
+    return jsonify(result)
+
+
+@ROUTES.route("/sync", methods=["POST"])
+def sync_post() -> Response:
+    """
+    Handle POST requests to /sync.
+
+    The JSON body has the changes of another instance and the seq of
+    this one it has seen; see timeblock.sync. Only served when the app
+    has a SYNC_TOKEN, to requests that send it.
+
+    Returns:
+        Response: JSON with the changes of this instance after that seq,
+            400 for an invalid body, 401 without the token and 404 if
+            sync isn't enabled.
+    """
+    _require_token("SYNC_TOKEN")
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return Response("Expected a JSON object", status=400)
+    with _database() as database:
+        try:
+            return jsonify(respond(database, body))
+        except (TypeError, ValueError) as error:
+            return Response(f"Invalid sync: {error}", status=400)